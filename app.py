@@ -1,54 +1,92 @@
-import secrets
-
 import os
-
-from datetime import date
+import threading
+import time
 
 from flask import (
+    before_render_template,
     flash,
     Flask,
     g,
+    jsonify,
     make_response,
     redirect,
     render_template,
     Response,
     request,
     session,
+    stream_with_context,
+    template_rendered,
     url_for,
 )
 from functools import wraps
-import markdown2
-from typing import Callable, TypeVar, Any, Tuple, List, Dict, Union, Optional
-
-from macro_mojo.utils import (
-    error_for_date_format,
-    error_for_nutrition_entry,
-    error_for_meal_len,
-    error_for_targets,
-    get_todays_date,
-    is_date_in_url_valid,
-    is_nutrition_id_valid,
+import logging
+from typing import (
+    Callable,
+    TypeVar,
+    Any,
+    Iterator,
+    Tuple,
+    Union,
+    Optional,
 )
 
-from macro_mojo.ai_agent import get_ai_response, get_ai_welcome_message
+from macro_mojo.utils import is_date_in_url_valid, is_entry_id_in_url_valid
+
+from macro_mojo import instrumentation, views
+from macro_mojo.ai_agent import (
+    dump_memory,
+    get_ai_response,
+    load_memory,
+    stream_ai_response,
+)
+from macro_mojo.chat_history import Chat, new_chat_id, sse_event
+from macro_mojo.exporter import FORMATS, export_chunks, export_filename
+from macro_mojo.importer import detect_format, import_file
+from macro_mojo.pagination import PER_PAGE
 
 from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.db_pool import ConnectionPool, ReplicaPools
+from macro_mojo.passwords import PasswordVerifier, VerifierBusy
+
+from config import Config
 
 F = TypeVar("F", bound=Callable[..., Any])
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)
+app.config.from_object(Config)
+app.secret_key = views.secret_key(app.config, os.environ.get("FLASK_ENV"))
+
+instrumentation.configure_logging(app.config["LOG_LEVEL"])
+instrumentation.configure(
+    slow_query_ms=app.config["SLOW_QUERY_MS"],
+    sample_rate=app.config["QUERY_LOG_SAMPLE_RATE"],
+)
+
+_db_pool_lock = threading.Lock()
+access_logger = logging.getLogger("macro_mojo.access")
+
 
+app.add_template_filter(views.render_markdown, "markdown")
 
-@app.template_filter("markdown")
-def markdown_filter(text: str) -> str:
-    return markdown2.markdown(text, extras=["break-on-newline"])
+
+def render_page(page: views.Page) -> str:
+    return render_template(page.template, **page.context)
 
 
 def user_logged_in() -> bool:
     return "username" in session
 
 
+def current_user_id() -> Optional[int]:
+    user_id = session.get("user_id")
+    if user_id is None and user_logged_in():
+        # Cold session: logged in before `user_id` was stored in the session
+        user_id = g.storage.find_user_id(session["username"])
+        if user_id is not None:
+            session["user_id"] = user_id
+    return user_id
+
+
 def check_login(func: F) -> F:
     @wraps(func)
     def decorated_function(*args: Any, **kwargs: Any) -> Any:
@@ -56,37 +94,147 @@ def check_login(func: F) -> F:
             flash("You must be logged in to complete the action.")
             return redirect(url_for("display_login_page", next=request.url))
 
+        g.user_id = current_user_id()
+        if g.user_id is None:
+            # The session refers to a user that no longer exists
+            session.clear()
+            flash("You must be logged in to complete the action.")
+            return redirect(url_for("display_login_page", next=request.url))
+
         return func(*args, **kwargs)
 
     return decorated_function  # type: ignore[return-value]
 
 
-def _paginate(
-    data: List[Dict[str, Any]], page_str: Optional[str]
-) -> Union[Tuple[int, int, int, int], bool]:
-    if page_str is None:
-        page_str = "1"
+def get_db_pool() -> ConnectionPool:
+    """
+    Return the app's connection pool, creating it on first use. The pool is
+    created lazily so that each gunicorn worker builds its own after fork.
+    """
+    pool = app.extensions.get("db_pool")
+    if pool is None:
+        with _db_pool_lock:
+            pool = app.extensions.get("db_pool")
+            if pool is None:
+                dsn = app.config.get("DATABASE_URL") or os.environ.get(
+                    "DATABASE_URL"
+                )
+                pool = ConnectionPool(
+                    dsn=dsn,
+                    min_size=app.config["DB_POOL_MIN_SIZE"],
+                    max_size=app.config["DB_POOL_MAX_SIZE"],
+                    timeout=app.config["DB_POOL_TIMEOUT"],
+                )
+                app.extensions["db_pool"] = pool
+    return pool
+
+
+def get_replica_pools() -> Optional[ReplicaPools]:
+    """
+    Return the pools for `DATABASE_REPLICA_URLS`, created on first use like
+    `get_db_pool`, or `None` if no replicas are configured.
+    """
+    if not app.config["DATABASE_REPLICA_URLS"]:
+        return None
+    replicas = app.extensions.get("db_replica_pools")
+    if replicas is None:
+        with _db_pool_lock:
+            replicas = app.extensions.get("db_replica_pools")
+            if replicas is None:
+                replicas = ReplicaPools(
+                    app.config["DATABASE_REPLICA_URLS"],
+                    min_size=app.config["DB_POOL_MIN_SIZE"],
+                    max_size=app.config["DB_POOL_MAX_SIZE"],
+                    timeout=app.config["DB_POOL_TIMEOUT"],
+                    max_lag=app.config["REPLICA_MAX_LAG"],
+                    check_interval=app.config["REPLICA_CHECK_INTERVAL"],
+                    retry_after=app.config["REPLICA_RETRY_AFTER"],
+                )
+                app.extensions["db_replica_pools"] = replicas
+    return replicas
+
+
+def get_password_verifier() -> Optional[PasswordVerifier]:
+    """
+    Return the process pool for password checks, created on first use like
+    `get_db_pool`, or `None` if `PASSWORD_WORKERS` is 0.
+    """
+    if not app.config["PASSWORD_WORKERS"]:
+        return None
+    verifier = app.extensions.get("password_verifier")
+    if verifier is None:
+        with _db_pool_lock:
+            verifier = app.extensions.get("password_verifier")
+            if verifier is None:
+                verifier = views.password_verifier(app.config)
+                app.extensions["password_verifier"] = verifier
+    return verifier
+
+
+@app.before_request
+def load_db() -> None:
+    g.storage = DatabasePersistence(
+        pool=get_db_pool(),
+        replicas=get_replica_pools(),
+        read_from_primary=session.get("read_primary_until", 0) > time.time(),
+        verifier=get_password_verifier(),
+    )
 
-    try:
-        page = int(page_str)
-    except ValueError:
-        return False
 
-    per_page = 5
-    start = (page - 1) * per_page
-    end = start + per_page
-    total_pages = (len(data) + per_page - 1) // per_page
+# Read-your-writes: a replica may not have a write yet when the redirect
+# after it is served, so the user's reads stay on the primary for
+# `READ_YOUR_WRITES_SECONDS`. The deadline is kept in the session rather than
+# in the process, as the next request may reach another worker.
+def keep_reads_on_primary(response: Response) -> Response:
+    storage = g.get("storage")
+    if storage is not None and storage.wrote:
+        session["read_primary_until"] = (
+            time.time() + app.config["READ_YOUR_WRITES_SECONDS"]
+        )
+    return response
 
-    if page not in range(1, total_pages + 1):
-        return False
 
-    return (page, start, end, total_pages)
+if app.config["DATABASE_REPLICA_URLS"]:
+    app.after_request(keep_reads_on_primary)
 
 
-@app.before_request
-def load_db() -> None:
-    dsn = app.config.get("DATABASE_URL") or os.environ.get("DATABASE_URL")
-    g.storage = DatabasePersistence(dsn=dsn)
+# Request timing: time in the database (from `instrumentation`), bcrypt,
+# the LLM, template rendering and `markdown_filter` (which runs inside
+# template rendering), sent as a `Server-Timing` header and logged as one
+# JSON line per request. With `REQUEST_TIMING` off these hooks aren't
+# registered and nothing is timed.
+def start_request_timing() -> None:
+    instrumentation.start_request()
+
+
+def start_template_timing(sender: Flask, **extra: Any) -> None:
+    instrumentation.start_phase("template")
+
+
+def end_template_timing(sender: Flask, **extra: Any) -> None:
+    instrumentation.end_phase("template")
+
+
+def add_server_timing(response: Response) -> Response:
+    # Queries of a streamed response run after this and aren't included
+    totals = instrumentation.request_totals()
+    if totals is not None:
+        response.headers["Server-Timing"] = instrumentation.server_timing(
+            totals
+        )
+        access_logger.info(
+            instrumentation.access_log_line(
+                request.method, request.path, response.status_code, totals
+            )
+        )
+    return response
+
+
+if app.config["REQUEST_TIMING"]:
+    app.before_request(start_request_timing)
+    before_render_template.connect(start_template_timing, app)
+    template_rendered.connect(end_template_timing, app)
+    app.after_request(add_server_timing)
 
 
 @app.route("/favicon.ico/")
@@ -110,8 +258,16 @@ def process_login() -> Union[Response, Tuple[str, int]]:
     password = request.form["pwd"]
     next_url = request.form["next"]
 
-    if g.storage.find_login(username, password):
+    try:
+        user_id = g.storage.find_login(username, password)
+    except VerifierBusy:
+        flash("Too many people are logging in right now. Try again shortly.")
+        response = make_response(render_template("login.html"), 503)
+        response.headers["Retry-After"] = "1"
+        return response
+    if user_id is not None:
         session["username"] = username
+        session["user_id"] = user_id
         session.permanent = True
         flash("Log in successful!")
         if next_url:
@@ -124,6 +280,9 @@ def process_login() -> Union[Response, Tuple[str, int]]:
 
 @app.route("/logout", methods=["POST"])
 def logout() -> Response:
+    # The chat can't be reached without the session, so it goes with it
+    if "chat_id" in session and session.get("user_id") is not None:
+        g.storage.delete_chat_history(session["chat_id"], session["user_id"])
     session.clear()
     flash("You have been logged out.")
     return redirect(url_for("index"))
@@ -132,177 +291,151 @@ def logout() -> Response:
 @app.route("/<username>/")
 @check_login
 def user_overview(username: str) -> str:
-    user_targets = g.storage.get_user_targets(username)
-    user_nutrition = g.storage.get_user_all_nutrition(username)
-    today = date.today()
-
-    # Pagination
-    page_str = request.args.get("page")
-    pagination_params = _paginate(user_nutrition, page_str)
-    if not pagination_params:
-        return render_template("bad_url.html", username=username)
-
-    page, start, end, total_pages = pagination_params
-    user_nutrition_on_page = user_nutrition[start:end]
-    return render_template(
-        "dashboard.html",
-        username=username,
-        user_targets=user_targets,
-        user_nutrition_on_page=user_nutrition_on_page,
-        total_pages=total_pages,
-        page=page,
-        date=today,
+    requested_page = views.dashboard_cursor(request.args)
+    if not requested_page:
+        return render_page(views.bad_url(username))
+
+    page, before, after = requested_page
+    user_targets = g.storage.get_user_targets(g.user_id)
+    daily_totals_page = g.storage.get_daily_totals_page(
+        g.user_id, before, after, PER_PAGE
+    )
+    return render_page(
+        views.dashboard_page(username, page, user_targets, daily_totals_page)
     )
 
 
 @app.route("/<username>/<date>")
 @check_login
 def day_view(username: str, date: str) -> str:
-    if not is_date_in_url_valid(date):
-        return render_template("bad_url.html", username=username)
-
-    daily_total = g.storage.daily_total_nutrition(username, date)
-    nutrition_left = g.storage.get_nutrition_left(username, date)
-    daily_nutrition = g.storage.get_daily_nutrition(username, date)
-    if not daily_nutrition:
-        return render_template("empty_day.html", date=date, username=username)
-
-    page_str = request.args.get("page")
-    pagination_params = _paginate(daily_nutrition, page_str)
-    if not pagination_params:
-        return render_template("bad_url.html", username=username)
-
-    page, start, end, total_pages = pagination_params
-    daily_nutrition_entries_on_page = daily_nutrition[start:end]
-    return render_template(
-        "day_view.html",
-        username=username,
-        daily_nutrition_entries_on_page=daily_nutrition_entries_on_page,
-        total_pages=total_pages,
-        page=page,
-        date=date,
-        daily_total=daily_total,
-        nutrition_left=nutrition_left,
+    requested_page = views.day_view_cursor(request.args)
+    if not is_date_in_url_valid(date) or not requested_page:
+        return render_page(views.bad_url(username))
+
+    page, before, after = requested_page
+    # Totals, nutrition left and the requested page of entries in one query
+    day_snapshot = g.storage.get_day_snapshot(
+        g.user_id, date, before, after, PER_PAGE
     )
+    return render_page(views.day_view_page(username, date, page, day_snapshot))
 
 
 @app.route("/<username>/<date>/add_new")
 @check_login
 def new_nutrition_entry(username: str, date: str) -> str:
     if not is_date_in_url_valid(date):
-        return render_template("bad_url.html", username=username)
-    return render_template(
-        "add_nutrition_entry.html",
-        username=username,
-        date=date,
-        input_nutrition={},
-        today=get_todays_date(),
-    )
+        return render_page(views.bad_url(username))
+    return render_page(views.new_entry_page(username, date))
 
 
 @app.route("/<username>/<date>/add_new", methods=["POST"])
 @check_login
 def add_nutrition_entry(username: str, date: str) -> Union[str, Response]:
     if not is_date_in_url_valid(date):
-        return render_template("bad_url.html", username=username)
-    # Extract entered data
+        return render_page(views.bad_url(username))
     entry_date = request.form["entry_date"]
-    calories = request.form["calories"]
-    protein = request.form["protein"]
-    fat = request.form["fat"]
-    carbs = request.form["carbs"]
-    meal = request.form["meal"]
-
-    # Validate inputs, display errors and re-display template with input values
-    errors = []
-    error_date = error_for_date_format(entry_date)
-    if error_date:
-        errors.append(error_date)
-    error_nutrition = error_for_nutrition_entry(calories, protein, fat, carbs)
-    if error_nutrition:
-        errors.append(error_nutrition)
-    error_meal = error_for_meal_len(meal)
-    if error_meal:
-        errors.append(error_meal)
+    nutrition = views.nutrition_form(request.form)
 
+    # Display errors and re-display the form with the values entered
+    errors = views.errors_for_nutrition_form(nutrition, entry_date)
     if errors:
         for error in errors:
             flash(error)
-        input_nutrition = {
-            "calories": calories,
-            "protein": protein,
-            "fat": fat,
-            "carbs": carbs,
-            "meal": meal,
-        }
-        return render_template(
-            "add_nutrition_entry.html",
-            username=username,
-            date=entry_date,
-            input_nutrition=input_nutrition,
+        return render_page(
+            views.invalid_new_entry_page(username, entry_date, nutrition)
         )
 
-    # Execute queries to add data
-    g.storage.add_nutrition_entry(
-        entry_date, username, calories, protein, fat, carbs, meal
-    )
+    g.storage.add_nutrition_entry(g.user_id, entry_date, *nutrition.values())
     flash("New data entry added!")
     return redirect(url_for("day_view", username=username, date=entry_date))
 
 
+@app.route("/<username>/entries/batch", methods=["POST"])
+@check_login
+def add_nutrition_entries(username: str) -> Tuple[Response, int]:
+    """
+    Add a batch of entries from a JSON body (see `views.batch_request`) in
+    one transaction.
+    """
+    batch = views.batch_request(
+        request.get_json(silent=True), app.config["BATCH_MAX_ENTRIES"]
+    )
+    if batch.errors:
+        return jsonify(errors=batch.errors), batch.status
+
+    added = g.storage.add_nutrition_entries(g.user_id, batch.rows)
+    return jsonify(added=added), batch.status
+
+
+@app.route("/<username>/import")
+@check_login
+def display_import(username: str) -> str:
+    return render_template("import.html", username=username, report=None)
+
+
+@app.route("/<username>/import", methods=["POST"])
+@check_login
+def import_nutrition_history(username: str) -> Union[str, Tuple[str, int]]:
+    upload = request.files.get("file")
+    file_format = upload and detect_format(upload.filename or "")
+    if not file_format:
+        flash("Choose a .csv, .json, .jsonl or .ndjson file to import.")
+        return render_template("import.html", username=username), 422
+
+    # The upload is read and copied to the database row by row
+    report = import_file(g.storage, g.user_id, upload.stream, file_format)
+    flash(f"Imported {report.rows_imported} of {report.rows_read} entries.")
+    return render_template("import.html", username=username, report=report)
+
+
+@app.route("/<username>/export")
+@check_login
+def export_nutrition_history(username: str) -> Union[str, Response]:
+    export = views.export_request(request.args)
+    if export is None:
+        return render_page(views.bad_url(username))
+
+    data, file_format = export
+    # Rows are sent as they are read from the database; nothing runs until
+    # the response starts streaming
+    chunks = export_chunks(g.storage, g.user_id, data, file_format)
+    response = Response(
+        stream_with_context(chunks), mimetype=FORMATS[file_format]
+    )
+    response.headers.set(
+        "Content-Disposition",
+        "attachment",
+        filename=export_filename(username, data, file_format),
+    )
+    return response
+
+
 @app.route("/<username>/targets")
 @check_login
 def display_targets(username: str) -> str:
-    user_targets = g.storage.get_user_targets(username)
-    return render_template(
-        "targets.html", username=username, user_targets=user_targets
-    )
+    user_targets = g.storage.get_user_targets(g.user_id)
+    return render_page(views.targets_page(username, user_targets))
 
 
 @app.route("/<username>/targets/edit")
 @check_login
 def edit_targets(username: str) -> str:
-    user_targets = g.storage.get_user_targets(username)
-    return render_template(
-        "edit_targets.html", username=username, user_targets=user_targets
-    )
+    user_targets = g.storage.get_user_targets(g.user_id)
+    return render_page(views.targets_page(username, user_targets, edit=True))
 
 
 @app.route("/<username>/targets/edit", methods=["POST"])
 @check_login
 def update_targets(username: str) -> Union[str, Response]:
-    # Extract new target values from HTTP request
-    new_calorie_target = request.form["calories"]
-    new_protein_target = request.form["protein"]
-    new_fat_target = request.form["fat"]
-    new_carb_target = request.form["carbs"]
-
-    # Validate inputs, display errors and re-display template with input values
-    error = error_for_targets(
-        new_calorie_target, new_protein_target, new_fat_target, new_carb_target
-    )
+    targets = views.targets_form(request.form)
+
+    # Display the error and re-display the form with the values entered
+    error = views.error_for_targets_form(targets)
     if error:
         flash(error)
-        input_user_targets = {
-            "calorie_target": new_calorie_target,
-            "protein_target": new_protein_target,
-            "fat_target": new_fat_target,
-            "carb_target": new_carb_target,
-        }
-        return render_template(
-            "edit_targets.html",
-            username=username,
-            user_targets=input_user_targets,
-        )
-    # Execute SQL queries to update the targets
-    g.storage.update_user_targets(
-        username,
-        new_calorie_target,
-        new_protein_target,
-        new_fat_target,
-        new_carb_target,
-    )
+        return render_page(views.targets_page(username, targets, edit=True))
 
+    g.storage.update_user_targets(g.user_id, *targets.values())
     flash("Targets were updated!")
     return redirect(url_for("display_targets", username=username))
 
@@ -310,23 +443,23 @@ def update_targets(username: str) -> Union[str, Response]:
 @app.route("/<username>/<date>/<int:nutrition_entry_id>/edit")
 @check_login
 def edit_entry(username: str, date: str, nutrition_entry_id: int) -> str:
-    # Validate date part of URL
-    if not is_date_in_url_valid(date):
-        return render_template("bad_url.html", username=username)
-
-    # Validate nutrition id part of URL
-    available_nutrition_ids = g.storage.get_all_nutrition_entries_ids(username)
-    if not is_nutrition_id_valid(nutrition_entry_id, available_nutrition_ids):
-        return render_template("bad_url.html", username=username)
+    if not is_date_in_url_valid(date) or not is_entry_id_in_url_valid(
+        nutrition_entry_id
+    ):
+        return render_page(views.bad_url(username))
+
+    # Validates that the nutrition id in the URL belongs to the user and is
+    # on this date
+    nutrition_data = g.storage.find_nutrition_entry(
+        g.user_id, nutrition_entry_id, date
+    )
+    if nutrition_data is None:
+        return render_page(views.bad_url(username))
 
-    # Get nutrition data to display in `edit_entry` view
-    nutrition_data = g.storage.find_nutrition_entry_by_id(nutrition_entry_id)
-    return render_template(
-        "edit_entry.html",
-        username=username,
-        date=date,
-        nutrition_data=nutrition_data,
-        nutrition_entry_id=nutrition_entry_id,
+    return render_page(
+        views.edit_entry_page(
+            username, date, nutrition_entry_id, nutrition_data
+        )
     )
 
 
@@ -337,52 +470,31 @@ def edit_entry(username: str, date: str, nutrition_entry_id: int) -> str:
 def update_entry(
     username: str, date: str, nutrition_entry_id: int
 ) -> Union[str, Response]:
-    # Validate date part of URL
-    if not is_date_in_url_valid(date):
-        return render_template("bad_url.html", username=username)
-
-    # Validate nutrition id part of URL
-    available_nutrition_ids = g.storage.get_all_nutrition_entries_ids(username)
-    if not is_nutrition_id_valid(nutrition_entry_id, available_nutrition_ids):
-        return render_template("bad_url.html", username=username)
-
-    # Extract new values from HTTP request
-    calories = request.form["calories"]
-    protein = request.form["protein"]
-    fat = request.form["fat"]
-    carbs = request.form["carbs"]
-    meal = request.form["meal"]
-
-    # Validate data. If input not valid, display error and re-display input
-    # values
-    errors = []
-    error_nutrition = error_for_nutrition_entry(calories, protein, fat, carbs)
-    if error_nutrition:
-        errors.append(error_nutrition)
-    error_meal = error_for_meal_len(meal)
-    if error_meal:
-        errors.append(error_meal)
+    if not is_date_in_url_valid(date) or not is_entry_id_in_url_valid(
+        nutrition_entry_id
+    ):
+        return render_page(views.bad_url(username))
+    nutrition = views.nutrition_form(request.form)
+
+    # Display errors and re-display the form with the values entered
+    errors = views.errors_for_nutrition_form(nutrition)
     if errors:
         for error in errors:
             flash(error)
-        input_nutrition = {
-            "calories": calories,
-            "protein": protein,
-            "fat": fat,
-            "carbs": carbs,
-            "meal": meal,
-        }
-        return render_template(
-            "edit_entry.html",
-            username=username,
-            date=date,
-            nutrition_entry_id=nutrition_entry_id,
-            nutrition_data=input_nutrition,
+        return render_page(
+            views.edit_entry_page(
+                username, date, nutrition_entry_id, nutrition
+            )
         )
 
-    g.storage.update_nutrition_entry(
-        nutrition_entry_id, calories, protein, fat, carbs, meal
+    # Validates that the nutrition id in the URL belongs to the user and is
+    # on this date, and updates the entry in one statement
+    updated = g.storage.update_nutrition_entry(
+        g.user_id, nutrition_entry_id, date, *nutrition.values()
     )
+    if not updated:
+        return render_page(views.bad_url(username))
+
     flash("The entry was updated!")
     return redirect(url_for("day_view", username=username, date=date))
 
@@ -394,31 +506,45 @@ def update_entry(
 def delete_entry(
     username: str, date: str, nutrition_entry_id: int
 ) -> Union[str, Response]:
-    # Validate date part of URL
-    if not is_date_in_url_valid(date):
-        return render_template("bad_url.html", username=username)
-
-    # Validate nutrition id part of URL
-    available_nutrition_ids = g.storage.get_all_nutrition_entries_ids(username)
-    if not is_nutrition_id_valid(nutrition_entry_id, available_nutrition_ids):
-        return render_template("bad_url.html", username=username)
+    if not is_date_in_url_valid(date) or not is_entry_id_in_url_valid(
+        nutrition_entry_id
+    ):
+        return render_page(views.bad_url(username))
+
+    # Validates that the nutrition id in the URL belongs to the user and is
+    # on this date, and deletes the entry in one statement
+    deleted = g.storage.delete_nutrition_entry(
+        g.user_id, nutrition_entry_id, date
+    )
+    if not deleted:
+        return render_page(views.bad_url(username))
 
-    g.storage.delete_nutrition_entry(nutrition_entry_id)
     flash("The entry was deleted!")
     return redirect(url_for("day_view", username=username, date=date))
 
 
+# AI chat history is stored server-side; the cookie only carries its id
+def chat_id() -> str:
+    if "chat_id" not in session:
+        session["chat_id"] = new_chat_id()
+    # Sessions from before the history moved out of the cookie
+    session.pop("history", None)
+    return session["chat_id"]
+
+
+def load_chat() -> Chat:
+    return views.with_welcome(
+        g.storage.get_chat_history(
+            chat_id(), g.user_id, app.config["CHAT_HISTORY_TTL"]
+        )
+    )
+
+
 @app.route("/<username>/ai_assistant")
 @check_login
 def chat_with_ai_assistant(username: str) -> str:
-    if "history" not in session or not session["history"]:
-        welcome_message = get_ai_welcome_message()
-        session["history"] = []
-        session["history"].append(
-            {"sender": "ai_agent", "text": welcome_message}
-        )
     return render_template(
-        "ai_help.html", history=session["history"], username=username
+        "ai_help.html", history=load_chat().history, username=username
     )
 
 
@@ -426,18 +552,71 @@ def chat_with_ai_assistant(username: str) -> str:
 @check_login
 def get_response_from_ai_assistant(username: str) -> Response:
     user_message = request.form["message"]
-    session["history"].append({"sender": username, "text": user_message})
-    ai_message = get_ai_response(user_input=user_message)
-    session["history"].append({"sender": "ai_agent", "text": ai_message})
-
-    session.modified = True
+    history, chat_memory = load_chat()
+    history.append({"sender": username, "text": user_message})
+    memory = load_memory(chat_memory)
+    ai_message = get_ai_response(user_input=user_message, memory=memory)
+    history.append({"sender": "ai_agent", "text": ai_message})
+
+    g.storage.save_chat_history(
+        chat_id(),
+        g.user_id,
+        history,
+        dump_memory(memory),
+        app.config["CHAT_HISTORY_MAX_MESSAGES"],
+    )
     return redirect(url_for("chat_with_ai_assistant", username=username))
 
 
+# Streams the answer as Server-Sent Events: a "token" event per chunk of the
+# answer, then "done" with the answer rendered as HTML once the history is
+# saved, or "error". The form posts to `get_response_from_ai_assistant`
+# without JavaScript.
+@app.route("/<username>/ai_assistant/stream", methods=["POST"])
+@check_login
+def stream_response_from_ai_assistant(username: str) -> Response:
+    user_message = request.form["message"]
+    history, chat_memory = load_chat()
+    history.append({"sender": username, "text": user_message})
+    memory = load_memory(chat_memory)
+    # The session can't change once the response has started, and `g` isn't
+    # kept for the stream
+    current_chat_id = chat_id()
+    storage, user_id = g.storage, g.user_id
+
+    def events() -> Iterator[str]:
+        parts = []
+        try:
+            for token in stream_ai_response(user_message, memory):
+                parts.append(token)
+                yield sse_event("token", token)
+        except Exception:
+            # The status line has been sent, so the client hears it here
+            app.logger.exception("AI assistant response failed")
+            yield sse_event("error", "Something went wrong, please try again.")
+            return
+        ai_message = "".join(parts)
+        history.append({"sender": "ai_agent", "text": ai_message})
+        storage.save_chat_history(
+            current_chat_id,
+            user_id,
+            history,
+            dump_memory(memory),
+            app.config["CHAT_HISTORY_MAX_MESSAGES"],
+        )
+        yield sse_event("done", views.render_markdown(ai_message))
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers=views.SSE_HEADERS,
+    )
+
+
 @app.route("/<username>/ai_assistant/clear_history", methods=["POST"])
 @check_login
 def clear_chat_history(username: str) -> Response:
-    session["history"].clear()
+    g.storage.delete_chat_history(chat_id(), g.user_id)
     return redirect(url_for("chat_with_ai_assistant", username=username))
 
 
@@ -0,0 +1,616 @@
+"""
+ASGI version of the app: the routes and templates of `app.py`, served by
+async views on top of `AsyncDatabasePersistence`.
+
+A request waiting on PostgreSQL or the LLM yields to the event loop instead
+of holding a worker, so one process can keep hundreds of slow requests in
+flight. Run it with an ASGI server, e.g.
+
+    uvicorn asgi:app --workers 4
+    hypercorn asgi:app --workers 4
+"""
+
+import os
+
+from quart import (
+    before_render_template,
+    flash,
+    g,
+    jsonify,
+    make_response,
+    Quart,
+    redirect,
+    render_template,
+    Response,
+    request,
+    session,
+    stream_with_context,
+    template_rendered,
+    url_for,
+)
+from functools import wraps
+import logging
+from psycopg_pool import AsyncConnectionPool
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from macro_mojo.utils import is_date_in_url_valid, is_entry_id_in_url_valid
+
+from macro_mojo import instrumentation, views
+from macro_mojo.ai_agent import (
+    aget_ai_response,
+    astream_ai_response,
+    dump_memory,
+    load_memory,
+)
+from macro_mojo.chat_history import Chat, new_chat_id, sse_event
+from macro_mojo.exporter import FORMATS, aexport_chunks, export_filename
+from macro_mojo.importer import aimport_file, detect_format
+from macro_mojo.pagination import PER_PAGE
+
+from macro_mojo.async_db_persistence import AsyncDatabasePersistence
+from macro_mojo.passwords import VerifierBusy
+
+from config import Config
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+access_logger = logging.getLogger("macro_mojo.access")
+
+app = Quart(__name__)
+app.config.from_object(Config)
+app.secret_key = views.secret_key(app.config, os.environ.get("FLASK_ENV"))
+
+instrumentation.configure_logging(app.config["LOG_LEVEL"])
+instrumentation.configure(
+    slow_query_ms=app.config["SLOW_QUERY_MS"],
+    sample_rate=app.config["QUERY_LOG_SAMPLE_RATE"],
+)
+
+
+app.add_template_filter(views.render_markdown, "markdown")
+
+
+async def render_page(page: views.Page) -> str:
+    return await render_template(page.template, **page.context)
+
+
+def user_logged_in() -> bool:
+    return "username" in session
+
+
+async def current_user_id() -> Optional[int]:
+    user_id = session.get("user_id")
+    if user_id is None and user_logged_in():
+        # Cold session: logged in before `user_id` was stored in the session
+        user_id = await g.storage.find_user_id(session["username"])
+        if user_id is not None:
+            session["user_id"] = user_id
+    return user_id
+
+
+def check_login(func: F) -> F:
+    @wraps(func)
+    async def decorated_function(*args: Any, **kwargs: Any) -> Any:
+        if not user_logged_in():
+            await flash("You must be logged in to complete the action.")
+            return redirect(url_for("display_login_page", next=request.url))
+
+        g.user_id = await current_user_id()
+        if g.user_id is None:
+            # The session refers to a user that no longer exists
+            session.clear()
+            await flash("You must be logged in to complete the action.")
+            return redirect(url_for("display_login_page", next=request.url))
+
+        return await func(*args, **kwargs)
+
+    return decorated_function  # type: ignore[return-value]
+
+
+@app.before_serving
+async def open_db_pool() -> None:
+    """
+    Open the connection pool once the server's event loop is running. Each
+    server worker process imports the app and builds its own pool.
+    """
+    dsn = app.config.get("DATABASE_URL") or os.environ.get("DATABASE_URL")
+    pool = AsyncConnectionPool(
+        dsn or "dbname=macro_mojo",
+        min_size=app.config["DB_POOL_MIN_SIZE"],
+        max_size=app.config["DB_POOL_MAX_SIZE"],
+        timeout=app.config["DB_POOL_TIMEOUT"],
+        open=False,
+    )
+    await pool.open()
+    app.extensions["db_pool"] = pool
+
+
+@app.after_serving
+async def close_db_pool() -> None:
+    pool = app.extensions.pop("db_pool", None)
+    if pool is not None:
+        await pool.close()
+
+
+@app.before_serving
+async def start_password_verifier() -> None:
+    # `PASSWORD_WORKERS` of 0 checks passwords in a thread instead
+    verifier = views.password_verifier(app.config)
+    if verifier is not None:
+        app.extensions["password_verifier"] = verifier
+
+
+@app.after_serving
+async def stop_password_verifier() -> None:
+    verifier = app.extensions.pop("password_verifier", None)
+    if verifier is not None:
+        verifier.shutdown()
+
+
+@app.before_request
+async def load_db() -> None:
+    # Without a pool (e.g. in tests) each query opens its own connection
+    g.storage = AsyncDatabasePersistence(
+        pool=app.extensions.get("db_pool"),
+        verifier=app.extensions.get("password_verifier"),
+    )
+
+
+# Request timing, as in `app.py`. The signal receivers are coroutines so
+# Quart doesn't run them in a thread.
+async def start_request_timing() -> None:
+    instrumentation.start_request()
+
+
+async def start_template_timing(sender: Quart, **extra: Any) -> None:
+    instrumentation.start_phase("template")
+
+
+async def end_template_timing(sender: Quart, **extra: Any) -> None:
+    instrumentation.end_phase("template")
+
+
+async def add_server_timing(response: Response) -> Response:
+    totals = instrumentation.request_totals()
+    if totals is not None:
+        response.headers["Server-Timing"] = instrumentation.server_timing(
+            totals
+        )
+        access_logger.info(
+            instrumentation.access_log_line(
+                request.method, request.path, response.status_code, totals
+            )
+        )
+    return response
+
+
+if app.config["REQUEST_TIMING"]:
+    app.before_request(start_request_timing)
+    before_render_template.connect(start_template_timing, app)
+    template_rendered.connect(end_template_timing, app)
+    app.after_request(add_server_timing)
+
+
+@app.route("/favicon.ico/")
+async def favicon() -> Response:
+    return await make_response("", 204)
+
+
+@app.route("/")
+async def index() -> str:
+    return await render_template("index.html")
+
+
+@app.route("/login/")
+async def display_login_page() -> str:
+    return await render_template("login.html")
+
+
+@app.route("/login/", methods=["POST"])
+async def process_login() -> Union[Response, Tuple[str, int]]:
+    form = await request.form
+    username = form["username"]
+    password = form["pwd"]
+    next_url = form["next"]
+
+    try:
+        user_id = await g.storage.find_login(username, password)
+    except VerifierBusy:
+        await flash(
+            "Too many people are logging in right now. Try again shortly."
+        )
+        response = await make_response(
+            await render_template("login.html"), 503
+        )
+        response.headers["Retry-After"] = "1"
+        return response
+    if user_id is not None:
+        session["username"] = username
+        session["user_id"] = user_id
+        session.permanent = True
+        await flash("Log in successful!")
+        if next_url:
+            return redirect(next_url)
+        return redirect(url_for("user_overview", username=username))
+    else:
+        await flash("Invalid credentials. Try again!")
+        return await render_template("login.html"), 422
+
+
+@app.route("/logout", methods=["POST"])
+async def logout() -> Response:
+    # The chat can't be reached without the session, so it goes with it
+    if "chat_id" in session and session.get("user_id") is not None:
+        await g.storage.delete_chat_history(
+            session["chat_id"], session["user_id"]
+        )
+    session.clear()
+    await flash("You have been logged out.")
+    return redirect(url_for("index"))
+
+
+@app.route("/<username>/")
+@check_login
+async def user_overview(username: str) -> str:
+    requested_page = views.dashboard_cursor(request.args)
+    if not requested_page:
+        return await render_page(views.bad_url(username))
+
+    page, before, after = requested_page
+    user_targets = await g.storage.get_user_targets(g.user_id)
+    daily_totals_page = await g.storage.get_daily_totals_page(
+        g.user_id, before, after, PER_PAGE
+    )
+    return await render_page(
+        views.dashboard_page(username, page, user_targets, daily_totals_page)
+    )
+
+
+@app.route("/<username>/<date>")
+@check_login
+async def day_view(username: str, date: str) -> str:
+    requested_page = views.day_view_cursor(request.args)
+    if not is_date_in_url_valid(date) or not requested_page:
+        return await render_page(views.bad_url(username))
+
+    page, before, after = requested_page
+    # Totals, nutrition left and the requested page of entries in one query
+    day_snapshot = await g.storage.get_day_snapshot(
+        g.user_id, date, before, after, PER_PAGE
+    )
+    return await render_page(
+        views.day_view_page(username, date, page, day_snapshot)
+    )
+
+
+@app.route("/<username>/<date>/add_new")
+@check_login
+async def new_nutrition_entry(username: str, date: str) -> str:
+    if not is_date_in_url_valid(date):
+        return await render_page(views.bad_url(username))
+    return await render_page(views.new_entry_page(username, date))
+
+
+@app.route("/<username>/<date>/add_new", methods=["POST"])
+@check_login
+async def add_nutrition_entry(
+    username: str, date: str
+) -> Union[str, Response]:
+    if not is_date_in_url_valid(date):
+        return await render_page(views.bad_url(username))
+    form = await request.form
+    entry_date = form["entry_date"]
+    nutrition = views.nutrition_form(form)
+
+    # Display errors and re-display the form with the values entered
+    errors = views.errors_for_nutrition_form(nutrition, entry_date)
+    if errors:
+        for error in errors:
+            await flash(error)
+        return await render_page(
+            views.invalid_new_entry_page(username, entry_date, nutrition)
+        )
+
+    await g.storage.add_nutrition_entry(
+        g.user_id, entry_date, *nutrition.values()
+    )
+    await flash("New data entry added!")
+    return redirect(url_for("day_view", username=username, date=entry_date))
+
+
+@app.route("/<username>/entries/batch", methods=["POST"])
+@check_login
+async def add_nutrition_entries(username: str) -> Tuple[Response, int]:
+    """Same request and responses as the batch endpoint in `app.py`."""
+    batch = views.batch_request(
+        await request.get_json(silent=True), app.config["BATCH_MAX_ENTRIES"]
+    )
+    if batch.errors:
+        return jsonify(errors=batch.errors), batch.status
+
+    added = await g.storage.add_nutrition_entries(g.user_id, batch.rows)
+    return jsonify(added=added), batch.status
+
+
+@app.route("/<username>/import")
+@check_login
+async def display_import(username: str) -> str:
+    return await render_template("import.html", username=username, report=None)
+
+
+@app.route("/<username>/import", methods=["POST"])
+@check_login
+async def import_nutrition_history(
+    username: str,
+) -> Union[str, Tuple[str, int]]:
+    files = await request.files
+    upload = files.get("file")
+    file_format = upload and detect_format(upload.filename or "")
+    if not file_format:
+        await flash("Choose a .csv, .json, .jsonl or .ndjson file to import.")
+        return await render_template("import.html", username=username), 422
+
+    # The upload is read and copied to the database row by row
+    report = await aimport_file(
+        g.storage, g.user_id, upload.stream, file_format
+    )
+    await flash(
+        f"Imported {report.rows_imported} of {report.rows_read} entries."
+    )
+    return await render_template(
+        "import.html", username=username, report=report
+    )
+
+
+@app.route("/<username>/export")
+@check_login
+async def export_nutrition_history(username: str) -> Union[str, Response]:
+    export = views.export_request(request.args)
+    if export is None:
+        return await render_page(views.bad_url(username))
+
+    data, file_format = export
+    # Rows are sent as they are read from the database; nothing runs until
+    # the response starts streaming
+    chunks = stream_with_context(aexport_chunks)(
+        g.storage, g.user_id, data, file_format
+    )
+    response = Response(chunks, mimetype=FORMATS[file_format])
+    response.headers.set(
+        "Content-Disposition",
+        "attachment",
+        filename=export_filename(username, data, file_format),
+    )
+    return response
+
+
+@app.route("/<username>/targets")
+@check_login
+async def display_targets(username: str) -> str:
+    user_targets = await g.storage.get_user_targets(g.user_id)
+    return await render_page(views.targets_page(username, user_targets))
+
+
+@app.route("/<username>/targets/edit")
+@check_login
+async def edit_targets(username: str) -> str:
+    user_targets = await g.storage.get_user_targets(g.user_id)
+    return await render_page(
+        views.targets_page(username, user_targets, edit=True)
+    )
+
+
+@app.route("/<username>/targets/edit", methods=["POST"])
+@check_login
+async def update_targets(username: str) -> Union[str, Response]:
+    targets = views.targets_form(await request.form)
+
+    # Display the error and re-display the form with the values entered
+    error = views.error_for_targets_form(targets)
+    if error:
+        await flash(error)
+        return await render_page(
+            views.targets_page(username, targets, edit=True)
+        )
+
+    await g.storage.update_user_targets(g.user_id, *targets.values())
+    await flash("Targets were updated!")
+    return redirect(url_for("display_targets", username=username))
+
+
+@app.route("/<username>/<date>/<int:nutrition_entry_id>/edit")
+@check_login
+async def edit_entry(username: str, date: str, nutrition_entry_id: int) -> str:
+    if not is_date_in_url_valid(date) or not is_entry_id_in_url_valid(
+        nutrition_entry_id
+    ):
+        return await render_page(views.bad_url(username))
+
+    # Validates that the nutrition id in the URL belongs to the user and is
+    # on this date
+    nutrition_data = await g.storage.find_nutrition_entry(
+        g.user_id, nutrition_entry_id, date
+    )
+    if nutrition_data is None:
+        return await render_page(views.bad_url(username))
+
+    return await render_page(
+        views.edit_entry_page(
+            username, date, nutrition_entry_id, nutrition_data
+        )
+    )
+
+
+@app.route(
+    "/<username>/<date>/<int:nutrition_entry_id>/edit", methods=["POST"]
+)
+@check_login
+async def update_entry(
+    username: str, date: str, nutrition_entry_id: int
+) -> Union[str, Response]:
+    if not is_date_in_url_valid(date) or not is_entry_id_in_url_valid(
+        nutrition_entry_id
+    ):
+        return await render_page(views.bad_url(username))
+    nutrition = views.nutrition_form(await request.form)
+
+    # Display errors and re-display the form with the values entered
+    errors = views.errors_for_nutrition_form(nutrition)
+    if errors:
+        for error in errors:
+            await flash(error)
+        return await render_page(
+            views.edit_entry_page(
+                username, date, nutrition_entry_id, nutrition
+            )
+        )
+
+    # Validates that the nutrition id in the URL belongs to the user and is
+    # on this date, and updates the entry in one statement
+    updated = await g.storage.update_nutrition_entry(
+        g.user_id, nutrition_entry_id, date, *nutrition.values()
+    )
+    if not updated:
+        return await render_page(views.bad_url(username))
+
+    await flash("The entry was updated!")
+    return redirect(url_for("day_view", username=username, date=date))
+
+
+@app.route(
+    "/<username>/<date>/<int:nutrition_entry_id>/delete", methods=["POST"]
+)
+@check_login
+async def delete_entry(
+    username: str, date: str, nutrition_entry_id: int
+) -> Union[str, Response]:
+    if not is_date_in_url_valid(date) or not is_entry_id_in_url_valid(
+        nutrition_entry_id
+    ):
+        return await render_page(views.bad_url(username))
+
+    # Validates that the nutrition id in the URL belongs to the user and is
+    # on this date, and deletes the entry in one statement
+    deleted = await g.storage.delete_nutrition_entry(
+        g.user_id, nutrition_entry_id, date
+    )
+    if not deleted:
+        return await render_page(views.bad_url(username))
+
+    await flash("The entry was deleted!")
+    return redirect(url_for("day_view", username=username, date=date))
+
+
+# AI chat history is stored server-side; the cookie only carries its id
+def chat_id() -> str:
+    if "chat_id" not in session:
+        session["chat_id"] = new_chat_id()
+    # Sessions from before the history moved out of the cookie
+    session.pop("history", None)
+    return session["chat_id"]
+
+
+async def load_chat() -> Chat:
+    return views.with_welcome(
+        await g.storage.get_chat_history(
+            chat_id(), g.user_id, app.config["CHAT_HISTORY_TTL"]
+        )
+    )
+
+
+@app.route("/<username>/ai_assistant")
+@check_login
+async def chat_with_ai_assistant(username: str) -> str:
+    return await render_template(
+        "ai_help.html", history=(await load_chat()).history, username=username
+    )
+
+
+@app.route("/<username>/ai_assistant", methods=["POST"])
+@check_login
+async def get_response_from_ai_assistant(username: str) -> Response:
+    form = await request.form
+    user_message = form["message"]
+    history, chat_memory = await load_chat()
+    history.append({"sender": username, "text": user_message})
+    memory = load_memory(chat_memory)
+    # The event loop serves other requests while the LLM answers
+    ai_message = await aget_ai_response(user_input=user_message, memory=memory)
+    history.append({"sender": "ai_agent", "text": ai_message})
+
+    await g.storage.save_chat_history(
+        chat_id(),
+        g.user_id,
+        history,
+        dump_memory(memory),
+        app.config["CHAT_HISTORY_MAX_MESSAGES"],
+    )
+    return redirect(url_for("chat_with_ai_assistant", username=username))
+
+
+# Streams the answer as Server-Sent Events: a "token" event per chunk of the
+# answer, then "done" with the answer rendered as HTML once the history is
+# saved, or "error". The form posts to `get_response_from_ai_assistant`
+# without JavaScript.
+@app.route("/<username>/ai_assistant/stream", methods=["POST"])
+@check_login
+async def stream_response_from_ai_assistant(username: str) -> Response:
+    form = await request.form
+    user_message = form["message"]
+    history, chat_memory = await load_chat()
+    history.append({"sender": username, "text": user_message})
+    memory = load_memory(chat_memory)
+    # The session can't change once the response has started, and `g` isn't
+    # kept for the stream
+    current_chat_id = chat_id()
+    storage, user_id = g.storage, g.user_id
+
+    @stream_with_context
+    async def events() -> AsyncIterator[str]:
+        parts = []
+        try:
+            async for token in astream_ai_response(user_message, memory):
+                parts.append(token)
+                yield sse_event("token", token)
+        except Exception:
+            # The status line has been sent, so the client hears it here
+            app.logger.exception("AI assistant response failed")
+            yield sse_event("error", "Something went wrong, please try again.")
+            return
+        ai_message = "".join(parts)
+        history.append({"sender": "ai_agent", "text": ai_message})
+        await storage.save_chat_history(
+            current_chat_id,
+            user_id,
+            history,
+            dump_memory(memory),
+            app.config["CHAT_HISTORY_MAX_MESSAGES"],
+        )
+        yield sse_event("done", views.render_markdown(ai_message))
+
+    return Response(
+        events(), mimetype="text/event-stream", headers=views.SSE_HEADERS
+    )
+
+
+@app.route("/<username>/ai_assistant/clear_history", methods=["POST"])
+@check_login
+async def clear_chat_history(username: str) -> Response:
+    await g.storage.delete_chat_history(chat_id(), g.user_id)
+    return redirect(url_for("chat_with_ai_assistant", username=username))
+
+
+if __name__ == "__main__":
+    if os.environ.get("FLASK_ENV") == "production":
+        app.run(debug=False)
+    else:
+        app.run(debug=True, port=5003)
@@ -0,0 +1,85 @@
+"""
+Measure time to first token of the streamed AI assistant answer against
+the time to the whole answer.
+
+Logs in, then posts each message to the streaming endpoint and times the
+first "token" event and the "done" event. A cached answer arrives as a
+single token, so run against an empty AI cache. Start a server against a
+seeded database with `OPENAI_API_KEY` and `SECRET_KEY` set, e.g.
+
+    gunicorn --workers 2 --bind 127.0.0.1:8000 app:app
+
+then run from the repository root:
+
+    python -m benchmarks.ai_stream --url http://127.0.0.1:8000
+"""
+
+import argparse
+import statistics
+import time
+from typing import List, Optional, Tuple
+
+import httpx
+
+MESSAGES = [
+    "Female, 30, 65 kg, 170 cm, sedentary",
+    "Male, 42, 90 kg, 185 cm, I work out three times a week",
+    "What's the weather like today?",
+]
+
+
+def stream_answer(
+    client: httpx.Client, username: str, message: str
+) -> Tuple[Optional[float], float]:
+    """Seconds to the first token and to the end of the answer."""
+    started = time.perf_counter()
+    first_token = None
+    with client.stream(
+        "POST", f"/{username}/ai_assistant/stream", data={"message": message}
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if first_token is None and line == "event: token":
+                first_token = time.perf_counter() - started
+    return first_token, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", default="test_user")
+    parser.add_argument("--password", default="test_pwd")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    first_tokens: List[float] = []
+    totals: List[float] = []
+    with httpx.Client(base_url=args.url, timeout=args.timeout) as client:
+        client.post(
+            "/login/",
+            data={"username": args.username, "pwd": args.password},
+        ).raise_for_status()
+        for _ in range(args.repeat):
+            for message in MESSAGES:
+                first_token, total = stream_answer(
+                    client, args.username, message
+                )
+                if first_token is not None:
+                    first_tokens.append(first_token)
+                totals.append(total)
+
+    print(f"{'answers':<24}{len(totals):>10}")
+    if first_tokens:
+        print(
+            f"{'first token median ms':<24}"
+            f"{statistics.median(first_tokens) * 1000:>10.1f}"
+        )
+    print(
+        f"{'whole answer median ms':<24}"
+        f"{statistics.median(totals) * 1000:>10.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
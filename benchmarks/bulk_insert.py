@@ -0,0 +1,98 @@
+"""
+Compare inserting entries one at a time with `add_nutrition_entry` against a
+single `add_nutrition_entries` batch.
+
+Run from the repository root against a seeded database:
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bulk_insert \
+        --user-id 1 --rows 5000
+
+Inserted entries are dated in the far future and deleted afterwards.
+"""
+
+import argparse
+import os
+import time
+from typing import Any, Dict, List
+
+import psycopg2
+
+from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.db_pool import ConnectionPool
+
+BENCHMARK_DATE = "2999-01-01"
+
+
+def make_rows(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "date": BENCHMARK_DATE,
+            "calories": 100 + row % 400,
+            "protein": row % 50,
+            "fat": row % 30,
+            "carbs": row % 80,
+            "meal": f"benchmark entry {row}",
+        }
+        for row in range(count)
+    ]
+
+
+def one_at_a_time(
+    storage: DatabasePersistence, user_id: int, rows: List[Dict[str, Any]]
+) -> None:
+    for row in rows:
+        storage.add_nutrition_entry(
+            user_id,
+            row["date"],
+            row["calories"],
+            row["protein"],
+            row["fat"],
+            row["carbs"],
+            row["meal"],
+        )
+
+
+def batch(
+    storage: DatabasePersistence, user_id: int, rows: List[Dict[str, Any]]
+) -> None:
+    storage.add_nutrition_entries(user_id, rows)
+
+
+def delete_benchmark_rows(dsn: str, user_id: int) -> None:
+    connection = psycopg2.connect(dsn)
+    try:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM nutrition WHERE user_id = %s AND "date" = %s',
+                    (user_id, BENCHMARK_DATE),
+                )
+    finally:
+        connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    dsn = os.environ.get("DATABASE_URL")
+    storage = DatabasePersistence(
+        dsn=dsn, pool=ConnectionPool(dsn=dsn, max_size=1)
+    )
+    rows = make_rows(args.rows)
+
+    print(f"{'':<16}{'seconds':>10}{'rows per second':>18}")
+    for name, insert in (("one at a time", one_at_a_time), ("batch", batch)):
+        started = time.perf_counter()
+        try:
+            insert(storage, args.user_id, rows)
+            elapsed = time.perf_counter() - started
+        finally:
+            delete_benchmark_rows(dsn, args.user_id)
+        print(f"{name:<16}{elapsed:>10.2f}{args.rows / elapsed:>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measure requests per second with many requests in flight at once, to compare
+the WSGI app (`app.py` under gunicorn) with the ASGI app (`asgi.py` under
+uvicorn or hypercorn).
+
+Start one of the servers against a seeded database with `SECRET_KEY` set,
+e.g.
+
+    gunicorn --workers 2 --bind 127.0.0.1:8000 app:app
+    uvicorn --workers 2 --port 8000 asgi:app
+
+then run from the repository root:
+
+    python -m benchmarks.concurrent_requests --url http://127.0.0.1:8000 \
+        --concurrency 200 --requests 2000
+
+The client logs in once and sends every request with that session cookie.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+
+
+async def log_in(
+    client: httpx.AsyncClient, username: str, password: str
+) -> None:
+    response = await client.post(
+        "/login/", data={"username": username, "pwd": password, "next": ""}
+    )
+    if response.status_code != 302:
+        raise SystemExit(f"login failed with status {response.status_code}")
+
+
+async def run(
+    client: httpx.AsyncClient, path: str, requests: int, concurrency: int
+) -> List[float]:
+    """Send `requests` GETs, `concurrency` at a time; return latencies."""
+    latencies: List[float] = []
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=args.timeout
+    ) as client:
+        await log_in(client, args.username, args.password)
+        path = args.path or f"/{args.username}/"
+
+        started = time.perf_counter()
+        latencies = await run(client, path, args.requests, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{'requests':<20}{len(latencies):>10}")
+    print(f"{'concurrency':<20}{args.concurrency:>10}")
+    print(f"{'requests per second':<20}{len(latencies) / elapsed:>10.0f}")
+    print(f"{'median ms':<20}{statistics.median(latencies) * 1000:>10.1f}")
+    print(f"{'95th percentile ms':<20}{p95 * 1000:>10.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", default="test_user")
+    parser.add_argument("--password", default="test_pwd")
+    parser.add_argument(
+        "--path", help="page to request (default: the user's dashboard)"
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=60)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare the database cost of loading a day view with three separate queries
+(`daily_total_nutrition`, `get_nutrition_left`, `get_daily_nutrition`) against
+the single `get_day_snapshot` query.
+
+Run from the repository root against a seeded database:
+
+    DATABASE_URL=postgresql://... python -m benchmarks.day_view_round_trips \
+        --user-id 1 --date 2025-07-28
+
+Pass `--no-pool` to open a new connection per query, as every query did before
+connections were pooled.
+"""
+
+from contextlib import contextmanager
+
+import argparse
+import os
+import time
+from typing import Any, Callable, Dict, Iterator
+
+from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.db_pool import ConnectionPool
+
+
+class CountingCursor:
+    def __init__(self, cursor: Any, counts: Dict[str, int]) -> None:
+        self._cursor = cursor
+        self._counts = counts
+
+    def execute(self, query: str, parameters: Any = None) -> None:
+        self._counts["statements"] += 1
+        self._cursor.execute(query, parameters)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __enter__(self) -> "CountingCursor":
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self._cursor.__exit__(exc_type, exc, tb)
+
+
+class CountingConnection:
+    def __init__(self, connection: Any, counts: Dict[str, int]) -> None:
+        self._connection = connection
+        self._counts = counts
+
+    def cursor(self, *args: Any, **kwargs: Any) -> CountingCursor:
+        return CountingCursor(
+            self._connection.cursor(*args, **kwargs), self._counts
+        )
+
+
+class CountingPersistence(DatabasePersistence):
+    """Count connections borrowed and statements sent to the server."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.counts = {"connections": 0, "statements": 0}
+
+    @contextmanager
+    def _database_connect(self) -> Iterator[Any]:
+        self.counts["connections"] += 1
+        with super()._database_connect() as connection:
+            yield CountingConnection(connection, self.counts)
+
+
+def separate_queries(storage: DatabasePersistence, user_id: int, date: str):
+    storage.daily_total_nutrition(user_id, date)
+    storage.get_nutrition_left(user_id, date)
+    storage.get_daily_nutrition(user_id, date)
+
+
+def day_snapshot(storage: DatabasePersistence, user_id: int, date: str):
+    storage.get_day_snapshot(user_id, date)
+
+
+def run(
+    name: str,
+    load_day: Callable[[DatabasePersistence, int, str], None],
+    storage: CountingPersistence,
+    user_id: int,
+    date: str,
+    iterations: int,
+) -> None:
+    load_day(storage, user_id, date)  # Warm up
+    storage.counts = {"connections": 0, "statements": 0}
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        load_day(storage, user_id, date)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{name:<18}"
+        f"{storage.counts['connections'] / iterations:>14.1f}"
+        f"{storage.counts['statements'] / iterations:>13.1f}"
+        f"{elapsed / iterations * 1000:>14.2f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--date", default="2025-07-28")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--no-pool", action="store_true")
+    args = parser.parse_args()
+
+    dsn = os.environ.get("DATABASE_URL")
+    pool = None if args.no_pool else ConnectionPool(dsn=dsn, max_size=1)
+    print(f"{'':<18}{'connections':>14}{'statements':>13}{'ms per view':>14}")
+    for name, load_day in (
+        ("separate queries", separate_queries),
+        ("day snapshot", day_snapshot),
+    ):
+        storage = CountingPersistence(dsn=dsn, pool=pool)
+        run(name, load_day, storage, args.user_id, args.date, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Measure how long importing a module takes, e.g. the app a worker boots.
+
+The import runs in a fresh interpreter with `-X importtime`, once per
+repeat. Reported are the median total, the top-level packages that took the
+longest (their cumulative time) and how many modules were loaded. Run from
+the repository root:
+
+    python -m benchmarks.import_time --module app --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# The apps refuse to start without SECRET_KEY outside development
+IMPORT_ENV = {"FLASK_ENV": "development", **os.environ}
+
+
+def import_times(module: str) -> Tuple[int, Dict[str, int]]:
+    """
+    Import `module` in a new interpreter. Return its cumulative import time
+    and the cumulative time of each top-level package, in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**IMPORT_ENV, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    packages: Dict[str, int] = defaultdict(int)
+    total = 0
+    # "import time: self [us] | cumulative | imported package"
+    prefix = "import time:"
+    for line in result.stderr.splitlines():
+        if not line.startswith(prefix) or "[us]" in line:
+            continue
+        _, cumulative, name = line.removeprefix(prefix).split("|")
+        name = name.strip()
+        if name == module:
+            total = int(cumulative)
+        # A package's own line has the largest cumulative time of its modules
+        top_level = name.split(".")[0]
+        packages[top_level] = max(packages[top_level], int(cumulative))
+    return total, packages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    totals: List[int] = []
+    packages: Dict[str, int] = {}
+    for _ in range(args.repeat):
+        total, packages = import_times(args.module)
+        totals.append(total)
+
+    modules = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, {args.module}; print(len(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=IMPORT_ENV,
+    ).stdout.strip()
+
+    print(f"{'import ' + args.module + ' ms':<24}", end="")
+    print(f"{statistics.median(totals) / 1000:>10.1f}")
+    print(f"{'modules loaded':<24}{modules:>10}")
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])
+    for name, cumulative in heaviest[: args.top]:
+        if name != args.module:
+            print(f"{'  ' + name + ' ms':<24}{cumulative / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Measure how many AI assistant messages the local intent router handles, how
+often it agrees with the LLM router, and the latency and tokens it saves.
+
+Messages are read from a replay set, one JSON object per line with the
+message (`input`) and the LLM router's choice (`destination`). The shipped
+set in `benchmarks/data/routing_replay.jsonl` is labelled by hand following
+the router prompt; `--record` asks the LLM router for each message and
+writes its choices back (needs `OPENAI_API_KEY`). `--live` asks it too, but
+only to compare against and time it. Without either, router tokens are
+counted from the router prompt and latency is only measured locally.
+
+    python -m benchmarks.intent_routing [--live | --record]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from macro_mojo.ai_agent import MODEL_NAME, get_agent, router_template
+from macro_mojo.intent_router import INTENT_ROUTER_THRESHOLD, classify
+
+REPLAY_PATH = "benchmarks/data/routing_replay.jsonl"
+# Tokens in the router's JSON answer, for when it isn't called
+ROUTER_COMPLETION_TOKENS = 40
+
+
+def load_replay(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def prompt_tokens(text: str) -> int:
+    import tiktoken
+
+    try:
+        encoding = tiktoken.encoding_for_model(MODEL_NAME)
+    except Exception:
+        # The encoding is downloaded on first use; without network access,
+        # estimate about four characters per token
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+
+def ask_llm_router(messages: List[Dict[str, Any]]) -> List[float]:
+    """Set each message's `destination` and `tokens` from the LLM router."""
+    from langchain_community.callbacks import get_openai_callback
+
+    llm_router = get_agent().chain.router_chain.llm_router
+    latencies = []
+    for message in messages:
+        with get_openai_callback() as usage:
+            started = time.perf_counter()
+            result = llm_router.invoke({"input": message["input"]})
+            latencies.append(time.perf_counter() - started)
+        message["destination"] = str(result["destination"])
+        message["tokens"] = usage.total_tokens
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--replay", default=REPLAY_PATH)
+    parser.add_argument(
+        "--threshold", type=float, default=INTENT_ROUTER_THRESHOLD
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--live", action="store_true", help="compare with the LLM router"
+    )
+    mode.add_argument(
+        "--record",
+        action="store_true",
+        help="write the LLM router's choices to the replay set",
+    )
+    args = parser.parse_args()
+
+    messages = load_replay(args.replay)
+    llm_latencies: List[float] = []
+    if args.live or args.record:
+        llm_latencies = ask_llm_router(messages)
+    if args.record:
+        with open(args.replay, "w", encoding="utf-8") as file:
+            for message in messages:
+                record = {
+                    "input": message["input"],
+                    "destination": message["destination"],
+                }
+                file.write(json.dumps(record) + "\n")
+
+    local_latencies = []
+    routed = agreed = tokens_saved = 0
+    for message in messages:
+        started = time.perf_counter()
+        intent = classify(message["input"])
+        local_latencies.append(time.perf_counter() - started)
+        if intent.confidence < args.threshold:
+            continue
+        routed += 1
+        agreed += intent.destination == message["destination"]
+        tokens_saved += message.get("tokens") or (
+            prompt_tokens(router_template.format(input=message["input"]))
+            + ROUTER_COMPLETION_TOKENS
+        )
+
+    print(f"{'messages':<28}{len(messages):>10}")
+    print(f"{'routed locally':<28}{routed:>10}")
+    print(f"{'local rate':<28}{routed / len(messages):>10.1%}")
+    if routed:
+        print(f"{'agreement with LLM router':<28}{agreed / routed:>10.1%}")
+    print(f"{'router tokens saved':<28}{tokens_saved:>10}")
+    print(
+        f"{'local median us':<28}"
+        f"{statistics.median(local_latencies) * 1e6:>10.1f}"
+    )
+    if llm_latencies:
+        median = statistics.median(llm_latencies)
+        print(f"{'LLM router median ms':<28}{median * 1000:>10.1f}")
+        print(f"{'latency saved s':<28}{median * routed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
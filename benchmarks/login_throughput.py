@@ -0,0 +1,139 @@
+"""
+Measure login throughput under concurrency, and how a login spike affects
+other routes.
+
+Many clients post the login form at once while a separate client keeps
+requesting a cheap page. Logins are counted by outcome: accepted (302),
+turned away because every password check slot was taken (503), or
+rejected credentials (422). Compare runs with `PASSWORD_WORKERS=0`
+(checks in the request worker) and the default process pool.
+
+Start a server against a seeded database with `SECRET_KEY` set, e.g.
+
+    gunicorn --workers 4 --bind 127.0.0.1:8000 app:app
+
+then run from the repository root:
+
+    python -m benchmarks.login_throughput --url http://127.0.0.1:8000 \
+        --concurrency 50 --logins 500
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import Counter as CounterType, List, Tuple
+
+import httpx
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    return latencies[max(int(len(latencies) * fraction) - 1, 0)]
+
+
+async def run_logins(
+    url: str,
+    username: str,
+    password: str,
+    logins: int,
+    concurrency: int,
+    timeout: float,
+) -> Tuple[CounterType[int], List[float]]:
+    """Post `logins` logins, `concurrency` at a time."""
+    statuses: CounterType[int] = Counter()
+    latencies: List[float] = []
+    remaining = iter(range(logins))
+    form = {"username": username, "pwd": password, "next": ""}
+
+    async def worker() -> None:
+        # A client per worker, so every login starts without a session
+        async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.post("/login/", data=form)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+                client.cookies.clear()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return statuses, latencies
+
+
+async def probe(
+    client: httpx.AsyncClient, path: str, stop: asyncio.Event
+) -> List[float]:
+    """Request `path` one at a time until `stop` is set."""
+    latencies: List[float] = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    stop = asyncio.Event()
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=args.timeout
+    ) as probe_client:
+        probe_task = asyncio.create_task(
+            probe(probe_client, args.probe_path, stop)
+        )
+        started = time.perf_counter()
+        statuses, latencies = await run_logins(
+            args.url,
+            args.username,
+            args.password,
+            args.logins,
+            args.concurrency,
+            args.timeout,
+        )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        probe_latencies = await probe_task
+
+    latencies.sort()
+    probe_latencies.sort()
+    print(f"{'logins':<24}{len(latencies):>10}")
+    print(f"{'concurrency':<24}{args.concurrency:>10}")
+    print(f"{'accepted (302)':<24}{statuses[302]:>10}")
+    print(f"{'turned away (503)':<24}{statuses[503]:>10}")
+    print(f"{'rejected (422)':<24}{statuses[422]:>10}")
+    print(f"{'accepted per second':<24}{statuses[302] / elapsed:>10.1f}")
+    print(
+        f"{'login median ms':<24}{statistics.median(latencies) * 1000:>10.1f}"
+    )
+    print(
+        f"{'login 95th pct ms':<24}{percentile(latencies, 0.95) * 1000:>10.1f}"
+    )
+    if probe_latencies:
+        print(
+            f"{'probe median ms':<24}"
+            f"{statistics.median(probe_latencies) * 1000:>10.1f}"
+        )
+        print(
+            f"{'probe 95th pct ms':<24}"
+            f"{percentile(probe_latencies, 0.95) * 1000:>10.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", default="test_user")
+    parser.add_argument("--password", default="test_pwd")
+    parser.add_argument(
+        "--probe-path",
+        default="/login/",
+        help="page requested alongside the logins (default: /login/)",
+    )
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=60)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,77 @@
+import hashlib
 import os
+import tempfile
 
 
 class Config:
     DEBUG = False
     TESTING = False
+    # Signs the session cookie. Every worker of both apps must use the same
+    # key, or sessions started on one worker are rejected by the others.
+    # Only development and testing (FLASK_ENV) run without it.
+    SECRET_KEY = os.environ.get("SECRET_KEY")
     # Default database URL
     DATABASE_URI = os.environ.get("DATABASE_URL")
+    # Database connection pool, one per worker process
+    DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+    DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+    # Seconds to wait for a free connection before giving up
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    # Read replicas, comma separated. Read-only queries go to a healthy
+    # replica and everything else to DATABASE_URL. Each replica gets a pool
+    # sized like the primary's.
+    DATABASE_REPLICA_URLS = [
+        url.strip()
+        for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",")
+        if url.strip()
+    ]
+    # Replicas further behind the primary (seconds) are skipped
+    REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", 5))
+    # Seconds between lag checks, and before a skipped replica is retried
+    REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL", 5))
+    REPLICA_RETRY_AFTER = float(os.environ.get("REPLICA_RETRY_AFTER", 30))
+    # After a user writes, their reads go to the primary for this many
+    # seconds so they see their own changes
+    READ_YOUR_WRITES_SECONDS = float(
+        os.environ.get("READ_YOUR_WRITES_SECONDS", 10)
+    )
+    # Password checks run in a process pool with this many processes per
+    # app process (0 checks in the request's own thread). At most
+    # PASSWORD_MAX_PENDING checks run at once across the node; logins beyond
+    # that are turned away with a 503 instead of waiting.
+    PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", 1))
+    PASSWORD_MAX_PENDING = int(os.environ.get("PASSWORD_MAX_PENDING", 4))
+    PASSWORD_TIMEOUT = float(os.environ.get("PASSWORD_TIMEOUT", 10))
+    # Where the slot files that bound checks across the node are locked.
+    # App instances share the PASSWORD_MAX_PENDING budget only if they share
+    # a namespace, which by default is derived from the database URL.
+    PASSWORD_SLOTS_DIR = os.environ.get(
+        "PASSWORD_SLOTS_DIR", tempfile.gettempdir()
+    )
+    PASSWORD_SLOTS_NAMESPACE = os.environ.get(
+        "PASSWORD_SLOTS_NAMESPACE",
+        hashlib.sha256((DATABASE_URI or "").encode()).hexdigest()[:16],
+    )
+    # Cost factor of password hashes; weaker hashes are rehashed on login
+    BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+    # Messages kept per AI assistant conversation
+    CHAT_HISTORY_MAX_MESSAGES = int(
+        os.environ.get("CHAT_HISTORY_MAX_MESSAGES", 50)
+    )
+    # Seconds an AI assistant conversation is kept after its last message;
+    # run `python -m macro_mojo.chat_expiry` daily to delete older ones
+    CHAT_HISTORY_TTL = int(
+        os.environ.get("CHAT_HISTORY_TTL", 30 * 24 * 60 * 60)
+    )
+    # Most entries accepted by one request to the batch entry endpoint
+    BATCH_MAX_ENTRIES = int(os.environ.get("BATCH_MAX_ENTRIES", 5000))
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    # Queries at least this slow (milliseconds) are logged as warnings
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+    # Fraction of the other queries logged at INFO
+    QUERY_LOG_SAMPLE_RATE = float(os.environ.get("QUERY_LOG_SAMPLE_RATE", 0.0))
+    # Per-request timing: `Server-Timing` header and JSON access log lines
+    REQUEST_TIMING = os.environ.get("REQUEST_TIMING", "true").lower() == "true"
 
 
 class DevelopmentConfig(Config):
@@ -1,4 +1,6 @@
-CREATE TABLE targets (
+-- Initial schema. `IF NOT EXISTS` lets databases created from the former
+-- db/schema.sql adopt migrations without changes.
+CREATE TABLE IF NOT EXISTS targets (
     id serial PRIMARY KEY,
     calorie_target integer NOT NULL DEFAULT 2000,
     protein_target integer NOT NULL DEFAULT 100,
@@ -6,15 +8,15 @@ CREATE TABLE targets (
     carb_target integer NOT NULL DEFAULT 265
 );
 
-CREATE TABLE users (
+CREATE TABLE IF NOT EXISTS users (
     id serial PRIMARY KEY,
     username text NOT NULL UNIQUE,
     hashed_pwd text NOT NULL,
-    target_id integer UNIQUE NOT NULL REFERENCES targets(id) 
+    target_id integer UNIQUE NOT NULL REFERENCES targets(id)
                                       ON DELETE CASCADE
 );
 
-CREATE TABLE nutrition (
+CREATE TABLE IF NOT EXISTS nutrition (
     id serial PRIMARY KEY,
     user_id integer NOT NULL REFERENCES users(id)
                              ON DELETE CASCADE,
@@ -25,4 +27,4 @@ CREATE TABLE nutrition (
     fat integer NOT NULL,
     carbs integer NOT NULL,
     meal text
-);
\ No newline at end of file
+);
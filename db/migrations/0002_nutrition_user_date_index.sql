@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- Serves every per-user read of `nutrition`: entries for a day newest first
+-- (day view), and days in date order (dashboard, scanned backwards).
+-- Built concurrently so that writes aren't blocked on large tables. If the
+-- build fails, drop the INVALID index before running migrations again.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS nutrition_user_id_date_entered_at_idx
+    ON nutrition (user_id, "date", entered_at DESC);
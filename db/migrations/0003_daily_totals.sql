@@ -0,0 +1,155 @@
+-- Per-user daily sums of `nutrition`, read by the dashboard and day view
+-- instead of aggregating entries on every request. Kept in sync by
+-- statement-level triggers on `nutrition`; `python -m macro_mojo.daily_totals`
+-- verifies and rebuilds it.
+CREATE TABLE daily_totals (
+    user_id integer NOT NULL REFERENCES users(id)
+                             ON DELETE CASCADE,
+    "date" date NOT NULL,
+    calories bigint NOT NULL,
+    protein bigint NOT NULL,
+    fat bigint NOT NULL,
+    carbs bigint NOT NULL,
+    entry_count integer NOT NULL CHECK (entry_count > 0),
+    PRIMARY KEY (user_id, "date")
+);
+
+-- Each statement's changed rows are summed per (user_id, date) and applied
+-- as one upsert, so a bulk insert touches each day once. Rows are applied
+-- in key order so concurrent statements lock days in the same order.
+CREATE FUNCTION daily_totals_add_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO daily_totals AS totals
+                (user_id, "date", calories, protein, fat, carbs, entry_count)
+    SELECT user_id, "date", SUM(calories), SUM(protein), SUM(fat),
+           SUM(carbs), COUNT(*)
+    FROM new_entries
+    GROUP BY user_id, "date"
+    ORDER BY user_id, "date"
+    ON CONFLICT (user_id, "date") DO UPDATE
+    SET calories = totals.calories + EXCLUDED.calories,
+        protein = totals.protein + EXCLUDED.protein,
+        fat = totals.fat + EXCLUDED.fat,
+        carbs = totals.carbs + EXCLUDED.carbs,
+        entry_count = totals.entry_count + EXCLUDED.entry_count;
+    RETURN NULL;
+END;
+$$;
+
+-- Deleted entries only ever decrement existing days, and days that lose all
+-- their entries are deleted. Both statements see the totals as they were
+-- before this trigger, so the two sets of days don't overlap. Deleting a
+-- user removes their days through the foreign key before the cascaded entry
+-- delete fires this trigger, so there may be nothing left to update.
+CREATE FUNCTION daily_totals_remove_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    WITH removed AS (
+        SELECT user_id, "date", SUM(calories) AS calories,
+               SUM(protein) AS protein, SUM(fat) AS fat,
+               SUM(carbs) AS carbs, COUNT(*) AS entry_count
+        FROM old_entries
+        GROUP BY user_id, "date"
+    ),
+    decremented AS (
+        UPDATE daily_totals AS totals
+        SET calories = totals.calories - removed.calories,
+            protein = totals.protein - removed.protein,
+            fat = totals.fat - removed.fat,
+            carbs = totals.carbs - removed.carbs,
+            entry_count = totals.entry_count - removed.entry_count
+        FROM removed
+        WHERE totals.user_id = removed.user_id
+          AND totals.date = removed.date
+          AND totals.entry_count > removed.entry_count
+    )
+    DELETE FROM daily_totals AS totals
+    USING removed
+    WHERE totals.user_id = removed.user_id
+      AND totals.date = removed.date
+      AND totals.entry_count = removed.entry_count;
+    RETURN NULL;
+END;
+$$;
+
+-- An update is applied as the difference between its new and old rows. An
+-- entry moved to another day decrements the old day and increments the new
+-- one; a day left without entries is deleted.
+CREATE FUNCTION daily_totals_update_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO daily_totals AS totals
+                (user_id, "date", calories, protein, fat, carbs, entry_count)
+    SELECT user_id, "date", SUM(calories), SUM(protein), SUM(fat),
+           SUM(carbs), SUM(entry_count)
+    FROM (
+        SELECT user_id, "date", calories, protein, fat, carbs,
+               1 AS entry_count
+        FROM new_entries
+        UNION ALL
+        SELECT user_id, "date", -calories, -protein, -fat, -carbs,
+               -1 AS entry_count
+        FROM old_entries
+    ) AS changes
+    GROUP BY user_id, "date"
+    ORDER BY user_id, "date"
+    ON CONFLICT (user_id, "date") DO UPDATE
+    SET calories = totals.calories + EXCLUDED.calories,
+        protein = totals.protein + EXCLUDED.protein,
+        fat = totals.fat + EXCLUDED.fat,
+        carbs = totals.carbs + EXCLUDED.carbs,
+        entry_count = totals.entry_count + EXCLUDED.entry_count
+    -- Days left without entries are not updated here; they are deleted below
+    WHERE totals.entry_count + EXCLUDED.entry_count > 0;
+
+    DELETE FROM daily_totals AS totals
+    USING (SELECT DISTINCT user_id, "date" FROM old_entries) AS old_days
+    WHERE totals.user_id = old_days.user_id
+      AND totals.date = old_days.date
+      AND NOT EXISTS (
+          SELECT 1 FROM nutrition
+          WHERE nutrition.user_id = old_days.user_id
+            AND nutrition.date = old_days.date
+      );
+    RETURN NULL;
+END;
+$$;
+
+CREATE FUNCTION daily_totals_truncate_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM daily_totals;
+    RETURN NULL;
+END;
+$$;
+
+-- Block writes to `nutrition` until the triggers exist and the backfill is
+-- committed, so no entry is counted twice or missed
+LOCK TABLE nutrition IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TRIGGER nutrition_daily_totals_insert
+AFTER INSERT ON nutrition
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT EXECUTE FUNCTION daily_totals_add_entries();
+
+CREATE TRIGGER nutrition_daily_totals_delete
+AFTER DELETE ON nutrition
+REFERENCING OLD TABLE AS old_entries
+FOR EACH STATEMENT EXECUTE FUNCTION daily_totals_remove_entries();
+
+CREATE TRIGGER nutrition_daily_totals_update
+AFTER UPDATE ON nutrition
+REFERENCING OLD TABLE AS old_entries NEW TABLE AS new_entries
+FOR EACH STATEMENT EXECUTE FUNCTION daily_totals_update_entries();
+
+CREATE TRIGGER nutrition_daily_totals_truncate
+AFTER TRUNCATE ON nutrition
+FOR EACH STATEMENT EXECUTE FUNCTION daily_totals_truncate_entries();
+
+INSERT INTO daily_totals
+            (user_id, "date", calories, protein, fat, carbs, entry_count)
+SELECT user_id, "date", SUM(calories), SUM(protein), SUM(fat), SUM(carbs),
+       COUNT(*)
+FROM nutrition
+GROUP BY user_id, "date";
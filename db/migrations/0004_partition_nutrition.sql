@@ -0,0 +1,131 @@
+-- Partition `nutrition` by month of "date", so vacuum, index maintenance and
+-- backups work on one month at a time, and queries on a date only read that
+-- month's partition. Partitions are named nutrition_YYYY_MM; entries for a
+-- month without one land in nutrition_default until
+-- `nutrition_create_partitions` (run by `python -m macro_mojo.partitions`)
+-- creates it.
+--
+-- Existing entries are copied into the new table in this transaction, with
+-- writes to `nutrition` blocked until it commits. `daily_totals` is already
+-- in sync with them, so the triggers are created after the copy.
+
+LOCK TABLE nutrition IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE nutrition RENAME TO nutrition_unpartitioned;
+ALTER INDEX nutrition_pkey RENAME TO nutrition_unpartitioned_pkey;
+ALTER INDEX nutrition_user_id_date_entered_at_idx
+    RENAME TO nutrition_unpartitioned_user_id_date_entered_at_idx;
+-- Keep the id sequence when the old table is dropped
+ALTER SEQUENCE nutrition_id_seq OWNED BY NONE;
+
+-- The partition key must be part of the primary key. Ids still come from one
+-- sequence, so they stay unique across partitions.
+CREATE TABLE nutrition (
+    id integer NOT NULL DEFAULT nextval('nutrition_id_seq'),
+    user_id integer NOT NULL REFERENCES users(id)
+                             ON DELETE CASCADE,
+    "date" date NOT NULL DEFAULT NOW(),
+    entered_at timestamp NOT NULL DEFAULT NOW(),
+    calories integer NOT NULL,
+    protein integer NOT NULL,
+    fat integer NOT NULL,
+    carbs integer NOT NULL,
+    meal text,
+    CONSTRAINT nutrition_pkey PRIMARY KEY (id, "date")
+) PARTITION BY RANGE ("date");
+
+ALTER SEQUENCE nutrition_id_seq OWNED BY nutrition.id;
+
+CREATE INDEX nutrition_user_id_date_entered_at_idx
+    ON nutrition (user_id, "date", entered_at DESC);
+
+CREATE TABLE nutrition_default PARTITION OF nutrition DEFAULT;
+
+-- Create the monthly partitions from `first_month` through `last_month` that
+-- don't exist yet and return how many were created. Entries already in
+-- nutrition_default for a new month are moved into its partition, which is
+-- filled before it is attached. Moving rows between partitions directly
+-- doesn't fire the statement triggers on `nutrition`, so `daily_totals` is
+-- left as it is.
+CREATE FUNCTION nutrition_create_partitions(first_month date, last_month date)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date;
+    month_end date;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', first_month),
+            date_trunc('month', last_month),
+            interval '1 month'
+        )::date
+    LOOP
+        partition_name := 'nutrition_' || to_char(month_start, 'YYYY_MM');
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+        month_end := (month_start + interval '1 month')::date;
+
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE nutrition INCLUDING DEFAULTS)',
+            partition_name
+        );
+        EXECUTE format(
+            'WITH moved AS (
+                 DELETE FROM nutrition_default
+                 WHERE "date" >= %L AND "date" < %L
+                 RETURNING *
+             )
+             INSERT INTO %I SELECT * FROM moved',
+            month_start, month_end, partition_name
+        );
+        EXECUTE format(
+            'ALTER TABLE nutrition ATTACH PARTITION %I
+             FOR VALUES FROM (%L) TO (%L)',
+            partition_name, month_start, month_end
+        );
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+SELECT nutrition_create_partitions(
+    LEAST(
+        (SELECT MIN("date") FROM nutrition_unpartitioned),
+        CURRENT_DATE
+    ),
+    (CURRENT_DATE + interval '3 months')::date
+);
+
+INSERT INTO nutrition
+            (id, user_id, "date", entered_at, calories, protein, fat, carbs,
+             meal)
+SELECT id, user_id, "date", entered_at, calories, protein, fat, carbs, meal
+FROM nutrition_unpartitioned;
+
+DROP TABLE nutrition_unpartitioned;
+
+-- Statement triggers on a partitioned table see the rows changed in every
+-- partition
+CREATE TRIGGER nutrition_daily_totals_insert
+AFTER INSERT ON nutrition
+REFERENCING NEW TABLE AS new_entries
+FOR EACH STATEMENT EXECUTE FUNCTION daily_totals_add_entries();
+
+CREATE TRIGGER nutrition_daily_totals_delete
+AFTER DELETE ON nutrition
+REFERENCING OLD TABLE AS old_entries
+FOR EACH STATEMENT EXECUTE FUNCTION daily_totals_remove_entries();
+
+CREATE TRIGGER nutrition_daily_totals_update
+AFTER UPDATE ON nutrition
+REFERENCING OLD TABLE AS old_entries NEW TABLE AS new_entries
+FOR EACH STATEMENT EXECUTE FUNCTION daily_totals_update_entries();
+
+CREATE TRIGGER nutrition_daily_totals_truncate
+AFTER TRUNCATE ON nutrition
+FOR EACH STATEMENT EXECUTE FUNCTION daily_totals_truncate_entries();
+
+ANALYZE nutrition;
@@ -0,0 +1,10 @@
+-- Conversations with the AI assistant, kept here rather than in the session
+-- cookie, which only carries `chat_id`. `history` is zlib-compressed JSON
+-- (see `macro_mojo.chat_history`).
+CREATE TABLE chat_history (
+    chat_id text PRIMARY KEY,
+    user_id integer NOT NULL REFERENCES users(id)
+                             ON DELETE CASCADE,
+    history bytea NOT NULL,
+    updated_at timestamp NOT NULL DEFAULT NOW()
+);
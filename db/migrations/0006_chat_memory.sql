@@ -0,0 +1,5 @@
+-- What the AI assistant remembers of each chat: the latest messages within a
+-- token budget and a running summary of the older ones, as zlib-compressed
+-- JSON (see `macro_mojo.chat_history`). NULL for chats started before this
+-- migration, which start with an empty memory.
+ALTER TABLE chat_history ADD COLUMN memory bytea;
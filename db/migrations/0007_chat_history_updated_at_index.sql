@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- Lets `python -m macro_mojo.chat_expiry` find the chats that haven't been
+-- updated for `CHAT_HISTORY_TTL` without scanning the table. Built
+-- concurrently so that saving chats isn't blocked. If the build fails, drop
+-- the INVALID index before running migrations again.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_history_updated_at_idx
+    ON chat_history (updated_at);
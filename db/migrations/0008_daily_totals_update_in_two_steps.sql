@@ -0,0 +1,54 @@
+-- Apply updates to `daily_totals` as a removal of the old rows followed by
+-- an addition of the new ones. The function from 0003 upserted the signed
+-- difference, and `CHECK (entry_count > 0)` is checked on the proposed row
+-- before ON CONFLICT, so an edit on the same day (a difference of 0 entries)
+-- or a move to another day (-1) failed every `UPDATE nutrition`.
+--
+-- The first step is `daily_totals_remove_entries` on `old_entries`: days
+-- that keep entries are decremented and days left without any are deleted.
+-- The second is `daily_totals_add_entries` on `new_entries`, which only adds
+-- positive counts, recreating a day the first step deleted if needed.
+CREATE OR REPLACE FUNCTION daily_totals_update_entries() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    WITH removed AS (
+        SELECT user_id, "date", SUM(calories) AS calories,
+               SUM(protein) AS protein, SUM(fat) AS fat,
+               SUM(carbs) AS carbs, COUNT(*) AS entry_count
+        FROM old_entries
+        GROUP BY user_id, "date"
+    ),
+    decremented AS (
+        UPDATE daily_totals AS totals
+        SET calories = totals.calories - removed.calories,
+            protein = totals.protein - removed.protein,
+            fat = totals.fat - removed.fat,
+            carbs = totals.carbs - removed.carbs,
+            entry_count = totals.entry_count - removed.entry_count
+        FROM removed
+        WHERE totals.user_id = removed.user_id
+          AND totals.date = removed.date
+          AND totals.entry_count > removed.entry_count
+    )
+    DELETE FROM daily_totals AS totals
+    USING removed
+    WHERE totals.user_id = removed.user_id
+      AND totals.date = removed.date
+      AND totals.entry_count = removed.entry_count;
+
+    INSERT INTO daily_totals AS totals
+                (user_id, "date", calories, protein, fat, carbs, entry_count)
+    SELECT user_id, "date", SUM(calories), SUM(protein), SUM(fat),
+           SUM(carbs), COUNT(*)
+    FROM new_entries
+    GROUP BY user_id, "date"
+    ORDER BY user_id, "date"
+    ON CONFLICT (user_id, "date") DO UPDATE
+    SET calories = totals.calories + EXCLUDED.calories,
+        protein = totals.protein + EXCLUDED.protein,
+        fat = totals.fat + EXCLUDED.fat,
+        carbs = totals.carbs + EXCLUDED.carbs,
+        entry_count = totals.entry_count + EXCLUDED.entry_count;
+    RETURN NULL;
+END;
+$$;
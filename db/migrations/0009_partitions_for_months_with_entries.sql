@@ -0,0 +1,125 @@
+-- Only create partitions for months that have entries, plus the months
+-- ahead. `nutrition_create_partitions` was called with every month from the
+-- oldest entry in nutrition_default, so a single entry dated 1925 created
+-- over 1,200 empty partitions, and every query planned on `nutrition` then
+-- had to consider them.
+--
+-- The body of the loop in 0004 becomes `nutrition_create_partition`, for one
+-- month. `nutrition_create_partitions(last_month)` creates the partitions
+-- for the months of the entries in nutrition_default and for every month
+-- from the current one through `last_month`. Dropping the empty partitions
+-- already created is left to `nutrition_drop_partition_if_empty`, one
+-- partition per transaction, as dropping them all at once can run out of
+-- lock slots.
+
+-- Create the partition for the month of `month_start` if it doesn't exist
+-- yet, moving its entries out of nutrition_default, and return whether it
+-- was created
+CREATE FUNCTION nutrition_create_partition(month_start date)
+RETURNS boolean
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_end date;
+    partition_name text;
+BEGIN
+    month_start := date_trunc('month', month_start)::date;
+    partition_name := 'nutrition_' || to_char(month_start, 'YYYY_MM');
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    month_end := (month_start + interval '1 month')::date;
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE nutrition INCLUDING DEFAULTS)',
+        partition_name
+    );
+    EXECUTE format(
+        'WITH moved AS (
+             DELETE FROM nutrition_default
+             WHERE "date" >= %L AND "date" < %L
+             RETURNING *
+         )
+         INSERT INTO %I SELECT * FROM moved',
+        month_start, month_end, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE nutrition ATTACH PARTITION %I
+         FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, month_end
+    );
+    RETURN true;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION nutrition_create_partitions(
+    first_month date, last_month date
+)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date;
+    created integer := 0;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', first_month),
+            date_trunc('month', last_month),
+            interval '1 month'
+        )::date
+    LOOP
+        IF nutrition_create_partition(month_start) THEN
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+CREATE FUNCTION nutrition_create_partitions(last_month date)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date;
+    created integer := 0;
+BEGIN
+    FOR month_start IN
+        SELECT date_trunc('month', "date")::date
+        FROM nutrition_default
+        UNION
+        SELECT generate_series(
+            date_trunc('month', CURRENT_DATE),
+            date_trunc('month', last_month),
+            interval '1 month'
+        )::date
+        ORDER BY 1
+    LOOP
+        IF nutrition_create_partition(month_start) THEN
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Drop the partition `partition_name` if it has no entries and return
+-- whether it was dropped. `python -m macro_mojo.partitions --drop-empty`
+-- calls this for the partitions of past months, one per transaction, which
+-- cleans up the empty partitions the old calls created.
+CREATE FUNCTION nutrition_drop_partition_if_empty(partition_name text)
+RETURNS boolean
+LANGUAGE plpgsql AS $$
+DECLARE
+    is_empty boolean;
+BEGIN
+    -- Dropping a partition locks `nutrition` anyway. Locking it first keeps
+    -- entries from being added between the check and the drop, and takes the
+    -- locks in the order inserts do.
+    LOCK TABLE nutrition IN ACCESS EXCLUSIVE MODE;
+    EXECUTE format('SELECT NOT EXISTS (SELECT FROM %I)', partition_name)
+        INTO is_empty;
+    IF is_empty THEN
+        EXECUTE format('DROP TABLE %I', partition_name);
+    END IF;
+    RETURN is_empty;
+END;
+$$;
@@ -1,14 +1,40 @@
+"""
+The AI assistant: a LangChain `MultiPromptChain` that routes each message to
+the nutrition or off-topic prompt.
+
+Importing langchain and building the chains takes seconds, so nothing is
+imported or built until the first message: `get_agent` builds the
+`AIAgent` once per process, under a lock. Importing this module only
+defines the prompts.
+
+The agent is shared by every chat, and keeps no conversation itself. Each
+request loads its chat's `ChatMemory` with `load_memory`, passes the memory
+to `get_ai_response` (or a variant), and stores `dump_memory` with the chat.
+So what the LLM is given of a conversation, and what a worker holds, is
+bounded by `AI_MEMORY_TOKENS` however long chats and workers run.
+"""
+
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain.memory import ConversationBufferMemory
-from langchain.chains.router import MultiPromptChain
-from langchain.chains.router.llm_router import (
-    LLMRouterChain,
-    RouterOutputParser,
+import hashlib
+import os
+import threading
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
 )
 
+from macro_mojo.ai_cache import ResponseCache, cache_key
+from macro_mojo.chat_history import ChatMemory
+from macro_mojo.instrumentation import timed
+
+if TYPE_CHECKING:
+    from langchain.memory import ConversationSummaryBufferMemory
+
 load_dotenv()
 
 nutrition_template = """You are good at providing estimates for target daily
@@ -64,18 +90,7 @@ prompt_infos = [
     },
 ]
 
-llm = ChatOpenAI(model="gpt-4", temperature=0)
-memory = ConversationBufferMemory(
-    memory_key="chat_history", input_key="input", return_messages=False
-)
-
-destination_chains = {}
-for p_info in prompt_infos:
-    name = p_info["name"]
-    prompt_template = p_info["prompt_template"]
-    prompt = PromptTemplate.from_template(template=prompt_template)
-    chain = LLMChain(llm=llm, prompt=prompt, memory=memory)
-    destination_chains[name] = chain
+MODEL_NAME = "gpt-4"
 
 # Create list of string wrapped dictionaries, each dict contains 1 key-value
 # pair, eg {"nutrition": ""Good for ...""}
@@ -84,11 +99,7 @@ destinations = [f"{p['name']}: {p['description']}" for p in prompt_infos]
 # Create a string that contains each "dict" on a new line
 destinations_str = "\n".join(destinations)
 
-# Define default chain
-default_prompt = PromptTemplate.from_template(
-    template="Chat History: {chat_history}\n\nUser Input: {input}"
-)
-default_chain = LLMChain(llm=llm, prompt=default_prompt, memory=memory)
+DEFAULT_TEMPLATE = "Chat History: {chat_history}\n\nUser Input: {input}"
 
 MULTI_PROMPT_ROUTER_TEMPLATE = """Given a raw text input to a
 language model and chat history select the model prompt best suited for the
@@ -127,25 +138,231 @@ router_template = MULTI_PROMPT_ROUTER_TEMPLATE.format(
     destinations=destinations_str
 )
 
-router_output_parser = RouterOutputParser()
-router_prompt = PromptTemplate(
-    template=router_template,
-    input_variables=["input"],
-    output_parser=router_output_parser,
-)
 
-router_chain = LLMRouterChain.from_llm(llm, router_prompt)
+# Tokens of a chat's latest messages given to the LLM; older messages are
+# rolled into a summary
+AI_MEMORY_TOKENS = int(os.environ.get("AI_MEMORY_TOKENS", 1000))
 
-chain = MultiPromptChain(
-    router_chain=router_chain,
-    destination_chains=destination_chains,
-    default_chain=default_chain,
-)
+
+class AIAgent:
+    """
+    The LLM and the routing chain. No conversation is kept here: each call
+    passes the memory of its chat (`load_memory`).
+    """
+
+    def __init__(self) -> None:
+        from langchain_openai import ChatOpenAI
+        from langchain_core.prompts import PromptTemplate
+        from langchain.chains import LLMChain
+        from langchain.chains.router import MultiPromptChain
+        from langchain.chains.router.llm_router import (
+            LLMRouterChain,
+            RouterOutputParser,
+        )
+
+        from macro_mojo.router_chain import LocalRouterChain
+
+        self.llm = ChatOpenAI(model=MODEL_NAME, temperature=0)
+
+        destination_chains = {}
+        for p_info in prompt_infos:
+            prompt = PromptTemplate.from_template(
+                template=p_info["prompt_template"]
+            )
+            destination_chains[p_info["name"]] = LLMChain(
+                llm=self.llm, prompt=prompt
+            )
+
+        default_chain = LLMChain(
+            llm=self.llm,
+            prompt=PromptTemplate.from_template(template=DEFAULT_TEMPLATE),
+        )
+
+        router_prompt = PromptTemplate(
+            template=router_template,
+            input_variables=["input"],
+            output_parser=RouterOutputParser(),
+        )
+        # Most messages are routed without asking the LLM
+        router_chain = LocalRouterChain(
+            llm_router=LLMRouterChain.from_llm(self.llm, router_prompt)
+        )
+
+        self.chain = MultiPromptChain(
+            router_chain=router_chain,
+            destination_chains=destination_chains,
+            default_chain=default_chain,
+        )
+
+
+_agent: Optional[AIAgent] = None
+_agent_lock = threading.Lock()
+
+
+def get_agent() -> AIAgent:
+    """Return the process's `AIAgent`, building it on first use."""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = AIAgent()
+    return _agent
+
+
+def load_memory(
+    chat_memory: ChatMemory,
+) -> "ConversationSummaryBufferMemory":
+    """
+    The assistant's memory of one chat, for a single request: a summary of
+    older messages followed by the latest ones. When saving a turn takes the
+    messages over `AI_MEMORY_TOKENS`, the oldest are rolled into the summary
+    by the LLM.
+    """
+    from langchain.memory import summary_buffer
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    message_types = {"human": HumanMessage, "ai": AIMessage}
+    memory = summary_buffer.ConversationSummaryBufferMemory(
+        llm=get_agent().llm,
+        max_token_limit=AI_MEMORY_TOKENS,
+        memory_key="chat_history",
+        input_key="input",
+        moving_summary_buffer=chat_memory.summary,
+    )
+    memory.chat_memory.add_messages(
+        [
+            message_types[role](content=text)
+            for role, text in chat_memory.messages
+        ]
+    )
+    return memory
+
+
+def dump_memory(memory: "ConversationSummaryBufferMemory") -> ChatMemory:
+    """The memory to store with the chat after a request."""
+    return ChatMemory(
+        memory.moving_summary_buffer,
+        tuple(
+            (message.type, message.content)
+            for message in memory.chat_memory.messages
+        ),
+    )
+
+
+# Answers are cached per model and prompts; see `macro_mojo.ai_cache`
+CACHE_NAMESPACE = hashlib.sha256(
+    "\0".join(
+        [MODEL_NAME, MULTI_PROMPT_ROUTER_TEMPLATE]
+        + [p_info["prompt_template"] for p_info in prompt_infos]
+    ).encode("utf-8")
+).hexdigest()
+response_cache = ResponseCache()
+
+
+def _cached_response(
+    memory: "ConversationSummaryBufferMemory", user_input: str
+) -> Tuple[str, Optional[str]]:
+    """Return the cache key and the cached answer, if there is one."""
+    key = cache_key(CACHE_NAMESPACE, user_input, memory.buffer)
+    return key, response_cache.get(key)
+
+
+def _chain_inputs(
+    memory: "ConversationSummaryBufferMemory", user_input: str
+) -> Dict[str, Any]:
+    return {"input": user_input, **memory.load_memory_variables({})}
+
+
+def get_ai_response(
+    user_input: str, memory: "ConversationSummaryBufferMemory"
+) -> str:
+    """Answer `user_input`, and add the turn to `memory`."""
+    key, response = _cached_response(memory, user_input)
+    if response is None:
+        with timed("ai"):
+            result = get_agent().chain.invoke(
+                _chain_inputs(memory, user_input)
+            )
+        response = result["text"]
+        response_cache.set(key, response)
+    with timed("ai_memory"):
+        memory.save_context({"input": user_input}, {"text": response})
+    return response
+
+
+# Used by the ASGI app, so waiting on the LLM doesn't hold a thread
+async def aget_ai_response(
+    user_input: str, memory: "ConversationSummaryBufferMemory"
+) -> str:
+    key, response = _cached_response(memory, user_input)
+    if response is None:
+        with timed("ai"):
+            result = await get_agent().chain.ainvoke(
+                _chain_inputs(memory, user_input)
+            )
+        response = result["text"]
+        response_cache.set(key, response)
+    with timed("ai_memory"):
+        await memory.asave_context({"input": user_input}, {"text": response})
+    return response
+
+
+# Streaming: the router picks the destination chain as `chain` would, then
+# the answer is streamed from that chain's LLM and added to the memory once
+# it is complete
+def _destination(agent: AIAgent, route: Any) -> Any:
+    if route.destination is None:
+        return agent.chain.default_chain
+    return agent.chain.destination_chains[route.destination]
+
+
+def stream_ai_response(
+    user_input: str, memory: "ConversationSummaryBufferMemory"
+) -> Iterator[str]:
+    """Like `get_ai_response`, but yield the answer as it is generated."""
+    key, response = _cached_response(memory, user_input)
+    if response is None:
+        agent = get_agent()
+        route = agent.chain.router_chain.route(
+            _chain_inputs(memory, user_input)
+        )
+        destination = _destination(agent, route)
+        parts = []
+        for chunk in destination.llm.stream(
+            destination.prompt.format_prompt(**route.next_inputs)
+        ):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        response = "".join(parts)
+        response_cache.set(key, response)
+    else:
+        yield response
+    memory.save_context({"input": user_input}, {"text": response})
 
 
-def get_ai_response(user_input: str) -> str:
-    result = chain.invoke({"input": user_input})
-    return result["text"]
+async def astream_ai_response(
+    user_input: str, memory: "ConversationSummaryBufferMemory"
+) -> AsyncIterator[str]:
+    key, response = _cached_response(memory, user_input)
+    if response is None:
+        agent = get_agent()
+        route = await agent.chain.router_chain.aroute(
+            _chain_inputs(memory, user_input)
+        )
+        destination = _destination(agent, route)
+        parts = []
+        async for chunk in destination.llm.astream(
+            destination.prompt.format_prompt(**route.next_inputs)
+        ):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        response = "".join(parts)
+        response_cache.set(key, response)
+    else:
+        yield response
+    await memory.asave_context({"input": user_input}, {"text": response})
 
 
 def get_ai_welcome_message() -> str:
@@ -0,0 +1,174 @@
+"""
+Cache of AI assistant responses.
+
+Responses are keyed on the user's message, normalized so that e.g.
+"Female, 30, 65 kg" and "female 30 65kg" match, and on a hash of the
+conversation so far, since the same message can need a different answer
+later in a conversation. A namespace (the model and prompts) is part of the
+key, so changing either starts a fresh cache.
+
+There are two tiers: an in-memory `LRUCache` per process, and a SQLite file
+shared by the processes on the node. Both expire entries after `ttl`
+seconds. `stats` counts hits per tier and misses.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+
+from macro_mojo.cache import LRUCache
+
+AI_CACHE_SIZE = int(os.environ.get("AI_CACHE_SIZE", 1024))
+AI_CACHE_TTL = float(os.environ.get("AI_CACHE_TTL", 24 * 60 * 60))
+# Empty to keep only the in-memory tier
+AI_CACHE_PATH = os.environ.get(
+    "AI_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "macro_mojo_ai_cache.sqlite3"),
+)
+# Expired rows are deleted from the disk tier once every this many writes
+PURGE_EVERY = 100
+
+# Numbers (with decimals) and words; everything else separates tokens
+_TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)?|[^\W\d_]+")
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+"""
+
+
+def normalize_input(text: str) -> str:
+    """
+    Lowercase words and numbers separated by single spaces, so case,
+    punctuation and spacing (including "65kg" against "65 kg") don't matter.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(_TOKEN_PATTERN.findall(text))
+
+
+def cache_key(namespace: str, user_input: str, conversation: str) -> str:
+    conversation_hash = hashlib.sha256(conversation.encode("utf-8"))
+    return hashlib.sha256(
+        "\0".join(
+            [
+                namespace,
+                normalize_input(user_input),
+                conversation_hash.hexdigest(),
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        maxsize: int = AI_CACHE_SIZE,
+        ttl: float = AI_CACHE_TTL,
+        path: Optional[str] = AI_CACHE_PATH,
+    ) -> None:
+        self.ttl = ttl
+        self.path = path or None
+        self._memory: LRUCache[str] = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        # Opened on first use by each process, as SQLite connections can't
+        # be shared across a fork
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid = 0
+        self._writes = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk(self) -> sqlite3.Connection:
+        # Called with `_lock` held
+        if self._connection is None or self._connection_pid != os.getpid():
+            assert self.path is not None
+            connection = sqlite3.connect(
+                self.path, timeout=1.0, check_same_thread=False
+            )
+            # Readers in other processes don't wait for a writer
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(CREATE_TABLE)
+            connection.commit()
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if self.path is None:
+            return None
+        with self._lock:
+            try:
+                row = (
+                    self._disk()
+                    .execute(
+                        "SELECT response FROM responses "
+                        "WHERE key = ? AND expires_at > ?",
+                        (key, time.time()),
+                    )
+                    .fetchone()
+                )
+            except sqlite3.Error:
+                # A locked or broken cache file is only a miss
+                return None
+        return row[0] if row else None
+
+    def get(self, key: str) -> Optional[str]:
+        response = self._memory.get(key)
+        if response is not None:
+            return response
+
+        response = self._read_disk(key)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._memory.set(key, response)
+        return response
+
+    def set(self, key: str, response: str) -> None:
+        self._memory.set(key, response)
+        if self.path is None:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                connection = self._disk()
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO responses "
+                        "(key, response, expires_at) VALUES (?, ?, ?)",
+                        (key, response, now + self.ttl),
+                    )
+                    self._writes += 1
+                    if self._writes % PURGE_EVERY == 0:
+                        connection.execute(
+                            "DELETE FROM responses WHERE expires_at <= ?",
+                            (now,),
+                        )
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        memory = self._memory.stats()
+        with self._lock:
+            disk_hits = self.disk_hits
+            misses = self.misses
+        hits = memory["hits"] + disk_hits
+        lookups = hits + misses
+        return {
+            "memory_hits": memory["hits"],
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_size": memory["size"],
+        }
@@ -0,0 +1,460 @@
+"""
+Async counterpart of `DatabasePersistence` for the ASGI app (`asgi.py`).
+
+Method names, arguments and return values match `DatabasePersistence`; every
+method is a coroutine, and the export reads are async generators. Queries
+come from `macro_mojo.queries` and results are shaped by the same helpers,
+so the two backends return identical data.
+
+Connections come from a psycopg 3 `AsyncConnectionPool`, so a request that
+is waiting on the database (or the LLM) only holds a connection, not a
+thread or worker process.
+"""
+
+from contextlib import asynccontextmanager
+
+import asyncio
+import time
+from psycopg import AsyncConnection, AsyncCursor
+from psycopg.rows import tuple_row
+from psycopg_pool import AsyncConnectionPool
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+from macro_mojo import instrumentation, queries
+from macro_mojo.chat_history import (
+    CHAT_HISTORY_MAX_MESSAGES,
+    CHAT_HISTORY_TTL,
+    Chat,
+    ChatMemory,
+    Message,
+    decode_history,
+    decode_memory,
+    encode_history,
+    encode_memory,
+)
+from macro_mojo.db_persistence import (
+    EXPORT_ITERSIZE,
+    _targets_cache,
+    _user_id_cache,
+    daily_totals_page_from_rows,
+    day_snapshot_from_rows,
+    keyset_page,
+    nutrition_entry_values,
+    remaining,
+)
+from macro_mojo.passwords import (
+    PasswordCheck,
+    PasswordVerifier,
+    verify_password,
+)
+from macro_mojo.rows import (
+    DailyTotal,
+    NutritionEntry,
+    R,
+    Remaining,
+    Targets,
+    row_factory,
+)
+
+
+class AsyncDatabasePersistence:
+    def __init__(
+        self,
+        dsn: Optional[str] = None,
+        pool: Optional[AsyncConnectionPool] = None,
+        verifier: Optional[PasswordVerifier] = None,
+    ) -> None:
+        # `dsn` is 'data source name'
+        self._dsn = dsn
+        self._pool = pool
+        self._verifier = verifier
+        # As in `DatabasePersistence`, queries are prepared on first use on
+        # pooled connections. psycopg 3 keeps track of the prepared
+        # statements itself; `None` leaves its default (prepare after a few
+        # executions) for connections opened for one query.
+        self._prepare = True if pool is not None else None
+        # Seconds spent getting the current connection, recorded with the
+        # next query (see `instrumentation`)
+        self._connection_wait = 0.0
+
+    def _take_connection_wait(self) -> float:
+        wait, self._connection_wait = self._connection_wait, 0.0
+        return wait
+
+    @asynccontextmanager
+    async def _database_connect(self) -> AsyncIterator[AsyncConnection]:
+        """
+        Borrow a connection from the pool if one was provided; otherwise open
+        a PostgreSQL connection using explicit DSN if provided, falling back
+        to default.
+        Each use runs in its own transaction: committed on success, rolled
+        back on error.
+        """
+        started = time.perf_counter()
+        if self._pool is not None:
+            async with self._pool.connection() as connection:
+                self._connection_wait = time.perf_counter() - started
+                yield connection
+            return
+
+        connection = await AsyncConnection.connect(
+            self._dsn or "dbname=macro_mojo"
+        )
+        self._connection_wait = time.perf_counter() - started
+        # Commits or rolls back, then closes the connection
+        async with connection:
+            yield connection
+
+    async def _execute(
+        self, cursor: AsyncCursor, name: str, parameters: Any
+    ) -> None:
+        """Run the registry query `name`, timed by name."""
+        with instrumentation.timed_query(
+            name, self._take_connection_wait()
+        ) as record:
+            await cursor.execute(
+                queries.REGISTRY[name], parameters, prepare=self._prepare
+            )
+            record.rows = cursor.rowcount
+
+    # Rows are built as `row_type` by the cursor, or left as tuples
+    async def _fetchone(
+        self, name: str, parameters: Any, row_type: Optional[Type[R]] = None
+    ) -> Any:
+        async with self._database_connect() as connection:
+            async with connection.cursor(
+                row_factory=row_factory(row_type) if row_type else tuple_row
+            ) as cursor:
+                await self._execute(cursor, name, parameters)
+                return await cursor.fetchone()
+
+    async def _fetchall(
+        self, name: str, parameters: Any, row_type: Optional[Type[R]] = None
+    ) -> List[Any]:
+        async with self._database_connect() as connection:
+            async with connection.cursor(
+                row_factory=row_factory(row_type) if row_type else tuple_row
+            ) as cursor:
+                await self._execute(cursor, name, parameters)
+                return await cursor.fetchall()
+
+    async def find_login(self, username: str, password: str) -> Optional[int]:
+        """Return the user's id if the credentials are valid, else `None`."""
+        user_row = await self._fetchone("find_login", (username,))
+        if user_row:
+            user_id, hashed_pwd = user_row
+            check = await self._check_password(password, hashed_pwd)
+            if check.matches:
+                if check.new_hash is not None:
+                    async with self._database_connect() as connection:
+                        async with connection.cursor() as cursor:
+                            await self._execute(
+                                cursor,
+                                "update_password_hash",
+                                (check.new_hash, user_id, hashed_pwd),
+                            )
+                _user_id_cache.set(username, user_id)
+                return user_id
+
+        return None
+
+    async def _check_password(
+        self, password: str, hashed_pwd: str
+    ) -> PasswordCheck:
+        """Raises `VerifierBusy` if the verifier has no free slot."""
+        if self._verifier is None:
+            # bcrypt is deliberately slow; keep it off the event loop
+            return await asyncio.to_thread(
+                verify_password, password, hashed_pwd
+            )
+        return await self._verifier.verify_async(password, hashed_pwd)
+
+    async def find_user_id(self, username: str) -> Optional[int]:
+        """Resolve a username to its id, using the process-wide cache."""
+        user_id = _user_id_cache.get(username)
+        if user_id is None:
+            user_row = await self._fetchone("find_user_id", (username,))
+            user_id = user_row[0] if user_row else None
+            if user_id is not None:
+                _user_id_cache.set(username, user_id)
+        return user_id
+
+    async def daily_total_nutrition(
+        self, user_id: int, date: str
+    ) -> Optional[DailyTotal]:
+        return await self._fetchone(
+            "daily_total_nutrition", (user_id, date), DailyTotal
+        )
+
+    async def get_nutrition_left(
+        self, user_id: int, date: str
+    ) -> Optional[Remaining]:
+        user_targets = await self.get_user_targets(user_id)
+        daily_total = await self.daily_total_nutrition(user_id, date)
+        return remaining(user_targets, daily_total)
+
+    async def get_daily_nutrition(
+        self, user_id: int, date: str
+    ) -> List[NutritionEntry]:
+        return await self._fetchall(
+            "daily_nutrition", (user_id, date), NutritionEntry
+        )
+
+    async def get_day_snapshot(
+        self,
+        user_id: int,
+        date: str,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        per_page: int = 5,
+    ) -> Dict[str, Any]:
+        cursor_id, _, _ = keyset_page(before, after)
+        query = queries.page_query_name("day_snapshot", before, after)
+        parameters = {
+            "user_id": user_id,
+            "date": date,
+            "cursor_id": cursor_id,
+            "limit": per_page,
+        }
+        return day_snapshot_from_rows(await self._fetchall(query, parameters))
+
+    async def get_user_targets(self, user_id: int) -> Optional[Targets]:
+        """The user's targets, from the process-wide cache when possible."""
+        generation = _targets_cache.generation(user_id)
+        cached = _targets_cache.get(user_id)
+        if cached is not None:
+            return cached
+        user_targets = await self._fetchone(
+            "user_targets", (user_id,), Targets
+        )
+        if user_targets is not None:
+            _targets_cache.set(user_id, user_targets, generation)
+        return user_targets
+
+    async def update_user_targets(
+        self,
+        user_id: int,
+        new_calorie_target: str,  # New targets come from HTML forms as str
+        new_protein_target: str,
+        new_fat_target: str,
+        new_carb_target: str,
+    ) -> None:
+        parameters = (
+            int(new_calorie_target),
+            int(new_protein_target),
+            int(new_fat_target),
+            int(new_carb_target),
+            user_id,
+        )
+        async with self._database_connect() as connection:
+            async with connection.cursor() as cursor:
+                await self._execute(cursor, "update_user_targets", parameters)
+        _targets_cache.invalidate(user_id)
+
+    async def get_user_all_nutrition(self, user_id: int) -> List[DailyTotal]:
+        return await self._fetchall(
+            "user_all_nutrition", (user_id,), DailyTotal
+        )
+
+    # Export reads use a server-side (named) cursor, as in
+    # `DatabasePersistence._iter_rows`
+    async def _iter_rows(
+        self, name: str, parameters: Any, row_type: Type[R]
+    ) -> AsyncIterator[R]:
+        async with self._database_connect() as connection:
+            async with connection.cursor(
+                name=name, row_factory=row_factory(row_type)
+            ) as cursor:
+                cursor.itersize = EXPORT_ITERSIZE
+                # Timed until the caller stops iterating
+                with instrumentation.timed_query(
+                    name, self._take_connection_wait()
+                ) as record:
+                    await cursor.execute(queries.REGISTRY[name], parameters)
+                    async for row in cursor:
+                        record.rows += 1
+                        yield row
+
+    def iter_nutrition_entries(
+        self, user_id: int
+    ) -> AsyncIterator[NutritionEntry]:
+        return self._iter_rows(
+            "export_nutrition_entries", (user_id,), NutritionEntry
+        )
+
+    def iter_daily_totals(self, user_id: int) -> AsyncIterator[DailyTotal]:
+        return self._iter_rows("export_daily_totals", (user_id,), DailyTotal)
+
+    async def get_daily_totals_page(
+        self,
+        user_id: int,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        per_page: int = 5,
+    ) -> Dict[str, Any]:
+        cursor_date, _, _ = keyset_page(before, after)
+        query = queries.page_query_name("daily_totals_page", before, after)
+        parameters = {
+            "user_id": user_id,
+            "cursor_date": cursor_date,
+            "limit": per_page,
+        }
+        return daily_totals_page_from_rows(
+            await self._fetchall(query, parameters)
+        )
+
+    async def add_nutrition_entry(
+        self,
+        user_id: int,
+        date: str,
+        calories: str,  # Values come from HTML forms as str
+        protein: str,
+        fat: str,
+        carbs: str,
+        meal: str,
+    ) -> None:
+        (values,) = nutrition_entry_values(
+            user_id,
+            [
+                {
+                    "date": date,
+                    "calories": calories,
+                    "protein": protein,
+                    "fat": fat,
+                    "carbs": carbs,
+                    "meal": meal,
+                }
+            ],
+        )
+        async with self._database_connect() as connection:
+            async with connection.cursor() as cursor:
+                await self._execute(cursor, "add_nutrition_entry", values)
+
+    # psycopg 3 sends `executemany` batches in pipeline mode, so the batch
+    # costs about one round trip rather than one per row
+    async def add_nutrition_entries(
+        self, user_id: int, rows: List[Dict[str, Any]]
+    ) -> int:
+        """Return the number of entries added."""
+        values = nutrition_entry_values(user_id, rows)
+        if not values:
+            return 0
+
+        async with self._database_connect() as connection:
+            async with connection.cursor() as cursor:
+                with instrumentation.timed_query(
+                    "add_nutrition_entries", self._take_connection_wait()
+                ) as record:
+                    await cursor.executemany(
+                        queries.ADD_NUTRITION_ENTRY, values
+                    )
+                    record.rows = len(values)
+
+        return len(values)
+
+    async def copy_nutrition_entries(
+        self, user_id: int, rows: Iterable[Tuple[Any, ...]]
+    ) -> int:
+        """Return the number of entries added."""
+        async with self._database_connect() as connection:
+            async with connection.cursor() as cursor:
+                with instrumentation.timed_query(
+                    "copy_nutrition_entries", self._take_connection_wait()
+                ) as record:
+                    async with cursor.copy(
+                        queries.COPY_NUTRITION_ENTRIES
+                    ) as copy:
+                        for row in rows:
+                            await copy.write_row((user_id, *row))
+                    copied = record.rows = cursor.rowcount
+
+        return copied
+
+    async def find_nutrition_entry(
+        self, user_id: int, nutrition_entry_id: int, date: str
+    ) -> Optional[NutritionEntry]:
+        return await self._fetchone(
+            "find_nutrition_entry",
+            (nutrition_entry_id, user_id, date),
+            NutritionEntry,
+        )
+
+    async def update_nutrition_entry(
+        self,
+        user_id: int,
+        nutrition_entry_id: int,
+        date: str,
+        calories: str,
+        protein: str,
+        fat: str,
+        carbs: str,
+        meal: str,
+    ) -> bool:
+        """Return `False` if the user has no entry with this id and date."""
+        updated = await self._fetchone(
+            "update_nutrition_entry",
+            (
+                int(calories),
+                int(protein),
+                int(fat),
+                int(carbs),
+                meal,
+                nutrition_entry_id,
+                user_id,
+                date,
+            ),
+        )
+        return updated is not None
+
+    async def delete_nutrition_entry(
+        self, user_id: int, nutrition_entry_id: int, date: str
+    ) -> bool:
+        """Return `False` if the user has no entry with this id and date."""
+        deleted = await self._fetchone(
+            "delete_nutrition_entry", (nutrition_entry_id, user_id, date)
+        )
+        return deleted is not None
+
+    async def get_chat_history(
+        self, chat_id: str, user_id: int, ttl: int = CHAT_HISTORY_TTL
+    ) -> Chat:
+        chat_row = await self._fetchone(
+            "load_chat_history", (chat_id, user_id, ttl)
+        )
+        if not chat_row:
+            return Chat([], ChatMemory())
+        return Chat(decode_history(chat_row[0]), decode_memory(chat_row[1]))
+
+    async def save_chat_history(
+        self,
+        chat_id: str,
+        user_id: int,
+        history: List[Message],
+        memory: ChatMemory,
+        max_messages: int = CHAT_HISTORY_MAX_MESSAGES,
+    ) -> None:
+        parameters = (
+            chat_id,
+            user_id,
+            encode_history(history, max_messages),
+            encode_memory(memory),
+        )
+        async with self._database_connect() as connection:
+            async with connection.cursor() as cursor:
+                await self._execute(cursor, "save_chat_history", parameters)
+
+    async def delete_chat_history(self, chat_id: str, user_id: int) -> None:
+        async with self._database_connect() as connection:
+            async with connection.cursor() as cursor:
+                await self._execute(
+                    cursor, "delete_chat_history", (chat_id, user_id)
+                )
@@ -0,0 +1,184 @@
+from collections import OrderedDict
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+V = TypeVar("V")
+# A cached value with its expiry time (or `None`) and generation
+_Entry = Tuple[V, Optional[float], int]
+
+# One unsigned 64-bit counter per slot
+_GENERATION = struct.Struct("Q")
+
+
+class SharedGenerations:
+    """
+    Generation counters for cache keys, kept in a memory-mapped file so that
+    every process on the node (e.g. each gunicorn worker) sees the same
+    counters. Bumping a key's generation invalidates the values cached for it
+    in all of them. Keys are hashed into a fixed number of slots, so keys
+    sharing a slot are invalidated together.
+    """
+
+    def __init__(self, path: str, slots: int = 4096) -> None:
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        self.path = path
+        self._slots = slots
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def _mapping(self) -> Tuple[int, mmap.mmap]:
+        # Opened on first use, so importing a module that creates a table
+        # doesn't touch the file system
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    size = self._slots * _GENERATION.size
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    if os.fstat(fd).st_size < size:
+                        os.ftruncate(fd, size)
+                    self._fd = fd
+                    self._map = mmap.mmap(fd, size)
+        assert self._fd is not None
+        return self._fd, self._map
+
+    def _offset(self, key: Hashable) -> int:
+        # `hash()` of strings differs between processes, CRC-32 doesn't
+        slot = zlib.crc32(repr(key).encode("utf-8")) % self._slots
+        return slot * _GENERATION.size
+
+    def get(self, key: Hashable) -> int:
+        _, mapping = self._mapping()
+        return _GENERATION.unpack_from(mapping, self._offset(key))[0]
+
+    def bump(self, key: Hashable) -> None:
+        fd, mapping = self._mapping()
+        offset = self._offset(key)
+        # The file lock makes the increment atomic across processes
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            (generation,) = _GENERATION.unpack_from(mapping, offset)
+            _GENERATION.pack_into(mapping, offset, generation + 1)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class LRUCache(Generic[V]):
+    """
+    Thread-safe, size-bounded cache that evicts the least recently used key
+    once `maxsize` keys are stored.
+
+    With `ttl`, values expire that many seconds after they are set. With
+    `generations`, a value is only returned while its key's generation is
+    the one passed to `set`, and `invalidate` bumps the generation for every
+    process sharing the table.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        ttl: Optional[float] = None,
+        generations: Optional[SharedGenerations] = None,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._generations = generations
+        self._data: "OrderedDict[Hashable, _Entry[V]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    def generation(self, key: Hashable) -> int:
+        """
+        Current generation of `key`. Read it before loading a value and pass
+        it to `set`, so a value loaded while another process invalidated the
+        key is never returned.
+        """
+        if self._generations is None:
+            return 0
+        return self._generations.get(key)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        generation = self.generation(key)
+        with self._lock:
+            try:
+                value, expires_at, value_generation = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            if value_generation != generation:
+                del self._data[key]
+                self.invalidated += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self, key: Hashable, value: V, generation: Optional[int] = None
+    ) -> None:
+        if generation is None:
+            generation = self.generation(key)
+        expires_at = (
+            time.monotonic() + self._ttl if self._ttl is not None else None
+        )
+        with self._lock:
+            self._data[key] = (value, expires_at, generation)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop `key` here and, with `generations`, in every process."""
+        if self._generations is not None:
+            self._generations.bump(key)
+        self.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self._maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+            }
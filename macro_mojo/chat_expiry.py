@@ -0,0 +1,93 @@
+"""
+Delete AI assistant chats that haven't been updated for `CHAT_HISTORY_TTL`
+seconds.
+
+Expired chats are no longer loaded, but their rows stay in `chat_history`
+until this runs. Run it daily, e.g. from cron. Rows are deleted in batches,
+each in its own transaction, so saving chats isn't blocked for long.
+
+    python -m macro_mojo.chat_expiry [--ttl SECONDS] [--batch-size N]
+"""
+
+from dotenv import load_dotenv
+
+import argparse
+import logging
+import os
+import psycopg2
+from psycopg2 import extensions
+
+from macro_mojo.chat_history import CHAT_HISTORY_TTL
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+logger = logging.getLogger(__name__)
+
+# Rows deleted per transaction
+EXPIRE_BATCH_SIZE = 1000
+
+# Uses `chat_history_updated_at_idx` from migration 0007. Rows locked by a
+# chat being saved are skipped; they are no longer expired once it commits.
+EXPIRE_CHAT_HISTORY_QUERY = """
+    DELETE FROM chat_history
+    WHERE chat_id IN (
+        SELECT chat_id
+        FROM chat_history
+        WHERE updated_at < NOW() - make_interval(secs => %(ttl)s)
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    )
+"""
+
+
+def expire_chat_history(
+    connection: extensions.connection,
+    ttl: int = CHAT_HISTORY_TTL,
+    batch_size: int = EXPIRE_BATCH_SIZE,
+) -> int:
+    """Delete chats older than `ttl` seconds; return how many."""
+    deleted = 0
+    while True:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    EXPIRE_CHAT_HISTORY_QUERY,
+                    {"ttl": ttl, "batch_size": batch_size},
+                )
+                batch = cursor.rowcount
+        deleted += batch
+        if batch < batch_size:
+            return deleted
+
+
+def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+    parser = argparse.ArgumentParser(
+        description="Delete expired AI assistant chats"
+    )
+    parser.add_argument(
+        "--ttl",
+        type=int,
+        default=int(os.getenv("CHAT_HISTORY_TTL", CHAT_HISTORY_TTL)),
+        help="seconds a chat is kept after its last message (default: "
+        "CHAT_HISTORY_TTL, or 30 days)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EXPIRE_BATCH_SIZE,
+        help=f"rows deleted per transaction (default: {EXPIRE_BATCH_SIZE})",
+    )
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(os.getenv("DATABASE_URL"))
+    try:
+        deleted = expire_chat_history(connection, args.ttl, args.batch_size)
+        logger.info("Deleted %d expired chat(s)", deleted)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Chat history with the AI assistant, kept in the `chat_history` table rather
+than in the session cookie. The cookie only carries the chat's id
+(`session["chat_id"]`), and only the AI assistant routes read the history.
+
+History is stored as zlib-compressed JSON, and only the latest
+`max_messages` messages are kept. A chat not updated for `CHAT_HISTORY_TTL`
+seconds is no longer loaded, and `python -m macro_mojo.chat_expiry` deletes
+it.
+
+Alongside the history shown to the user, each chat has a `ChatMemory`: what
+the assistant is given of the conversation. It is bounded by a token budget
+rather than a message count (see `ai_agent.load_memory`).
+"""
+
+import json
+import secrets
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Messages kept per chat, including the assistant's
+CHAT_HISTORY_MAX_MESSAGES = 50
+# Seconds a chat is kept after its last message: 30 days
+CHAT_HISTORY_TTL = 30 * 24 * 60 * 60
+
+# {"sender": username or "ai_agent", "text": ...}
+Message = Dict[str, str]
+
+
+class ChatMemory(NamedTuple):
+    # Summary of the messages that no longer fit the token budget
+    summary: str = ""
+    # ("human" or "ai", text), oldest first
+    messages: Tuple[Tuple[str, str], ...] = ()
+
+
+class Chat(NamedTuple):
+    history: List[Message]
+    memory: ChatMemory
+
+
+def new_chat_id() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def encode_history(
+    history: List[Message], max_messages: int = CHAT_HISTORY_MAX_MESSAGES
+) -> bytes:
+    kept = history[-max_messages:] if max_messages > 0 else []
+    return zlib.compress(
+        json.dumps(kept, separators=(",", ":")).encode("utf-8")
+    )
+
+
+def decode_history(data: bytes) -> List[Message]:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def encode_memory(memory: ChatMemory) -> bytes:
+    return zlib.compress(
+        json.dumps(memory._asdict(), separators=(",", ":")).encode("utf-8")
+    )
+
+
+def decode_memory(data: Optional[bytes]) -> ChatMemory:
+    if data is None:
+        return ChatMemory()
+    memory = json.loads(zlib.decompress(data).decode("utf-8"))
+    return ChatMemory(
+        memory["summary"],
+        tuple((role, text) for role, text in memory["messages"]),
+    )
+
+
+def sse_event(event: str, data: str) -> str:
+    """A Server-Sent Event; `data` is JSON encoded, so it is one line."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
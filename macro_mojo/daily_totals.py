@@ -0,0 +1,137 @@
+"""
+Verify and rebuild the `daily_totals` rollup against `nutrition`.
+
+Triggers keep the rollup in sync with every write, so a rebuild is only
+needed after loading data with triggers disabled or to repair drift found by
+`verify`.
+
+    python -m macro_mojo.daily_totals [--user-id 1] [--rebuild]
+"""
+
+from dotenv import load_dotenv
+
+import argparse
+import logging
+import os
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import DictCursor
+import sys
+from typing import Any, Dict, List, Optional
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+logger = logging.getLogger(__name__)
+
+# Days whose stored totals differ from the sums of their entries, including
+# days missing from either side. `%(user_id)s` is `NULL` to check every user.
+VERIFY_QUERY = """
+    WITH expected AS (
+        SELECT user_id, "date", SUM(calories) AS calories,
+               SUM(protein) AS protein, SUM(fat) AS fat,
+               SUM(carbs) AS carbs, COUNT(*) AS entry_count
+        FROM nutrition
+        WHERE %(user_id)s::integer IS NULL OR user_id = %(user_id)s
+        GROUP BY user_id, "date"
+    ),
+    stored AS (
+        SELECT user_id, "date", calories, protein, fat, carbs, entry_count
+        FROM daily_totals
+        WHERE %(user_id)s::integer IS NULL OR user_id = %(user_id)s
+    )
+    SELECT COALESCE(expected.user_id, stored.user_id) AS user_id,
+           COALESCE(expected.date, stored.date) AS date,
+           ROW(expected.calories, expected.protein, expected.fat,
+               expected.carbs, expected.entry_count)::text AS expected,
+           ROW(stored.calories, stored.protein, stored.fat,
+               stored.carbs, stored.entry_count)::text AS stored
+    FROM expected
+    FULL OUTER JOIN stored
+                 ON stored.user_id = expected.user_id
+                AND stored.date = expected.date
+    WHERE ROW(expected.calories, expected.protein, expected.fat,
+              expected.carbs, expected.entry_count)
+          IS DISTINCT FROM
+          ROW(stored.calories, stored.protein, stored.fat,
+              stored.carbs, stored.entry_count)
+    ORDER BY 1, 2
+"""
+
+REBUILD_QUERIES = [
+    # Blocks writes to `nutrition`, but not reads, until the rebuild commits
+    "LOCK TABLE nutrition IN SHARE ROW EXCLUSIVE MODE",
+    """DELETE FROM daily_totals
+       WHERE %(user_id)s::integer IS NULL OR user_id = %(user_id)s""",
+    """INSERT INTO daily_totals
+                   (user_id, "date", calories, protein, fat, carbs,
+                    entry_count)
+       SELECT user_id, "date", SUM(calories), SUM(protein), SUM(fat),
+              SUM(carbs), COUNT(*)
+       FROM nutrition
+       WHERE %(user_id)s::integer IS NULL OR user_id = %(user_id)s
+       GROUP BY user_id, "date"
+    """,
+]
+
+
+def verify(
+    connection: extensions.connection, user_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Return the days whose rollup row doesn't match their entries."""
+    with connection:
+        with connection.cursor(cursor_factory=DictCursor) as cursor:
+            cursor.execute(VERIFY_QUERY, {"user_id": user_id})
+            results = cursor.fetchall()
+    return [dict(result) for result in results]
+
+
+def rebuild(
+    connection: extensions.connection, user_id: Optional[int] = None
+) -> None:
+    """Recompute the rollup from `nutrition` in a single transaction."""
+    with connection:
+        with connection.cursor() as cursor:
+            for query in REBUILD_QUERIES:
+                cursor.execute(query, {"user_id": user_id})
+
+
+def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+    parser = argparse.ArgumentParser(
+        description="Verify or rebuild the daily_totals rollup"
+    )
+    parser.add_argument(
+        "--user-id", type=int, help="only this user (default: all users)"
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="recompute the rollup from nutrition, then verify it",
+    )
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(os.getenv("DATABASE_URL"))
+    try:
+        if args.rebuild:
+            logger.info("Rebuilding daily totals")
+            rebuild(connection, args.user_id)
+        mismatches = verify(connection, args.user_id)
+    finally:
+        connection.close()
+
+    for mismatch in mismatches:
+        logger.warning(
+            "User %s on %s: expected %s, stored %s",
+            mismatch["user_id"],
+            mismatch["date"],
+            mismatch["expected"],
+            mismatch["stored"],
+        )
+    if mismatches:
+        sys.exit(1)
+    logger.info("Daily totals match nutrition entries")
+
+
+if __name__ == "__main__":
+    main()
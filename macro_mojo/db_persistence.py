@@ -1,218 +1,479 @@
 from contextlib import contextmanager
 
-import bcrypt
-import logging
+import csv
+import io
+import os
 import psycopg2
-from psycopg2.extras import DictCursor
-from typing import List, Optional, Any, Iterator, Dict
-
-LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
-# Configure logging messages. Log INFO messages and higher severity messages
-logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
-logger = logging.getLogger(__name__)
+import tempfile
+import time
+from psycopg2.extras import execute_values
+from typing import (
+    List,
+    Optional,
+    Any,
+    Iterable,
+    Iterator,
+    Dict,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from macro_mojo import instrumentation, queries
+from macro_mojo.cache import LRUCache, SharedGenerations
+from macro_mojo.chat_history import (
+    CHAT_HISTORY_MAX_MESSAGES,
+    CHAT_HISTORY_TTL,
+    Chat,
+    ChatMemory,
+    Message,
+    decode_history,
+    decode_memory,
+    encode_history,
+    encode_memory,
+)
+from macro_mojo.db_pool import ConnectionPool, ReplicaPools
+from macro_mojo.passwords import (
+    PasswordCheck,
+    PasswordVerifier,
+    verify_password,
+)
+from macro_mojo.prepared import PreparedStatements
+from macro_mojo.rows import (
+    NO_DAILY_TOTAL,
+    NO_REMAINING,
+    DailyTotal,
+    NutritionEntry,
+    R,
+    Remaining,
+    Targets,
+)
+
+# Usernames never change, so ids resolved for sessions that predate storing
+# `user_id` in the session can be cached for the life of the process
+USER_ID_CACHE_SIZE = 1024
+_user_id_cache: LRUCache[int] = LRUCache(maxsize=USER_ID_CACHE_SIZE)
+
+# Targets change only through `update_user_targets`, which invalidates the
+# user's entry in every worker on the node through a shared generations
+# file. The TTL bounds how long a change made elsewhere (another node, or
+# `psql`) can go unseen.
+TARGETS_CACHE_SIZE = 4096
+TARGETS_CACHE_TTL = 300.0
+TARGETS_GENERATIONS_PATH = os.environ.get(
+    "TARGETS_GENERATIONS_PATH",
+    os.path.join(tempfile.gettempdir(), "macro_mojo_targets_generations"),
+)
+_targets_cache: LRUCache[Targets] = LRUCache(
+    maxsize=TARGETS_CACHE_SIZE,
+    ttl=TARGETS_CACHE_TTL,
+    generations=SharedGenerations(TARGETS_GENERATIONS_PATH),
+)
+
+# Registry queries, prepared once per pooled connection
+_prepared_statements = PreparedStatements(queries.REGISTRY)
+
+# Rows per multi-row INSERT statement in `add_nutrition_entries`
+BULK_INSERT_PAGE_SIZE = 1000
+# Characters sent to the server per chunk by `copy_nutrition_entries`
+COPY_CHUNK_SIZE = 64 * 1024
+# Rows fetched per round trip by the server-side cursors used for export
+EXPORT_ITERSIZE = 2000
+
+
+class _CopySource:
+    """
+    Read-only file-like object over an iterator of rows, formatted as CSV on
+    demand. `copy_expert` reads it in chunks, so only about one chunk of rows
+    is held in memory however many rows the iterator produces.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[Any, ...]]) -> None:
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        # Every field is quoted, so an empty meal is read as an empty string
+        # rather than NULL
+        self._writer = csv.writer(
+            self._buffer, quoting=csv.QUOTE_ALL, lineterminator="\n"
+        )
+        self._pending = ""
+
+    def read(self, size: int = -1) -> str:
+        chunk_size = size if size > 0 else COPY_CHUNK_SIZE
+        while len(self._pending) < chunk_size:
+            self._buffer.seek(0)
+            self._buffer.truncate()
+            for row in self._rows:
+                self._writer.writerow(row)
+                if self._buffer.tell() >= chunk_size:
+                    break
+            formatted = self._buffer.getvalue()
+            if not formatted:
+                break
+            self._pending += formatted
+
+        chunk = self._pending[:chunk_size]
+        self._pending = self._pending[chunk_size:]
+        return chunk
+
+
+def keyset_page(
+    before: Optional[Any], after: Optional[Any]
+) -> Tuple[Optional[Any], str, str]:
+    """
+    Return the cursor, comparison operator and sort direction for a keyset
+    page. `before` pages towards older rows and `after` towards newer ones.
+    A page is always fetched starting next to the cursor, so `after` pages
+    are read in ascending order and re-sorted newest first by the caller.
+    """
+    if before is not None:
+        return before, "<", "DESC"
+    if after is not None:
+        return after, ">", "ASC"
+    return None, "", "DESC"
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit and miss counters of this process's caches."""
+    return {
+        "user_ids": _user_id_cache.stats(),
+        "targets": _targets_cache.stats(),
+    }
+
+
+def remaining(
+    user_targets: Optional[Targets], daily_total: Optional[DailyTotal]
+) -> Optional[Remaining]:
+    # `None` for a day without entries, as there are no totals to subtract
+    if user_targets is None or daily_total is None:
+        return None
+    return Remaining(
+        user_targets.calorie_target - daily_total.calories,
+        user_targets.protein_target - daily_total.protein,
+        user_targets.fat_target - daily_total.fat,
+        user_targets.carb_target - daily_total.carbs,
+    )
+
+
+def day_snapshot_from_rows(results: List[Sequence[Any]]) -> Dict[str, Any]:
+    # Every row repeats the day's totals; rows without an entry come from
+    # a day (or page) with no entries. See `queries.day_snapshot`.
+    total_columns, left_columns, entry_columns = queries.DAY_SNAPSHOT_COLUMNS
+    first = results[0] if results else None
+    daily_total = (
+        DailyTotal._make(first[total_columns]) if first else NO_DAILY_TOTAL
+    )
+    return {
+        "entry_count": daily_total.entry_count,
+        "daily_total": daily_total,
+        "nutrition_left": (
+            Remaining._make(first[left_columns]) if first else NO_REMAINING
+        ),
+        "entries": [
+            NutritionEntry._make(result[entry_columns])
+            for result in results
+            if result[entry_columns.start] is not None
+        ],
+    }
+
+
+def daily_totals_page_from_rows(
+    results: List[Sequence[Any]],
+) -> Dict[str, Any]:
+    # Each row is `day_count` then a `DailyTotal`; see
+    # `queries.daily_totals_page`
+    return {
+        "day_count": results[0][0] if results else 0,
+        "days": [
+            DailyTotal._make(result[1:])
+            for result in results
+            if result[1] is not None
+        ],
+    }
+
+
+def nutrition_entry_values(
+    user_id: int, rows: List[Dict[str, Any]]
+) -> List[Tuple[Any, ...]]:
+    """Insert parameters for a validated batch of entries."""
+    return [
+        (
+            user_id,
+            row.get("meal") or "",
+            row["date"],
+            int(row["calories"]),
+            int(row["protein"]),
+            int(row["fat"]),
+            int(row["carbs"]),
+        )
+        for row in rows
+    ]
 
 
 class DatabasePersistence:
-    def __init__(self, dsn: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        dsn: Optional[str] = None,
+        pool: Optional[ConnectionPool] = None,
+        replicas: Optional[ReplicaPools] = None,
+        read_from_primary: bool = False,
+        verifier: Optional[PasswordVerifier] = None,
+    ) -> None:
         # `dsn` is 'data source name'
         self._dsn = dsn
+        self._pool = pool
+        # Password checks run in the verifier's process pool if given,
+        # otherwise in the calling thread
+        self._verifier = verifier
+        # Read-only methods use a replica when there is a healthy one, unless
+        # `read_from_primary` is set, e.g. because the user wrote something
+        # moments ago and a replica may not have it yet
+        self._replicas = replicas
+        self.read_from_primary = read_from_primary
+        # Set by the first write; later reads through this object then go to
+        # the primary too
+        self.wrote = False
+        # Seconds spent getting the current connection, recorded with the
+        # next query (see `instrumentation`)
+        self._connection_wait = 0.0
+
+    def _take_connection_wait(self) -> float:
+        wait, self._connection_wait = self._connection_wait, 0.0
+        return wait
 
     @contextmanager
     def _database_connect(self) -> Iterator[psycopg2.extensions.connection]:
         """
-        Open a PostgreSQL connection.
-        Uses explicit DSN if provided; otherwise falls back to environment or
-        default.
+        Borrow a connection from the pool if one was provided; otherwise open
+        a PostgreSQL connection using explicit DSN if provided, falling back
+        to default.
+        Each use runs in its own transaction: committed on success, rolled
+        back on error.
         """
-        logger.info(
-            "Connecting to database using %s",
-            "DSN" if self._dsn else "default dbname=macro_mojo",
-        )
+        started = time.perf_counter()
+        if self._pool is not None:
+            with self._pool.connection() as connection:
+                self._connection_wait = time.perf_counter() - started
+                with connection:
+                    yield connection
+            return
+
         connection = (
             psycopg2.connect(self._dsn)
             if self._dsn
             else psycopg2.connect(dbname="macro_mojo")
         )
+        self._connection_wait = time.perf_counter() - started
         try:
             with connection:
                 yield connection
         finally:
             connection.close()
 
-    def find_login(self, username: str, password: str) -> bool:
-        query = "SELECT * FROM users WHERE username = %s"
-        logger.info("Executing query: %s with username %s", query, username)
+    @contextmanager
+    def _read_connect(self) -> Iterator[psycopg2.extensions.connection]:
+        """
+        Connection for a read-only method: a replica's if there is a healthy
+        one and reads aren't pinned to the primary, otherwise the primary's.
+        A replica that fails mid-query is marked down; the error is raised.
+        """
+        replica = None
+        if self._replicas is not None and not self.read_from_primary:
+            started = time.perf_counter()
+            replica = self._replicas.getconn()
+            self._connection_wait = time.perf_counter() - started
+        if replica is None:
+            with self._database_connect() as connection:
+                yield connection
+            return
+
+        index, connection = replica
+        try:
+            with connection:
+                yield connection
+        except psycopg2.OperationalError:
+            self._replicas.mark_down(index)
+            raise
+        finally:
+            self._replicas.putconn(index, connection)
+
+    @contextmanager
+    def _write_connect(self) -> Iterator[psycopg2.extensions.connection]:
+        """Connection to the primary for a method that writes."""
+        self.wrote = self.read_from_primary = True
         with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (username,))
+            yield connection
+
+    def _execute(self, cursor: Any, name: str, parameters: Any) -> None:
+        """
+        Run the registry query `name`. Pooled connections outlive the
+        request, so there the query is prepared on first use and executed
+        by name afterwards; a connection opened for one query runs it as
+        plain SQL. The query is timed by name; see `instrumentation`.
+        """
+        with instrumentation.timed_query(
+            name, self._take_connection_wait()
+        ) as record:
+            if self._pool is not None or self._replicas is not None:
+                _prepared_statements.execute(cursor, name, parameters)
+            else:
+                cursor.execute(queries.REGISTRY[name], parameters)
+            record.rows = cursor.rowcount
+
+    def find_login(self, username: str, password: str) -> Optional[int]:
+        """Return the user's id if the credentials are valid, else `None`."""
+        query = "find_login"
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (username,))
                 user_row = cursor.fetchone()
 
         if user_row:
-            stored_password = user_row["hashed_pwd"].encode("utf-8")
-            is_password_valid = bcrypt.checkpw(
-                password.encode("utf-8"), stored_password
-            )
-            if is_password_valid:
-                return True
-
-        return False
+            user_id, hashed_pwd = user_row
+            check = self._check_password(password, hashed_pwd)
+            if check.matches:
+                if check.new_hash is not None:
+                    self._update_password_hash(
+                        user_id, hashed_pwd, check.new_hash
+                    )
+                _user_id_cache.set(username, user_id)
+                return user_id
+
+        return None
+
+    def _check_password(self, password: str, hashed_pwd: str) -> PasswordCheck:
+        """Raises `VerifierBusy` if the verifier has no free slot."""
+        if self._verifier is None:
+            return verify_password(password, hashed_pwd)
+        return self._verifier.verify(password, hashed_pwd)
+
+    # Store a hash made at the current cost factor after a successful login
+    def _update_password_hash(
+        self, user_id: int, old_hash: str, new_hash: str
+    ) -> None:
+        query = "update_password_hash"
+        with self._write_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (new_hash, user_id, old_hash))
+
+    def find_user_id(self, username: str) -> Optional[int]:
+        """Resolve a username to its id, using the process-wide cache."""
+        user_id = _user_id_cache.get(username)
+        if user_id is None:
+            user_id = self._find_user_id_by_username(username)
+            if user_id is not None:
+                _user_id_cache.set(username, user_id)
+        return user_id
 
     def _find_user_id_by_username(self, username: str) -> Optional[int]:
-        query = "SELECT id FROM users WHERE username = %s"
-        logger.info("Executing query: %s with username %s", query, username)
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (username,))
+        query = "find_user_id"
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (username,))
                 user_row = cursor.fetchone()
 
         if not user_row:
             return None
-        user_id = user_row["id"]
+        (user_id,) = user_row
         return user_id
 
     # Calculate sum of each nutrition parameter for specific date
     def daily_total_nutrition(
-        self, username: str, date: str
-    ) -> Optional[Dict[str, Any]]:
-        user_id = self._find_user_id_by_username(username)
-        query = """
-                SELECT SUM(calories) AS calories, SUM(protein) as protein,
-                       SUM(fat) AS fat, SUM(carbs) AS carbs
-                FROM nutrition
-                WHERE user_id = %s AND date = %s
-                """
-        logger.info(
-            "Executing query: %s with user_d %s and date %s",
-            query,
-            user_id,
-            date,
-        )
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (user_id, date))
+        self, user_id: int, date: str
+    ) -> Optional[DailyTotal]:
+        query = "daily_total_nutrition"
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (user_id, date))
                 daily_total = cursor.fetchone()
 
-        return daily_total
+        return DailyTotal._make(daily_total) if daily_total else None
 
-    # Calculate leftover nutrition by subtracting sum from target
+    # Calculate leftover nutrition by subtracting sum from target. Targets
+    # come from the cache, so only the day's totals are queried.
     def get_nutrition_left(
-        self, username: str, date: str
-    ) -> Optional[Dict[str, Any]]:
-        user_id = self._find_user_id_by_username(username)
-        query = """
-                SELECT (calorie_target - SUM(calories)) AS "Calories left",
-                       (protein_target - SUM(protein)) AS "Protein left",
-                       (fat_target - SUM(fat)) AS "Fat left",
-                       (carb_target - SUM(carbs)) AS "Carbs left"
-                FROM users 
-                LEFT OUTER JOIN targets ON target_id = targets.id
-                LEFT OUTER JOIN nutrition ON nutrition.user_id = users.id
-                WHERE user_id = %s AND date = %s
-                GROUP BY targets.id 
-                """
-        logger.info(
-            "Executing query: %s with user_id %s and date %s",
-            query,
-            user_id,
-            date,
-        )
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (user_id, date))
-                nutrition_left = cursor.fetchone()
-        return nutrition_left
+        self, user_id: int, date: str
+    ) -> Optional[Remaining]:
+        user_targets = self.get_user_targets(user_id)
+        daily_total = self.daily_total_nutrition(user_id, date)
+        return remaining(user_targets, daily_total)
 
     def get_daily_nutrition(
-        self, username: str, date: str
-    ) -> List[Dict[str, Any]]:
-        user_id = self._find_user_id_by_username(username)
+        self, user_id: int, date: str
+    ) -> List[NutritionEntry]:
         # Get all nutrition data, including meals, for specific date
-        query = """
-                SELECT nutrition.id AS "nutrition_entry_id",
-                       TO_CHAR(entered_at, 'HH:MI AM') AS "Added at",
-                       calories AS "Calories",
-                       protein AS "Protein",
-                       fat AS "Fat",
-                       carbs AS "Carbohydrates",
-                       meal AS "Meals or snacks"
-                FROM nutrition  
-                WHERE nutrition.user_id = %s AND "date" = %s
-                ORDER BY entered_at DESC
-                """
-
-        logger.info(
-            "Executing query: %s with user_id %s and date %s",
-            query,
-            user_id,
-            date,
-        )
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (user_id, date))
+        query = "daily_nutrition"
+
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (user_id, date))
                 results = cursor.fetchall()
 
-        daily_nutrition = [dict(result) for result in results]
-        return daily_nutrition
-
-    def get_user_targets(self, username: str) -> Optional[Dict[str, Any]]:
-        user_id = self._find_user_id_by_username(username)
-        query = """SELECT calorie_target, protein_target,
-                          fat_target, carb_target
-                   FROM targets
-                   INNER JOIN users ON target_id = targets.id
-                   WHERE users.id = %s"""
-        logger.info("Executing query: %s with user_id %s", query, user_id)
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (user_id,))
+        return list(map(NutritionEntry._make, results))
+
+    # Totals, nutrition left and one page of entries for a day in a single
+    # query; see `queries.day_snapshot`
+    def get_day_snapshot(
+        self,
+        user_id: int,
+        date: str,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        per_page: int = 5,
+    ) -> Dict[str, Any]:
+        cursor_id, _, _ = keyset_page(before, after)
+        query = queries.page_query_name("day_snapshot", before, after)
+        parameters = {
+            "user_id": user_id,
+            "date": date,
+            "cursor_id": cursor_id,
+            "limit": per_page,
+        }
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, parameters)
+                results = cursor.fetchall()
+
+        return day_snapshot_from_rows(results)
+
+    def get_user_targets(self, user_id: int) -> Optional[Targets]:
+        """The user's targets, from the process-wide cache when possible."""
+        generation = _targets_cache.generation(user_id)
+        cached = _targets_cache.get(user_id)
+        if cached is not None:
+            return cached
+
+        query = "user_targets"
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (user_id,))
                 user_targets = cursor.fetchone()
-        return user_targets
+        if not user_targets:
+            return None
+        targets = Targets._make(user_targets)
+        _targets_cache.set(user_id, targets, generation)
+        return targets
 
     def update_user_targets(
         self,
-        username: str,
+        user_id: int,
         new_calorie_target: str,  # New targets come from HTML forms as str
         new_protein_target: str,
         new_fat_target: str,
         new_carb_target: str,
     ) -> None:
-        user_id = self._find_user_id_by_username(username)
-
         # Convert str to int before database insertion
         calorie_int = int(new_calorie_target)
         protein_int = int(new_protein_target)
         fat_int = int(new_fat_target)
         carb_int = int(new_carb_target)
 
-        query = """
-                UPDATE targets 
-                SET calorie_target = %s,
-                    protein_target = %s,
-                    fat_target = %s,
-                    carb_target = %s
-                WHERE id = (SELECT target_id FROM users
-                            INNER JOIN targets ON target_id = targets.id
-                            WHERE users.id = %s
-                            )
-                """
-        logger.info(
-            """Executing query: %s with
-                    %s as calorie_target,
-                    %s as protein_target,
-                    %s as fat_target,
-                    %s as carb_target,
-                    %s as user_id""",
-            query,
-            new_calorie_target,
-            new_protein_target,
-            new_fat_target,
-            new_carb_target,
-            user_id,
-        )
+        query = "update_user_targets"
 
-        with self._database_connect() as connection:
+        with self._write_connect() as connection:
             with connection.cursor() as cursor:
-                cursor.execute(
+                self._execute(
+                    cursor,
                     query,
                     (
                         calorie_int,
@@ -222,70 +483,103 @@ class DatabasePersistence:
                         user_id,
                     ),
                 )
+        # After the commit, so no worker can cache the old targets again
+        _targets_cache.invalidate(user_id)
 
-    # Sum nutrition parameters for each day
-    def get_user_all_nutrition(self, username: str) -> List[Dict[str, Any]]:
-        user_id = self._find_user_id_by_username(username)
-        query = """SELECT date,
-                          SUM(calories) AS calories,
-                          SUM(protein) AS protein, 
-                          SUM(fat) AS fat,
-                          SUM(carbs) AS carbs
-                FROM users
-                INNER JOIN nutrition ON user_id = users.id
-                WHERE users.id = %s
-                GROUP BY date
-                ORDER BY date DESC
-                """
-
-        logger.info("Executing query: %s with user_id %s", query, user_id)
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (user_id,))
+    # Sums of nutrition parameters for each day, from the `daily_totals`
+    # rollup
+    def get_user_all_nutrition(self, user_id: int) -> List[DailyTotal]:
+        query = "user_all_nutrition"
+
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (user_id,))
                 results = cursor.fetchall()
 
-        user_all_nutrition = [dict(result) for result in results]
-        return user_all_nutrition
+        return list(map(DailyTotal._make, results))
+
+    # Export reads use a server-side (named) cursor, so Postgres keeps the
+    # result set and rows are fetched `EXPORT_ITERSIZE` at a time as the
+    # caller iterates. The pooled connection is held until the generator is
+    # exhausted or closed.
+    def _iter_rows(
+        self, name: str, query: str, parameters: Any, row_type: Type[R]
+    ) -> Iterator[R]:
+        with self._read_connect() as connection:
+            with connection.cursor(name=name) as cursor:
+                cursor.itersize = EXPORT_ITERSIZE
+                # Timed until the caller stops iterating
+                with instrumentation.timed_query(
+                    name, self._take_connection_wait()
+                ) as record:
+                    cursor.execute(query, parameters)
+                    for row in cursor:
+                        record.rows += 1
+                        yield row_type._make(row)  # type: ignore[attr-defined]
+
+    def iter_nutrition_entries(self, user_id: int) -> Iterator[NutritionEntry]:
+        """
+        Yield all of the user's entries, oldest day first and each day's
+        entries newest first, as in the day view. This is the order of the
+        (user_id, date, entered_at DESC) index, so rows stream without a
+        sort.
+        """
+        query = queries.EXPORT_NUTRITION_ENTRIES
+        return self._iter_rows(
+            "export_nutrition_entries", query, (user_id,), NutritionEntry
+        )
+
+    def iter_daily_totals(self, user_id: int) -> Iterator[DailyTotal]:
+        """Yield the user's daily totals, oldest first."""
+        query = queries.EXPORT_DAILY_TOTALS
+        return self._iter_rows(
+            "export_daily_totals", query, (user_id,), DailyTotal
+        )
+
+    # One page of daily sums from the `daily_totals` rollup, plus the number
+    # of days with entries; see `queries.daily_totals_page`
+    def get_daily_totals_page(
+        self,
+        user_id: int,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        per_page: int = 5,
+    ) -> Dict[str, Any]:
+        cursor_date, _, _ = keyset_page(before, after)
+        query = queries.page_query_name("daily_totals_page", before, after)
+        parameters = {
+            "user_id": user_id,
+            "cursor_date": cursor_date,
+            "limit": per_page,
+        }
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, parameters)
+                results = cursor.fetchall()
+
+        return daily_totals_page_from_rows(results)
 
     def add_nutrition_entry(
         self,
+        user_id: int,
         date: str,
-        username: str,
         calories: str,  # Values come from HTML forms as str
         protein: str,
         fat: str,
         carbs: str,
         meal: str,
     ) -> None:
-        user_id = self._find_user_id_by_username(username)
-
         # Convert str to int before database insertion
         calorie_int = int(calories)
         protein_int = int(protein)
         fat_int = int(fat)
         carb_int = int(carbs)
 
-        query_add_nutrition = """
-            INSERT INTO nutrition 
-                        (user_id, meal, date, calories, protein, fat, carbs)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        logger.info(
-            """Executing query: %s with
-                        user_id, meal, date, calories, protein, fat, carbs
-                        %s, %s, %s, %s, %s, %s, %s""",
-            query_add_nutrition,
-            user_id,
-            meal,
-            date,
-            calories,
-            protein,
-            fat,
-            carbs,
-        )
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(
+        query_add_nutrition = "add_nutrition_entry"
+        with self._write_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(
+                    cursor,
                     query_add_nutrition,
                     (
                         user_id,
@@ -298,32 +592,82 @@ class DatabasePersistence:
                     ),
                 )
 
-    def find_nutrition_entry_by_id(
-        self, nutrition_entry_id: int
-    ) -> Optional[Dict[str, Any]]:
-        query = """
-                SELECT * FROM nutrition
-                WHERE id = %s
-                """
-        logger.info(
-            "Executing query: %s with id %s", query, nutrition_entry_id
-        )
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (nutrition_entry_id,))
+    # Insert a validated batch (see `errors_for_nutrition_rows`) in one
+    # transaction. `execute_values` sends multi-row VALUES statements of
+    # `page_size` rows, so a batch costs a few round trips instead of one
+    # per row, and the `daily_totals` trigger runs once per statement.
+    def add_nutrition_entries(
+        self, user_id: int, rows: List[Dict[str, Any]]
+    ) -> int:
+        """Return the number of entries added."""
+        values = nutrition_entry_values(user_id, rows)
+        if not values:
+            return 0
+
+        query = queries.ADD_NUTRITION_ENTRIES
+        with self._write_connect() as connection:
+            with connection.cursor() as cursor:
+                with instrumentation.timed_query(
+                    "add_nutrition_entries", self._take_connection_wait()
+                ) as record:
+                    execute_values(
+                        cursor, query, values, page_size=BULK_INSERT_PAGE_SIZE
+                    )
+                    record.rows = len(values)
+
+        return len(values)
+
+    # Stream rows of (meal, date, calories, protein, fat, carbs) into
+    # `nutrition` with `COPY FROM STDIN` in one transaction. Rows are read
+    # lazily, so the caller can pass a generator over a file of any size.
+    # Rows must already be validated; one bad row fails the whole COPY.
+    def copy_nutrition_entries(
+        self, user_id: int, rows: Iterable[Tuple[Any, ...]]
+    ) -> int:
+        """Return the number of entries added."""
+        query = queries.COPY_NUTRITION_ENTRIES_CSV
+        source = _CopySource((user_id, *row) for row in rows)
+        with self._write_connect() as connection:
+            with connection.cursor() as cursor:
+                with instrumentation.timed_query(
+                    "copy_nutrition_entries", self._take_connection_wait()
+                ) as record:
+                    cursor.copy_expert(query, source, size=COPY_CHUNK_SIZE)
+                    copied = record.rows = cursor.rowcount
+
+        return copied
+
+    # Ownership-scoped lookups and writes: an entry that doesn't exist, an
+    # entry owned by another user and an entry on another date are all "not
+    # found". Each is a single primary key lookup in the date's partition,
+    # independent of the size of the user's history.
+    def find_nutrition_entry(
+        self, user_id: int, nutrition_entry_id: int, date: str
+    ) -> Optional[NutritionEntry]:
+        query = "find_nutrition_entry"
+        with self._read_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(
+                    cursor, query, (nutrition_entry_id, user_id, date)
+                )
                 nutrition_entry = cursor.fetchone()
 
-        return nutrition_entry
+        return (
+            NutritionEntry._make(nutrition_entry) if nutrition_entry else None
+        )
 
     def update_nutrition_entry(
         self,
+        user_id: int,
         nutrition_entry_id: int,
+        date: str,
         calories: str,
         protein: str,
         fat: str,
         carbs: str,
         meal: str,
-    ) -> None:
+    ) -> bool:
+        """Return `False` if the user has no entry with this id and date."""
 
         # Convert str to int before database insertion
         calorie_int = int(calories)
@@ -331,28 +675,11 @@ class DatabasePersistence:
         fat_int = int(fat)
         carb_int = int(carbs)
 
-        query = """
-                UPDATE nutrition
-                SET calories = %s, protein = %s, fat = %s,
-                    carbs = %s, meal = %s
-                WHERE id = %s     
-                """
-        logger.info(
-            """
-                    Executing query: %s with 
-                    calories, protein, fat, carbs, meal, id
-                    %s, %s, %s, %s, %s, %s""",
-            query,
-            calories,
-            protein,
-            fat,
-            carbs,
-            meal,
-            nutrition_entry_id,
-        )
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(
+        query = "update_nutrition_entry"
+        with self._write_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(
+                    cursor,
                     query,
                     (
                         calorie_int,
@@ -361,35 +688,68 @@ class DatabasePersistence:
                         carb_int,
                         meal,
                         nutrition_entry_id,
+                        user_id,
+                        date,
                     ),
                 )
+                updated = cursor.fetchone()
 
-    def delete_nutrition_entry(self, nutrition_entry_id: int) -> None:
-        query = """
-                DELETE FROM nutrition
-                WHERE id = %s
-                """
-        logger.info(
-            "Executing query: %s with id %s", query, nutrition_entry_id
-        )
-        with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (nutrition_entry_id,))
-
-    def get_all_nutrition_entries_ids(self, username: str) -> List[int]:
-        user_id = self._find_user_id_by_username(username)
-        query = """
-                SELECT id FROM nutrition
-                WHERE user_id = %s
-                """
-        logger.info("Executing query: %s with user_id %s", query, user_id)
+        return updated is not None
+
+    def delete_nutrition_entry(
+        self, user_id: int, nutrition_entry_id: int, date: str
+    ) -> bool:
+        """Return `False` if the user has no entry with this id and date."""
+        query = "delete_nutrition_entry"
+        with self._write_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(
+                    cursor, query, (nutrition_entry_id, user_id, date)
+                )
+                deleted = cursor.fetchone()
+
+        return deleted is not None
+
+    # The history is read right after the request that saved it, so it is
+    # read from the primary
+    def get_chat_history(
+        self, chat_id: str, user_id: int, ttl: int = CHAT_HISTORY_TTL
+    ) -> Chat:
+        """Chats last updated more than `ttl` seconds ago are empty."""
+        query = "load_chat_history"
         with self._database_connect() as connection:
-            with connection.cursor(cursor_factory=DictCursor) as cursor:
-                cursor.execute(query, (user_id,))
-                results = cursor.fetchall()
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (chat_id, user_id, ttl))
+                chat_row = cursor.fetchone()
+        if not chat_row:
+            return Chat([], ChatMemory())
+        return Chat(decode_history(chat_row[0]), decode_memory(chat_row[1]))
 
-        nutrition_results = [dict(result) for result in results]
-        all_nutrition_ids = []
-        for item in nutrition_results:
-            all_nutrition_ids.append(item["id"])
-        return all_nutrition_ids
+    def save_chat_history(
+        self,
+        chat_id: str,
+        user_id: int,
+        history: List[Message],
+        memory: ChatMemory,
+        max_messages: int = CHAT_HISTORY_MAX_MESSAGES,
+    ) -> None:
+        """
+        Store the latest `max_messages` messages and the assistant's memory,
+        compressed.
+        """
+        query = "save_chat_history"
+        parameters = (
+            chat_id,
+            user_id,
+            encode_history(history, max_messages),
+            encode_memory(memory),
+        )
+        with self._write_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, parameters)
+
+    def delete_chat_history(self, chat_id: str, user_id: int) -> None:
+        query = "delete_chat_history"
+        with self._write_connect() as connection:
+            with connection.cursor() as cursor:
+                self._execute(cursor, query, (chat_id, user_id))
@@ -0,0 +1,334 @@
+from collections import deque
+from contextlib import contextmanager
+
+import itertools
+import logging
+import os
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+import threading
+import time
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from macro_mojo import queries
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(PoolError):
+    """Raised when no connection became available within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of PostgreSQL connections.
+
+    Connections are opened on demand up to `max_size` and kept open for reuse.
+    When every connection is in use, callers wait up to `timeout` seconds for
+    one to be returned. The pool is fork-safe: a process that inherits it from
+    its parent (e.g. a gunicorn worker forked from a preloaded master) starts
+    with an empty pool of its own.
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str] = None,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+    ) -> None:
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(
+                "Pool sizes must satisfy 0 <= min_size <= max_size, "
+                "max_size >= 1"
+            )
+        # `dsn` is 'data source name'
+        self._dsn = dsn
+        self._min_size = min_size
+        self._max_size = max_size
+        self._timeout = timeout
+        # Connections opened by a parent process. They are never used or
+        # closed in the child: closing them would terminate the parent's
+        # server sessions.
+        self._inherited: List[extensions.connection] = []
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._condition = threading.Condition()
+        self._idle: Deque[extensions.connection] = deque()
+        self._size = 0  # Open connections, idle and in use
+        self._in_use = 0
+        self._filled = False
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._connections_opened = 0
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            self._inherited.extend(self._idle)
+            self._reset()
+
+    def _open_connection(self) -> extensions.connection:
+        connection = (
+            psycopg2.connect(self._dsn)
+            if self._dsn
+            else psycopg2.connect(dbname="macro_mojo")
+        )
+        with self._condition:
+            self._connections_opened += 1
+        return connection
+
+    def _fill(self) -> None:
+        # Open `min_size` connections the first time this process uses the
+        # pool, so the first requests don't all pay for a handshake.
+        with self._condition:
+            if self._filled:
+                return
+            self._filled = True
+            missing = max(self._min_size - self._size, 0)
+            self._size += missing
+
+        opened = []
+        try:
+            for _ in range(missing):
+                opened.append(self._open_connection())
+        finally:
+            with self._condition:
+                self._size -= missing - len(opened)
+                self._idle.extend(opened)
+                self._condition.notify_all()
+
+    def getconn(self) -> extensions.connection:
+        """
+        Borrow a connection, waiting up to `timeout` seconds if the pool is
+        exhausted. Raises `PoolTimeout` if none became available.
+        """
+        self._check_pid()
+        if not self._filled:
+            self._fill()
+
+        wait_started = None
+        with self._condition:
+            while not self._idle and self._size >= self._max_size:
+                now = time.monotonic()
+                if wait_started is None:
+                    wait_started = now
+                    self._waits += 1
+                remaining = self._timeout - (now - wait_started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._record_wait(now - wait_started)
+                    raise PoolTimeout(
+                        f"No database connection available after "
+                        f"{self._timeout} seconds"
+                    )
+                self._condition.wait(remaining)
+
+            if wait_started is not None:
+                self._record_wait(time.monotonic() - wait_started)
+
+            connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                # Reserve a slot before connecting outside of the lock
+                self._size += 1
+            self._in_use += 1
+
+        if connection is None:
+            try:
+                connection = self._open_connection()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._condition.notify()
+                raise
+        return connection
+
+    def putconn(self, connection: extensions.connection) -> None:
+        """
+        Return a borrowed connection. Broken connections are discarded and
+        connections left inside a transaction are rolled back.
+        """
+        if self._pid != os.getpid():
+            # Borrowed in the parent before a fork; not ours to manage
+            return
+
+        discard = connection.closed or (
+            connection.info.transaction_status
+            == extensions.TRANSACTION_STATUS_UNKNOWN
+        )
+        if not discard and (
+            connection.info.transaction_status
+            != extensions.TRANSACTION_STATUS_IDLE
+        ):
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard and not connection.closed:
+            connection.close()
+
+        with self._condition:
+            self._in_use -= 1
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append(connection)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[extensions.connection]:
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def closeall(self) -> None:
+        """Close idle connections. Connections in use are closed on return."""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._filled = False
+        for connection in idle:
+            connection.close()
+
+    def _record_wait(self, wait_time: float) -> None:
+        # Callers hold `self._condition`
+        self._wait_time_total += wait_time
+        self._wait_time_max = max(self._wait_time_max, wait_time)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "pid": self._pid,
+                "max_size": self._max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "connections_opened": self._connections_opened,
+                "waits": self._waits,
+                "wait_time_total": self._wait_time_total,
+                "wait_time_max": self._wait_time_max,
+                "timeouts": self._timeouts,
+            }
+
+
+class ReplicaPools:
+    """
+    One `ConnectionPool` per read replica. `getconn` picks the replicas in
+    turn, skipping any that are down, and returns `None` when none is
+    usable so the caller can read from the primary instead.
+
+    A replica is marked down for `retry_after` seconds when it can't be
+    connected to or is more than `max_lag` seconds behind the primary. The
+    lag is checked on a borrowed connection at most every `check_interval`
+    seconds per replica. A replica whose pool is exhausted for `timeout`
+    seconds is only skipped for that call.
+    """
+
+    def __init__(
+        self,
+        dsns: Sequence[str],
+        min_size: int = 0,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_lag: float = 5.0,
+        check_interval: float = 5.0,
+        retry_after: float = 30.0,
+    ) -> None:
+        if not dsns:
+            raise ValueError("At least one replica DSN is required")
+        self._pools = [
+            ConnectionPool(dsn, min_size, max_size, timeout) for dsn in dsns
+        ]
+        self._max_lag = max_lag
+        self._check_interval = check_interval
+        self._retry_after = retry_after
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+        # Per replica, `time.monotonic()` values
+        self._down_until = [0.0] * len(self._pools)
+        self._checked_at = [float("-inf")] * len(self._pools)
+        self._fallbacks = 0
+
+    def getconn(self) -> Optional[Tuple[int, extensions.connection]]:
+        """
+        Borrow a connection from the next healthy replica. Returns the
+        replica's index, to give back to `putconn`, and the connection.
+        """
+        with self._lock:
+            start = next(self._next)
+        for offset in range(len(self._pools)):
+            index = (start + offset) % len(self._pools)
+            now = time.monotonic()
+            if self._down_until[index] > now:
+                continue
+            pool = self._pools[index]
+            try:
+                connection = pool.getconn()
+            except PoolTimeout:
+                # Busy, not broken
+                continue
+            except psycopg2.Error:
+                logger.warning("Replica %d unavailable", index, exc_info=True)
+                self.mark_down(index)
+                continue
+            if now - self._checked_at[index] >= self._check_interval:
+                if not self._healthy(index, connection):
+                    pool.putconn(connection)
+                    self.mark_down(index)
+                    continue
+                self._checked_at[index] = now
+            return index, connection
+
+        with self._lock:
+            self._fallbacks += 1
+        return None
+
+    def putconn(self, index: int, connection: extensions.connection) -> None:
+        self._pools[index].putconn(connection)
+
+    def mark_down(self, index: int) -> None:
+        """Send no reads to replica `index` for `retry_after` seconds."""
+        self._down_until[index] = time.monotonic() + self._retry_after
+        # Check it again as soon as it's back
+        self._checked_at[index] = float("-inf")
+
+    def _healthy(self, index: int, connection: extensions.connection) -> bool:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(queries.REPLICA_LAG)
+                (lag,) = cursor.fetchone()
+            connection.rollback()
+        except psycopg2.Error:
+            logger.warning("Replica %d failed its health check", index)
+            return False
+        if lag > self._max_lag:
+            logger.warning(
+                "Replica %d is %.1f seconds behind the primary", index, lag
+            )
+            return False
+        return True
+
+    def closeall(self) -> None:
+        for pool in self._pools:
+            pool.closeall()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            fallbacks = self._fallbacks
+        return {
+            "fallbacks": fallbacks,
+            "replicas": [
+                {**pool.stats(), "down": self._down_until[index] > now}
+                for index, pool in enumerate(self._pools)
+            ],
+        }
@@ -0,0 +1,170 @@
+"""
+Export a user's nutrition entries or daily totals as CSV or newline-delimited
+JSON.
+
+Rows are read from a server-side cursor and formatted as they arrive, so
+memory use doesn't depend on the size of the history and the first bytes are
+ready as soon as the first rows are fetched.
+
+    python -m macro_mojo.exporter --username test_user [--data totals]
+        [--format ndjson] [--output history.csv]
+"""
+
+from dotenv import load_dotenv
+
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.rows import DailyTotal, NutritionEntry
+
+if TYPE_CHECKING:
+    from macro_mojo.async_db_persistence import AsyncDatabasePersistence
+
+# Characters buffered before a chunk is yielded. Rows are small, so yielding
+# each one separately would mean one write (and HTTP chunk) per row.
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+# Rows are written in the field order of their row type
+class ExportData(NamedTuple):
+    columns: Sequence[str]
+    # Returns an iterator, or an async iterator for the async backend
+    read: Callable[[Any, int], Any]
+
+
+EXPORTS = {
+    "entries": ExportData(
+        NutritionEntry._fields,
+        lambda storage, user_id: storage.iter_nutrition_entries(user_id),
+    ),
+    "totals": ExportData(
+        DailyTotal._fields,
+        lambda storage, user_id: storage.iter_daily_totals(user_id),
+    ),
+}
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+class _ChunkWriter:
+    """
+    Format rows and group them into chunks of about `EXPORT_CHUNK_SIZE`
+    characters. `write` returns a chunk when one is full, and `flush` returns
+    whatever is left. CSV exports start with a header row.
+    """
+
+    def __init__(self, columns: Sequence[str], file_format: str) -> None:
+        self._columns = columns
+        self._format = file_format
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer, lineterminator="\n")
+        if file_format == "csv":
+            self._csv.writerow(columns)
+
+    def write(self, row: Sequence[Any]) -> Optional[str]:
+        if self._format == "csv":
+            self._csv.writerow(row)
+        else:
+            self._buffer.write(
+                json.dumps(dict(zip(self._columns, map(_json_value, row))))
+                + "\n"
+            )
+        if self._buffer.tell() >= EXPORT_CHUNK_SIZE:
+            return self.flush()
+        return None
+
+    def flush(self) -> str:
+        chunk = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return chunk
+
+
+def export_chunks(
+    storage: DatabasePersistence, user_id: int, data: str, file_format: str
+) -> Iterator[str]:
+    """Yield the export in chunks of about `EXPORT_CHUNK_SIZE` characters."""
+    export = EXPORTS[data]
+    writer = _ChunkWriter(export.columns, file_format)
+    for row in export.read(storage, user_id):
+        chunk = writer.write(row)
+        if chunk:
+            yield chunk
+    chunk = writer.flush()
+    if chunk:
+        yield chunk
+
+
+async def aexport_chunks(
+    storage: "AsyncDatabasePersistence",
+    user_id: int,
+    data: str,
+    file_format: str,
+) -> AsyncIterator[str]:
+    """`export_chunks` for `AsyncDatabasePersistence`."""
+    export = EXPORTS[data]
+    writer = _ChunkWriter(export.columns, file_format)
+    async for row in export.read(storage, user_id):
+        chunk = writer.write(row)
+        if chunk:
+            yield chunk
+    chunk = writer.flush()
+    if chunk:
+        yield chunk
+
+
+def export_filename(username: str, data: str, file_format: str) -> str:
+    extension = "csv" if file_format == "csv" else "jsonl"
+    return f"{username}-{data}.{extension}"
+
+
+def main() -> None:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Export nutrition history as CSV or JSON lines"
+    )
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--data", choices=sorted(EXPORTS), default="entries")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument(
+        "--output", help="file to write (default: standard output)"
+    )
+    args = parser.parse_args()
+
+    storage = DatabasePersistence(dsn=os.getenv("DATABASE_URL"))
+    user_id = storage.find_user_id(args.username)
+    if user_id is None:
+        parser.error(f"no user named {args.username}")
+
+    chunks = export_chunks(storage, user_id, args.data, args.format)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as file:
+            file.writelines(chunks)
+    else:
+        sys.stdout.writelines(chunks)
+
+
+if __name__ == "__main__":
+    main()
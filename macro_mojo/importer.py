@@ -0,0 +1,233 @@
+"""
+Import nutrition history from CSV or newline-delimited JSON files.
+
+Rows are read, validated with the same rules as the entry form and streamed
+into `nutrition` with `COPY FROM STDIN` one at a time, so memory use doesn't
+depend on the size of the file. Invalid rows are skipped and reported by line
+number; valid rows are imported in a single transaction. Files are decoded
+as UTF-8 a line at a time, so a line that isn't UTF-8 or contains a NUL
+character only fails its own row.
+
+CSV files need a header row with `date`, `calories`, `protein`, `fat`, `carbs`
+and optionally `meal`. JSON files have one object per line with the same keys.
+
+    python -m macro_mojo.importer --username test_user history.csv
+"""
+
+from dotenv import load_dotenv
+
+import argparse
+import codecs
+import csv
+import json
+import logging
+import os
+import sys
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.utils import error_for_nutrition_row
+
+if TYPE_CHECKING:
+    from macro_mojo.async_db_persistence import AsyncDatabasePersistence
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    ".csv": "csv",
+    ".json": "ndjson",
+    ".jsonl": "ndjson",
+    ".ndjson": "ndjson",
+}
+# Errors kept for the report; later ones are only counted
+MAX_REPORTED_ERRORS = 100
+
+# (line number, row or `None`, parse error or `None`)
+Record = Tuple[int, Any, Optional[str]]
+
+
+class ImportReport:
+    def __init__(self) -> None:
+        self.rows_read = 0
+        self.rows_imported = 0
+        self.error_count = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def add_error(self, line: int, error: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, error))
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """Return the import format for a file name, or `None` if unsupported."""
+    _, extension = os.path.splitext(filename.lower())
+    return FORMATS.get(extension)
+
+
+def decode_lines(stream: IO[bytes], errors: Dict[int, str]) -> Iterator[str]:
+    """
+    Decode a binary file one line at a time. A line that isn't UTF-8 or
+    contains a NUL character, which PostgreSQL can't store in text, is
+    decoded with replacement characters and its error added to `errors` by
+    line number.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if line_number == 1:
+            line = line.removeprefix(codecs.BOM_UTF8)
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError:
+            errors[line_number] = "Line is not valid UTF-8."
+            text = line.decode("utf-8", errors="replace")
+        if "\x00" in text:
+            errors.setdefault(line_number, "Line contains a NUL character.")
+            text = text.replace("\x00", "\ufffd")
+        yield text
+
+
+def read_csv(file: Iterable[str]) -> Iterator[Record]:
+    reader = csv.DictReader(file)
+    for row in reader:
+        # Short rows fill missing cells with `None` and long rows put extra
+        # cells under the `None` key; drop both so they read as missing
+        yield reader.line_num, {
+            key: value
+            for key, value in row.items()
+            if key is not None and value is not None
+        }, None
+
+
+def read_ndjson(file: Iterable[str]) -> Iterator[Record]:
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError:
+            yield line_number, None, "Line is not valid JSON."
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def read_upload(stream: IO[bytes], file_format: str) -> Iterator[Record]:
+    """
+    Read the records of a binary file. A record with a line that couldn't be
+    decoded gets that line's error; CSV records can span several lines.
+    """
+    line_errors: Dict[int, str] = {}
+    lines = decode_lines(stream, line_errors)
+    previous_line = 0
+    for line, row, error in READERS[file_format](lines):
+        for line_number in range(previous_line + 1, line + 1):
+            if line_number in line_errors:
+                error = line_errors[line_number]
+                break
+        previous_line = line
+        yield line, row, error
+
+
+def valid_rows(
+    records: Iterator[Record], report: ImportReport
+) -> Iterator[Tuple[str, str, int, int, int, int]]:
+    """
+    Yield (meal, date, calories, protein, fat, carbs) for every valid record
+    and add the rest to the report.
+    """
+    for line, row, error in records:
+        report.rows_read += 1
+        error = error or error_for_nutrition_row(row)
+        if error:
+            report.add_error(line, error)
+            continue
+        yield (
+            row.get("meal") or "",
+            row["date"],
+            int(row["calories"]),
+            int(row["protein"]),
+            int(row["fat"]),
+            int(row["carbs"]),
+        )
+
+
+def import_file(
+    storage: DatabasePersistence,
+    user_id: int,
+    stream: IO[bytes],
+    file_format: str,
+) -> ImportReport:
+    report = ImportReport()
+    rows = valid_rows(read_upload(stream, file_format), report)
+    report.rows_imported = storage.copy_nutrition_entries(user_id, rows)
+    return report
+
+
+async def aimport_file(
+    storage: "AsyncDatabasePersistence",
+    user_id: int,
+    stream: IO[bytes],
+    file_format: str,
+) -> ImportReport:
+    """`import_file` for `AsyncDatabasePersistence`."""
+    report = ImportReport()
+    rows = valid_rows(read_upload(stream, file_format), report)
+    report.rows_imported = await storage.copy_nutrition_entries(user_id, rows)
+    return report
+
+
+def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+    parser = argparse.ArgumentParser(
+        description="Import nutrition history from CSV or JSON lines"
+    )
+    parser.add_argument("path")
+    parser.add_argument("--username", required=True)
+    parser.add_argument(
+        "--format",
+        choices=sorted(READERS),
+        help="file format (default: from the file extension)",
+    )
+    args = parser.parse_args()
+
+    file_format = args.format or detect_format(args.path)
+    if file_format is None:
+        parser.error("can't tell the file format; pass --format")
+
+    storage = DatabasePersistence(dsn=os.getenv("DATABASE_URL"))
+    user_id = storage.find_user_id(args.username)
+    if user_id is None:
+        parser.error(f"no user named {args.username}")
+
+    with open(args.path, "rb") as file:
+        report = import_file(storage, user_id, file, file_format)
+
+    for line, error in report.errors:
+        logger.warning("Line %s: %s", line, error)
+    if report.error_count > len(report.errors):
+        logger.warning(
+            "... and %d more errors",
+            report.error_count - len(report.errors),
+        )
+    logger.info(
+        "Imported %d of %d rows", report.rows_imported, report.rows_read
+    )
+    if report.error_count:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Query timing for `DatabasePersistence` and `AsyncDatabasePersistence`.
+
+Every query is recorded by name with its duration, row count and the time
+spent waiting for a database connection:
+
+* in a process-wide histogram per query name (`query_stats`),
+* in totals for the current request (`start_request`, `request_totals`),
+  alongside the time spent in other phases of the request, such as
+  template rendering or the LLM (`timed`),
+* in the log, for slow queries and a random sample of the others. Only the
+  query name and timings are logged, never SQL parameters.
+
+Log records go through a `QueueHandler`, so a request only puts a record on
+a queue and a background thread does the writing (`configure_logging`).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import atexit
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+# Upper bounds of the duration histogram buckets, in milliseconds. Slower
+# queries fall in a final overflow bucket.
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Queries at least this slow are logged as warnings
+SLOW_QUERY_MS = 100.0
+# Fraction of the other queries logged at INFO
+QUERY_LOG_SAMPLE_RATE = 0.0
+
+
+class QueryHistogram:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.connection_wait_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, duration_ms: float, rows: int, wait_ms: float) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.rows += rows
+        self.connection_wait_ms += wait_ms
+        self.buckets[bisect.bisect_left(BUCKETS_MS, duration_ms)] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_ms": self.total_ms,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+            "rows": self.rows,
+            "connection_wait_ms": self.connection_wait_ms,
+            "buckets": dict(zip([*map(str, BUCKETS_MS), "inf"], self.buckets)),
+        }
+
+
+class RequestTotals:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.duration_ms = 0.0
+        self.rows = 0
+        self.connection_wait_ms = 0.0
+        # Milliseconds per phase, e.g. "template" or "ai"
+        self.phases: Dict[str, float] = {}
+        self._phase_starts: Dict[str, float] = {}
+
+    def add_phase(self, phase: str, duration: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration * 1000
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+
+class QueryRecord:
+    """Filled in by the caller of `timed_query`."""
+
+    def __init__(self, name: str, connection_wait: float) -> None:
+        self.name = name
+        self.rows = 0
+        self.connection_wait = connection_wait
+
+
+_histograms: Dict[str, QueryHistogram] = {}
+_histograms_lock = threading.Lock()
+# Each thread (sync app) or task (ASGI app) sees its own request's totals
+_request_totals: ContextVar[Optional[RequestTotals]] = ContextVar(
+    "request_totals", default=None
+)
+_settings = {
+    "slow_query_ms": SLOW_QUERY_MS,
+    "sample_rate": QUERY_LOG_SAMPLE_RATE,
+}
+
+
+def configure(
+    slow_query_ms: Optional[float] = None,
+    sample_rate: Optional[float] = None,
+) -> None:
+    if slow_query_ms is not None:
+        _settings["slow_query_ms"] = slow_query_ms
+    if sample_rate is not None:
+        _settings["sample_rate"] = sample_rate
+
+
+def start_request() -> RequestTotals:
+    """Start counting the queries of the current request."""
+    totals = RequestTotals()
+    _request_totals.set(totals)
+    return totals
+
+
+def request_totals() -> Optional[RequestTotals]:
+    return _request_totals.get()
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """
+    Add the time spent in the block to `phase` of the current request. Does
+    nothing outside a request, or when request timing is turned off.
+    """
+    totals = _request_totals.get()
+    if totals is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        totals.add_phase(phase, time.perf_counter() - started)
+
+
+# For phases that begin and end in separate callbacks, such as the
+# template rendering signals
+def start_phase(phase: str) -> None:
+    totals = _request_totals.get()
+    if totals is not None:
+        totals._phase_starts[phase] = time.perf_counter()
+
+
+def end_phase(phase: str) -> None:
+    totals = _request_totals.get()
+    if totals is not None and phase in totals._phase_starts:
+        started = totals._phase_starts.pop(phase)
+        totals.add_phase(phase, time.perf_counter() - started)
+
+
+def server_timing(totals: RequestTotals) -> str:
+    """`Server-Timing` header value for a request's totals."""
+    metrics = [
+        f'db;dur={totals.duration_ms:.1f};desc="{totals.queries} queries"',
+        f"db-wait;dur={totals.connection_wait_ms:.1f}",
+    ]
+    metrics.extend(
+        f"{phase};dur={duration:.1f}"
+        for phase, duration in sorted(totals.phases.items())
+    )
+    metrics.append(f"total;dur={totals.elapsed_ms():.1f}")
+    return ", ".join(metrics)
+
+
+def access_log_line(
+    method: str, path: str, status: int, totals: RequestTotals
+) -> str:
+    """One JSON object per request, for the access log."""
+    fields = {
+        "method": method,
+        "path": path,
+        "status": status,
+        "duration_ms": round(totals.elapsed_ms(), 1),
+        "queries": totals.queries,
+        "db_ms": round(totals.duration_ms, 1),
+        "db_wait_ms": round(totals.connection_wait_ms, 1),
+        "rows": totals.rows,
+    }
+    for phase, duration in sorted(totals.phases.items()):
+        fields[f"{phase}_ms"] = round(duration, 1)
+    return json.dumps(fields)
+
+
+def record_query(
+    name: str, duration: float, rows: int, connection_wait: float = 0.0
+) -> None:
+    """Record a finished query. Times are in seconds."""
+    duration_ms = duration * 1000
+    wait_ms = connection_wait * 1000
+    rows = max(rows, 0)  # `rowcount` is -1 when unknown
+
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = QueryHistogram()
+        histogram.add(duration_ms, rows, wait_ms)
+
+    totals = _request_totals.get()
+    if totals is not None:
+        totals.queries += 1
+        totals.duration_ms += duration_ms
+        totals.rows += rows
+        totals.connection_wait_ms += wait_ms
+
+    if duration_ms >= _settings["slow_query_ms"]:
+        level = logging.WARNING
+    elif random.random() < _settings["sample_rate"]:
+        level = logging.INFO
+    else:
+        return
+    logger.log(
+        level,
+        "Query %s took %.1f ms, %d rows, %.1f ms waiting for a connection",
+        name,
+        duration_ms,
+        rows,
+        wait_ms,
+    )
+
+
+@contextmanager
+def timed_query(
+    name: str, connection_wait: float = 0.0
+) -> Iterator[QueryRecord]:
+    """
+    Time the block as query `name`. Set `rows` on the yielded record; the
+    query is recorded even if the block raises.
+    """
+    record = QueryRecord(name, connection_wait)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record_query(
+            name,
+            time.perf_counter() - started,
+            record.rows,
+            record.connection_wait,
+        )
+
+
+def query_stats() -> Dict[str, Dict[str, Any]]:
+    """Histogram snapshot for every query recorded by this process."""
+    with _histograms_lock:
+        return {
+            name: histogram.snapshot()
+            for name, histogram in sorted(_histograms.items())
+        }
+
+
+def reset_query_stats() -> None:
+    with _histograms_lock:
+        _histograms.clear()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: Union[int, str] = logging.INFO) -> None:
+    """
+    Send the root logger's records through a queue to a background thread
+    that writes them to standard error. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    # Write out records still on the queue
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener_after_fork() -> None:
+    # The listener thread doesn't survive a fork (e.g. gunicorn --preload),
+    # so the child starts its own on the same queue
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(
+            _listener.queue, *_listener.handlers, respect_handler_level=True
+        )
+        _listener.start()
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
@@ -0,0 +1,138 @@
+"""
+Local routing of AI assistant messages, so most messages skip the LLM call
+that picks the prompt.
+
+`classify` only routes on positive evidence. Words about calorie and
+macronutrient targets, and the details the nutrition prompt asks for (sex,
+age, weight, height, activity level), count towards `nutrition`; words about
+subjects the assistant clearly doesn't cover (the weather, programming,
+films) count towards `off_topic`. Anything else, such as short replies,
+messages about food in general ("what should I eat?"), follow-ups like "I
+walk my dog every morning", or a message with words of both kinds, is left
+to the LLM router with a low confidence.
+
+Routes at or above `INTENT_ROUTER_THRESHOLD` confidence are used as is; the
+others go to the LLM router. `router_stats` counts both, and how often the
+local guess matched the LLM router when it was asked.
+"""
+
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, NamedTuple
+
+from macro_mojo.ai_cache import normalize_input
+
+NUTRITION = "nutrition"
+OFF_TOPIC = "off_topic"
+
+# Above 1 to always ask the LLM router
+INTENT_ROUTER_THRESHOLD = float(os.environ.get("INTENT_ROUTER_THRESHOLD", 0.7))
+
+# Words that are only used when asking about targets
+STRONG_KEYWORDS = frozenset("""
+    calorie calories kcal cal cals macro macros macronutrient macronutrients
+    protein proteins carb carbs carbohydrate carbohydrates nutrition
+    nutritional intake tdee bmr diet
+    """.split())
+# Words for the details the nutrition prompt asks for
+KEYWORDS = frozenset("""
+    fat fats target targets daily weight weigh weighs height tall age old
+    years yo sex female male woman man girl boy activity active sedentary
+    exercise exercises workout workouts train training gym lose losing gain
+    gaining maintain bulk bulking cut cutting muscle kg kgs kilos lb lbs
+    pounds cm ft feet inches
+    """.split())
+# About food, health or the user's day, but not necessarily about targets
+FOOD_WORDS = frozenset("""
+    eat eating food foods meal meals breakfast lunch dinner snack snacks
+    recipe recipes drink sugar vitamin vitamins healthy health fruit
+    vegetables vegetarian vegan walk walks walking run runs running desk
+    job work sit sitting
+    """.split())
+# Subjects the assistant doesn't cover, and that don't come up when
+# describing oneself or one's day
+OFF_TOPIC_KEYWORDS = frozenset("""
+    weather forecast joke jokes python javascript programming coding script
+    software laptop movie movies film films poem poems song songs lyrics
+    stock stocks crypto bitcoin flight flights hotel translate capital
+    quantum brakes
+    """.split())
+
+
+class Intent(NamedTuple):
+    destination: str
+    # Between 0 and 1
+    confidence: float
+
+
+def classify(text: str) -> Intent:
+    score = 0.0
+    off_topic_score = 0.0
+    numbers = 0
+    food = False
+    for token in normalize_input(text).split():
+        if token in STRONG_KEYWORDS:
+            score += 2
+        elif token in KEYWORDS:
+            score += 1
+        elif token in OFF_TOPIC_KEYWORDS:
+            off_topic_score += 2
+        elif token in FOOD_WORDS:
+            food = True
+        elif token[0].isdigit():
+            numbers += 1
+    if score and off_topic_score:
+        # Mixed evidence, e.g. "I write software all day, sedentary"
+        destination = NUTRITION if score >= off_topic_score else OFF_TOPIC
+        return Intent(destination, 0.0)
+    if score:
+        # Numbers next to keywords are likely measurements
+        score += min(numbers, 2) * 0.5 + (0.5 if food else 0)
+        return Intent(NUTRITION, 1 - 0.5**score)
+    if off_topic_score:
+        return Intent(OFF_TOPIC, 1 - 0.5**off_topic_score)
+    if food or numbers:
+        # A question about food, an answer like "30" to a question the
+        # assistant asked, or a follow-up about the user's day
+        return Intent(NUTRITION, 0.0)
+    # No evidence either way: "hi", "thanks!", "I play the piano"
+    return Intent(OFF_TOPIC, 0.0)
+
+
+class RouterStats:
+    """Counts of local routes and of fallbacks to the LLM router."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.local: Counter[str] = Counter()
+        self.fallbacks = 0
+        # Fallbacks where the low-confidence local guess was the LLM's choice
+        self.fallbacks_agreed = 0
+
+    def record_local(self, destination: str) -> None:
+        with self._lock:
+            self.local[destination] += 1
+
+    def record_fallback(self, guess: str, destination: str) -> None:
+        with self._lock:
+            self.fallbacks += 1
+            self.fallbacks_agreed += guess == destination
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            local = sum(self.local.values())
+            routed = local + self.fallbacks
+            return {
+                "local": dict(self.local),
+                "fallbacks": self.fallbacks,
+                "local_rate": local / routed if routed else 0.0,
+                "fallback_agreement": (
+                    self.fallbacks_agreed / self.fallbacks
+                    if self.fallbacks
+                    else 0.0
+                ),
+            }
+
+
+router_stats = RouterStats()
@@ -0,0 +1,200 @@
+"""
+Versioned database migrations.
+
+Migrations are SQL files in `db/migrations` named `<version>_<name>.sql`.
+They are applied in version order, each in its own transaction, and recorded
+in `schema_migrations`, so running migrations again only applies new ones.
+
+    python -m macro_mojo.migrations [--seed]
+"""
+
+from dotenv import load_dotenv
+
+import argparse
+import hashlib
+import logging
+import os
+import psycopg2
+from psycopg2 import extensions
+import re
+from typing import List, NamedTuple
+
+from macro_mojo import partitions
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, "db", "migrations")
+SEED_DATA_PATH = os.path.join(ROOT_DIR, "db", "data.sql")
+
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d+)_(\w+)\.sql$")
+# First line of migrations that can't run inside a transaction block, e.g.
+# `CREATE INDEX CONCURRENTLY`
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+# Arbitrary key for the advisory lock that serializes concurrent runs
+ADVISORY_LOCK_KEY = 4206001
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version integer PRIMARY KEY,
+        name text NOT NULL,
+        checksum text NOT NULL,
+        applied_at timestamp NOT NULL DEFAULT NOW()
+    )
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+    @property
+    def in_transaction(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION_MARKER)
+
+    def __str__(self) -> str:
+        return f"{self.version:04d}_{self.name}"
+
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), "r") as file:
+            migrations.append(
+                Migration(int(match.group(1)), match.group(2), file.read())
+            )
+
+    migrations.sort(key=lambda migration: migration.version)
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def _split_statements(sql: str) -> List[str]:
+    # Statements of no-transaction migrations must run one at a time. They
+    # are split on semicolons that end a line, so keep such migrations to
+    # plain DDL statements.
+    statements = re.split(r";\s*$", sql, flags=re.MULTILINE)
+    return [
+        statement
+        for statement in statements
+        if any(
+            line.strip() and not line.strip().startswith("--")
+            for line in statement.splitlines()
+        )
+    ]
+
+
+def _record_migration(cursor: extensions.cursor, migration: Migration) -> None:
+    cursor.execute(
+        """INSERT INTO schema_migrations (version, name, checksum)
+           VALUES (%s, %s, %s)""",
+        (migration.version, migration.name, migration.checksum),
+    )
+
+
+def apply_migrations(
+    connection: extensions.connection, migrations: List[Migration]
+) -> List[Migration]:
+    """
+    Apply migrations that haven't been applied yet and return them.
+    Raises `MigrationError` if an applied migration's file was changed.
+    """
+    connection.autocommit = True
+    applied_now = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        try:
+            cursor.execute(CREATE_MIGRATIONS_TABLE)
+            cursor.execute("SELECT version, checksum FROM schema_migrations")
+            applied = dict(cursor.fetchall())
+
+            for migration in migrations:
+                if migration.version in applied:
+                    if applied[migration.version] != migration.checksum:
+                        raise MigrationError(
+                            f"Migration {migration} was changed after it "
+                            f"was applied"
+                        )
+                    continue
+
+                logger.info("Applying migration %s", migration)
+                if migration.in_transaction:
+                    cursor.execute("BEGIN")
+                    try:
+                        cursor.execute(migration.sql)
+                        _record_migration(cursor, migration)
+                        cursor.execute("COMMIT")
+                    except Exception:
+                        cursor.execute("ROLLBACK")
+                        raise
+                else:
+                    for statement in _split_statements(migration.sql):
+                        cursor.execute(statement)
+                    _record_migration(cursor, migration)
+                applied_now.append(migration)
+        finally:
+            cursor.execute(
+                "SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,)
+            )
+
+    return applied_now
+
+
+def seed(
+    connection: extensions.connection, path: str = SEED_DATA_PATH
+) -> bool:
+    """Load development data into an empty database. Returns `True` if
+    loaded."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM users)")
+        if cursor.fetchone()[0]:
+            return False
+        with open(path, "r") as file:
+            cursor.execute(file.read())
+    return True
+
+
+def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument(
+        "--seed",
+        action="store_true",
+        help="load db/data.sql if the database has no users",
+    )
+    args = parser.parse_args()
+
+    logger.info("Connecting to database")
+    connection = psycopg2.connect(os.getenv("DATABASE_URL"))
+    try:
+        applied = apply_migrations(connection, discover_migrations())
+        logger.info("Applied %d migration(s)", len(applied))
+        if args.seed and seed(connection):
+            logger.info("Loaded seed data from %s", SEED_DATA_PATH)
+        # Seed data and new installs need this month's partitions
+        created = partitions.create_partitions(connection)
+        logger.info("Created %d partition(s)", created)
+    finally:
+        connection.close()
+        logger.info("Database connection closed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+from typing import Callable, Mapping, Optional, Tuple, Union
+
+from macro_mojo.utils import is_entry_id_in_url_valid
+
+PER_PAGE = 5
+
+
+def parse_page(page_str: Optional[str]) -> Optional[int]:
+    if page_str is None:
+        return 1
+
+    try:
+        page = int(page_str)
+    except ValueError:
+        return None
+
+    return page if page >= 1 else None
+
+
+def is_entry_id(cursor: str) -> bool:
+    # `str.isdigit` alone accepts digits such as "²" that `int` rejects
+    if not (cursor.isascii() and cursor.isdigit()):
+        return False
+    return is_entry_id_in_url_valid(int(cursor))
+
+
+def page_cursor(
+    args: Mapping[str, str],
+    is_cursor_valid: Callable[[str], bool],
+) -> Union[Tuple[int, Optional[str], Optional[str]], bool]:
+    """
+    Read the page number and keyset cursor from the query string. `before`
+    is the last row of the newer page, `after` the first row of the older
+    page. The page number is only displayed, so pages after the first must
+    carry a cursor.
+    """
+    page = parse_page(args.get("page"))
+    before = args.get("before")
+    after = args.get("after")
+    if page is None or (before is not None and after is not None):
+        return False
+
+    cursor = before if before is not None else after
+    if cursor is None:
+        return (page, None, None) if page == 1 else False
+    if not is_cursor_valid(cursor):
+        return False
+
+    return (page, before, after)
+
+
+def paginate(total_items: int, page: int) -> Union[int, bool]:
+    total_pages = (total_items + PER_PAGE - 1) // PER_PAGE
+
+    if page not in range(1, total_pages + 1):
+        return False
+
+    return total_pages
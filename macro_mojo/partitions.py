@@ -0,0 +1,158 @@
+"""
+Create the monthly partitions of `nutrition` ahead of time.
+
+Entries for a month without a partition land in `nutrition_default`, where
+every query on a date has to read them. Run this daily, e.g. from cron, so
+the coming months always have their partitions. Entries already in the
+default partition are moved into the partitions created for them.
+
+    python -m macro_mojo.partitions [--months-ahead 3] [--drop-empty]
+
+With `--drop-empty`, the partitions of past months that have no entries are
+dropped first, each in its own transaction.
+"""
+
+from dotenv import load_dotenv
+
+import argparse
+import logging
+import os
+import psycopg2
+from psycopg2 import extensions
+from typing import List, Tuple
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+logger = logging.getLogger(__name__)
+
+# Months after the current one that get a partition
+PARTITION_MONTHS_AHEAD = 3
+# Arbitrary key for the advisory lock that serializes concurrent runs
+ADVISORY_LOCK_KEY = 4206002
+
+# `nutrition_create_partitions` comes from migration 0009. It also creates
+# the partitions for the months of the entries in the default partition, so
+# they move into their own partitions. Both statements are sent together, so
+# they run in one transaction even on an autocommit connection.
+CREATE_PARTITIONS_QUERY = """
+    SELECT pg_advisory_xact_lock(%(lock_key)s);
+    SELECT nutrition_create_partitions(
+        (CURRENT_DATE + make_interval(months => %(months_ahead)s))::date
+    )
+"""
+
+# Partitions of the months before the current one, oldest first
+PAST_PARTITIONS_QUERY = """
+    SELECT child.relname
+    FROM pg_inherits
+    INNER JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'nutrition'::regclass
+      AND child.relname ~ '^nutrition_\\d{4}_\\d{2}$'
+      AND child.relname < 'nutrition_' || to_char(CURRENT_DATE, 'YYYY_MM')
+    ORDER BY child.relname
+"""
+
+# `nutrition_drop_partition_if_empty` comes from migration 0009
+DROP_PARTITION_IF_EMPTY_QUERY = """
+    SELECT pg_advisory_xact_lock(%(lock_key)s);
+    SELECT nutrition_drop_partition_if_empty(%(partition)s)
+"""
+
+# Partitions with their bounds, oldest first; the default partition last
+LIST_PARTITIONS_QUERY = """
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    INNER JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'nutrition'::regclass
+    ORDER BY child.relname = 'nutrition_default', child.relname
+"""
+
+
+def create_partitions(
+    connection: extensions.connection,
+    months_ahead: int = PARTITION_MONTHS_AHEAD,
+) -> int:
+    """Create missing partitions in one transaction; return how many."""
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                CREATE_PARTITIONS_QUERY,
+                {"lock_key": ADVISORY_LOCK_KEY, "months_ahead": months_ahead},
+            )
+            return cursor.fetchone()[0]
+
+
+def drop_empty_partitions(connection: extensions.connection) -> int:
+    """
+    Drop the partitions of past months that have no entries, one per
+    transaction; return how many.
+    """
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(PAST_PARTITIONS_QUERY)
+            past_partitions = [row[0] for row in cursor.fetchall()]
+
+    dropped = 0
+    for partition in past_partitions:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    DROP_PARTITION_IF_EMPTY_QUERY,
+                    {"lock_key": ADVISORY_LOCK_KEY, "partition": partition},
+                )
+                if cursor.fetchone()[0]:
+                    dropped += 1
+    return dropped
+
+
+def list_partitions(
+    connection: extensions.connection,
+) -> List[Tuple[str, str]]:
+    """Return (partition, bounds) for every partition of `nutrition`."""
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(LIST_PARTITIONS_QUERY)
+            return cursor.fetchall()
+
+
+def main() -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+    parser = argparse.ArgumentParser(
+        description="Create the monthly partitions of nutrition"
+    )
+    parser.add_argument(
+        "--months-ahead",
+        type=int,
+        default=PARTITION_MONTHS_AHEAD,
+        help=f"months after this one to create (default: "
+        f"{PARTITION_MONTHS_AHEAD})",
+    )
+    parser.add_argument(
+        "--drop-empty",
+        action="store_true",
+        help="drop the partitions of past months that have no entries",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="list the partitions after creating them",
+    )
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(os.getenv("DATABASE_URL"))
+    try:
+        if args.drop_empty:
+            dropped = drop_empty_partitions(connection)
+            logger.info("Dropped %d empty partition(s)", dropped)
+        created = create_partitions(connection, args.months_ahead)
+        logger.info("Created %d partition(s)", created)
+        if args.list:
+            for name, bounds in list_partitions(connection):
+                print(f"{name}: {bounds}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Password checks off the request workers.
+
+bcrypt at cost 12 takes about 250 ms of CPU per check. `PasswordVerifier`
+runs checks in a small process pool and bounds how many can be in flight on
+the node: each check holds one of `max_pending` slot files, locked with
+`flock`, so the bound covers every gunicorn worker and is released even if a
+worker dies. When every slot is taken, `verify` raises `VerifierBusy` at
+once instead of queueing, so a login spike can't tie up the workers that
+serve other routes. A check that times out, or whose pool has broken
+because a pool process died, raises `VerifierBusy` too; a broken pool is
+replaced on the next check.
+
+Slot files are named after a namespace, so app instances on one host only
+share a slot budget when they share a namespace (by default, the ones using
+the same database; see `Config.PASSWORD_SLOTS_NAMESPACE`).
+
+A password that matches a hash with a cost below `BCRYPT_ROUNDS` is rehashed
+at that cost in the same check, and the caller stores the new hash.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import asyncio
+import bcrypt
+import fcntl
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from typing import NamedTuple, Optional, Tuple
+
+from macro_mojo import instrumentation
+
+# Cost factor of new hashes; matching hashes with a lower cost are rehashed
+BCRYPT_ROUNDS = 12
+# Checks in flight per node, and processes per app process
+PASSWORD_MAX_PENDING = 4
+PASSWORD_WORKERS = 1
+# Seconds to wait for a check to finish
+PASSWORD_TIMEOUT = 10.0
+SLOTS_DIR = tempfile.gettempdir()
+SLOTS_NAMESPACE = "default"
+
+logger = logging.getLogger(__name__)
+
+
+class VerifierBusy(Exception):
+    """No password check can run right now; try again shortly."""
+
+
+class PasswordCheck(NamedTuple):
+    matches: bool
+    # Hash at `BCRYPT_ROUNDS` to store, if the stored one is weaker
+    new_hash: Optional[str] = None
+
+
+def hash_cost(hashed_pwd: str) -> int:
+    # "$2b$12$<salt and hash>"
+    return int(hashed_pwd.split("$")[2])
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(
+        password.encode("utf-8"), bcrypt.gensalt(rounds)
+    ).decode("utf-8")
+
+
+def check_password(
+    password: str, hashed_pwd: str, rounds: int = BCRYPT_ROUNDS
+) -> PasswordCheck:
+    """Check a password, rehashing it if its hash is below `rounds`."""
+    if not bcrypt.checkpw(
+        password.encode("utf-8"), hashed_pwd.encode("utf-8")
+    ):
+        return PasswordCheck(False)
+    if hash_cost(hashed_pwd) < rounds:
+        return PasswordCheck(True, hash_password(password, rounds))
+    return PasswordCheck(True)
+
+
+def verify_password(
+    password: str, hashed_pwd: str, rounds: int = BCRYPT_ROUNDS
+) -> PasswordCheck:
+    """`check_password` in the calling thread, timed as "bcrypt"."""
+    with instrumentation.timed("bcrypt"):
+        return check_password(password, hashed_pwd, rounds)
+
+
+class _Slot:
+    """A locked slot file; closing its descriptor releases the lock."""
+
+    def __init__(self, fd: int) -> None:
+        self._fd: Optional[int] = fd
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        # Called once the caller has the result, and again by the future's
+        # callback, which may run later
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+class PasswordVerifier:
+    def __init__(
+        self,
+        workers: int = PASSWORD_WORKERS,
+        max_pending: int = PASSWORD_MAX_PENDING,
+        timeout: float = PASSWORD_TIMEOUT,
+        rounds: int = BCRYPT_ROUNDS,
+        slots_dir: str = SLOTS_DIR,
+        namespace: str = SLOTS_NAMESPACE,
+    ) -> None:
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.rounds = rounds
+        self._slot_paths = [
+            os.path.join(
+                slots_dir, f"macro_mojo_bcrypt.{namespace}.{slot}.lock"
+            )
+            for slot in range(max_pending)
+        ]
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.failed = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created on first use, so each gunicorn worker starts its own after
+        # fork. The pool's processes come from a fork server rather than a
+        # fork of this process, which has logging and pool threads running.
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("forkserver"),
+                    )
+        return self._executor
+
+    def _unavailable(
+        self, executor: ProcessPoolExecutor, error: Exception
+    ) -> VerifierBusy:
+        """
+        Count a check that timed out or whose pool broke, dropping a broken
+        pool so the next check starts a new one.
+        """
+        with self._lock:
+            self.failed += 1
+            broken = isinstance(error, BrokenProcessPool)
+            if broken and self._executor is executor:
+                self._executor = None
+        if broken:
+            logger.warning("Password check pool broke: %s", error)
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            logger.warning("Password check timed out after %ss", self.timeout)
+        return VerifierBusy(f"Password check failed: {error!r}")
+
+    def _acquire_slot(self) -> _Slot:
+        """Lock a free slot file."""
+        for path in self._slot_paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return _Slot(fd)
+        with self._lock:
+            self.rejected += 1
+        raise VerifierBusy(
+            f"All {self.max_pending} password check slots are in use"
+        )
+
+    def _submit(
+        self, password: str, hashed_pwd: str
+    ) -> Tuple[ProcessPoolExecutor, "Future[PasswordCheck]", _Slot]:
+        """
+        Start a check in the pool. Raises `VerifierBusy` without waiting if
+        every slot is taken or the pool is broken. The slot is held until the
+        check finishes, even if the caller stops waiting for it.
+        """
+        slot = self._acquire_slot()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(
+                check_password, password, hashed_pwd, self.rounds
+            )
+        except BrokenProcessPool as error:
+            slot.release()
+            raise self._unavailable(executor, error) from error
+        except BaseException:
+            slot.release()
+            raise
+        future.add_done_callback(lambda _: slot.release())
+        return executor, future, slot
+
+    def verify(self, password: str, hashed_pwd: str) -> PasswordCheck:
+        with instrumentation.timed("bcrypt"):
+            executor, future, slot = self._submit(password, hashed_pwd)
+            try:
+                check = future.result(self.timeout)
+            except (TimeoutError, BrokenProcessPool) as error:
+                raise self._unavailable(executor, error) from error
+        slot.release()
+        return check
+
+    async def verify_async(
+        self, password: str, hashed_pwd: str
+    ) -> PasswordCheck:
+        with instrumentation.timed("bcrypt"):
+            executor, future, slot = self._submit(password, hashed_pwd)
+            try:
+                check = await asyncio.wait_for(
+                    asyncio.wrap_future(future), self.timeout
+                )
+            except (TimeoutError, BrokenProcessPool) as error:
+                raise self._unavailable(executor, error) from error
+        slot.release()
+        return check
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
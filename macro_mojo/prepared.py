@@ -0,0 +1,91 @@
+"""
+Server-side prepared statements for the queries in `queries.REGISTRY`.
+
+Each statement is prepared with `PREPARE <name> AS ...` the first time it is
+run on a connection and with `EXECUTE <name> (...)` from then on, so
+PostgreSQL parses and plans it once per connection instead of on every call.
+Prepared statements last as long as the session, so this pays off on pooled
+connections; a connection opened for a single query would prepare on every
+use.
+"""
+
+import re
+import threading
+import weakref
+from typing import Any, Dict, List, Mapping, Set, Tuple, Union
+
+# `%s`, `%(name)s` or an escaped `%%`
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+class PreparedStatement:
+    """
+    A registry query rewritten for `PREPARE`: `%s` and `%(name)s`
+    placeholders become `$1`, `$2`, ... A named placeholder used several
+    times is one parameter.
+    """
+
+    def __init__(self, name: str, query: str) -> None:
+        if not name.isidentifier():
+            raise ValueError(f"Invalid statement name: {name!r}")
+        self.name = name
+        self._keys: List[Union[int, str]] = []
+
+        def number(match: re.Match) -> str:
+            if match.group(0) == "%%":
+                return "%"
+            key = match.group(1)
+            if key is None:
+                key = len(self._keys)
+            elif key in self._keys:
+                return f"${self._keys.index(key) + 1}"
+            self._keys.append(key)
+            return f"${len(self._keys)}"
+
+        # Sent without parameters, so psycopg2 leaves `%` alone
+        self.body = _PLACEHOLDER.sub(number, query)
+        self.prepare_sql = f"PREPARE {name} AS {self.body}"
+        placeholders = ", ".join(["%s"] * len(self._keys))
+        self.execute_sql = (
+            f"EXECUTE {name} ({placeholders})"
+            if self._keys
+            else f"EXECUTE {name}"
+        )
+
+    def arguments(self, parameters: Any) -> Tuple[Any, ...]:
+        """Order a parameter tuple or mapping as `$1`, `$2`, ..."""
+        if isinstance(parameters, Mapping):
+            return tuple(parameters[key] for key in self._keys)
+        return tuple(parameters or ())
+
+
+class PreparedStatements:
+    """
+    Prepare registry queries on each connection the first time they are
+    run there. Connections are tracked weakly, so closed connections
+    dropped by the pool are forgotten.
+    """
+
+    def __init__(self, registry: Dict[str, str]) -> None:
+        self._statements = {
+            name: PreparedStatement(name, query)
+            for name, query in registry.items()
+        }
+        self._prepared: "weakref.WeakKeyDictionary[Any, Set[str]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> PreparedStatement:
+        return self._statements[name]
+
+    def execute(self, cursor: Any, name: str, parameters: Any) -> None:
+        statement = self._statements[name]
+        with self._lock:
+            prepared = self._prepared.setdefault(cursor.connection, set())
+        if name not in prepared:
+            # `PREPARE` isn't undone by a rollback, so the statement stays
+            # prepared even if this transaction fails later
+            cursor.execute(statement.prepare_sql)
+            prepared.add(name)
+        cursor.execute(statement.execute_sql, statement.arguments(parameters))
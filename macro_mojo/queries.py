@@ -0,0 +1,322 @@
+"""
+SQL for `DatabasePersistence` and `AsyncDatabasePersistence`.
+
+Both backends send the same statements, so they are kept here rather than in
+either class. psycopg2 and psycopg 3 accept the same `%s` and `%(name)s`
+placeholders.
+"""
+
+from typing import Any, Dict
+
+FIND_LOGIN = "SELECT id, hashed_pwd FROM users WHERE username = %s"
+
+FIND_USER_ID = "SELECT id FROM users WHERE username = %s"
+
+# Only replaces the hash that was checked, in case the password changed since
+UPDATE_PASSWORD_HASH = """
+    UPDATE users SET hashed_pwd = %s WHERE id = %s AND hashed_pwd = %s
+"""
+
+DAILY_TOTAL_NUTRITION = """
+    SELECT "date", SUM(calories) AS calories, SUM(protein) AS protein,
+           SUM(fat) AS fat, SUM(carbs) AS carbs, COUNT(*) AS entry_count
+    FROM nutrition
+    WHERE user_id = %s AND date = %s
+    GROUP BY "date"
+"""
+
+DAILY_NUTRITION = """
+    SELECT id, "date", entered_at,
+           calories, protein, fat, carbs, meal
+    FROM nutrition
+    WHERE nutrition.user_id = %s AND "date" = %s
+    ORDER BY entered_at DESC
+"""
+
+USER_TARGETS = """
+    SELECT calorie_target, protein_target,
+           fat_target, carb_target
+    FROM targets
+    INNER JOIN users ON target_id = targets.id
+    WHERE users.id = %s
+"""
+
+UPDATE_USER_TARGETS = """
+    UPDATE targets
+    SET calorie_target = %s,
+        protein_target = %s,
+        fat_target = %s,
+        carb_target = %s
+    WHERE id = (SELECT target_id FROM users
+                INNER JOIN targets ON target_id = targets.id
+                WHERE users.id = %s
+                )
+"""
+
+USER_ALL_NUTRITION = """
+    SELECT date, calories, protein, fat, carbs, entry_count
+    FROM daily_totals
+    WHERE user_id = %s
+    ORDER BY date DESC
+"""
+
+EXPORT_NUTRITION_ENTRIES = """
+    SELECT id, date, entered_at,
+           calories, protein, fat, carbs, meal
+    FROM nutrition
+    WHERE user_id = %s
+    ORDER BY date, entered_at DESC
+"""
+
+EXPORT_DAILY_TOTALS = """
+    SELECT date, calories, protein, fat, carbs, entry_count
+    FROM daily_totals
+    WHERE user_id = %s
+    ORDER BY date
+"""
+
+ADD_NUTRITION_ENTRY = """
+    INSERT INTO nutrition
+                (user_id, meal, date, calories, protein, fat, carbs)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+ADD_NUTRITION_ENTRIES = """
+    INSERT INTO nutrition
+                (user_id, meal, date, calories, protein, fat, carbs)
+                VALUES %s
+"""
+
+# psycopg2 streams CSV text from a file-like object
+COPY_NUTRITION_ENTRIES_CSV = """
+    COPY nutrition (user_id, meal, date, calories, protein, fat, carbs)
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+# psycopg 3 writes rows itself in the default text format
+COPY_NUTRITION_ENTRIES = """
+    COPY nutrition (user_id, meal, date, calories, protein, fat, carbs)
+    FROM STDIN
+"""
+
+FIND_NUTRITION_ENTRY = """
+    SELECT id, date, entered_at,
+           calories, protein, fat, carbs, meal
+    FROM nutrition
+    WHERE id = %s AND user_id = %s AND "date" = %s
+"""
+
+UPDATE_NUTRITION_ENTRY = """
+    UPDATE nutrition
+    SET calories = %s, protein = %s, fat = %s,
+        carbs = %s, meal = %s
+    WHERE id = %s AND user_id = %s AND "date" = %s
+    RETURNING id
+"""
+
+DELETE_NUTRITION_ENTRY = """
+    DELETE FROM nutrition
+    WHERE id = %s AND user_id = %s AND "date" = %s
+    RETURNING id
+"""
+
+# Chats past their time to live may not have been deleted yet
+LOAD_CHAT_HISTORY = """
+    SELECT history, memory
+    FROM chat_history
+    WHERE chat_id = %s
+      AND user_id = %s
+      AND updated_at >= NOW() - make_interval(secs => %s)
+"""
+
+# A chat id belongs to the user who started it
+SAVE_CHAT_HISTORY = """
+    INSERT INTO chat_history (chat_id, user_id, history, memory)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (chat_id) DO UPDATE
+    SET history = EXCLUDED.history,
+        memory = EXCLUDED.memory,
+        updated_at = NOW()
+    WHERE chat_history.user_id = EXCLUDED.user_id
+"""
+
+DELETE_CHAT_HISTORY = """
+    DELETE FROM chat_history WHERE chat_id = %s AND user_id = %s
+"""
+
+# Seconds a read replica is behind the primary. A replica that has replayed
+# everything it received is not behind, however old its last transaction.
+# A server that isn't a replica reports NULL for every function, so 0.
+REPLICA_LAG = """
+    SELECT COALESCE(
+        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             THEN 0
+             ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END,
+        0
+    ) AS lag
+"""
+
+
+# Pages of the day view and dashboard are keyset paginated (see
+# `keyset_page` in `db_persistence`). Only these fixed SQL fragments are
+# interpolated; values are always parameters.
+#
+# `nutrition` is partitioned by month of "date" (see migration 0004), so
+# every query on it filters on "date" to read a single partition. That
+# includes lookups by id, which would otherwise probe every partition's
+# primary key.
+
+
+def day_snapshot(comparison: str, direction: str, has_cursor: bool) -> str:
+    """
+    Totals, nutrition left and one page of entries for a day in a single
+    query. Totals come from the `daily_totals` rollup, so only the entries
+    on the page are read from `nutrition`. Pages are keyset paginated on
+    (entered_at, id); the cursor is the id of the entry next to the page.
+
+    Each row is a `DailyTotal`, a `Remaining` and a `NutritionEntry` (see
+    `macro_mojo.rows`) one after the other; `DAY_SNAPSHOT_COLUMNS` has the
+    slices.
+    """
+    page_condition = (
+        f"""AND (entered_at, id) {comparison} (
+                    SELECT entered_at, id FROM nutrition
+                    WHERE id = %(cursor_id)s AND "date" = %(date)s
+                )"""
+        if has_cursor
+        else ""
+    )
+    return f"""
+        SELECT day_total.date, day_total.calories, day_total.protein,
+               day_total.fat, day_total.carbs,
+               COALESCE(day_total.entry_count, 0) AS entry_count,
+               (calorie_target - day_total.calories) AS calories_left,
+               (protein_target - day_total.protein) AS protein_left,
+               (fat_target - day_total.fat) AS fat_left,
+               (carb_target - day_total.carbs) AS carbs_left,
+               entries.id AS nutrition_entry_id,
+               entries.date AS entry_date,
+               entries.entered_at,
+               entries.calories AS entry_calories,
+               entries.protein AS entry_protein,
+               entries.fat AS entry_fat,
+               entries.carbs AS entry_carbs,
+               entries.meal AS entry_meal
+        FROM (
+            SELECT calorie_target, protein_target,
+                   fat_target, carb_target
+            FROM users
+            INNER JOIN targets ON target_id = targets.id
+            WHERE users.id = %(user_id)s
+        ) AS user_targets
+        LEFT JOIN daily_totals AS day_total
+               ON day_total.user_id = %(user_id)s
+              AND day_total.date = %(date)s
+        LEFT JOIN LATERAL (
+            SELECT id, "date", entered_at,
+                   calories, protein, fat, carbs, meal
+            FROM nutrition
+            WHERE user_id = %(user_id)s AND "date" = %(date)s
+            {page_condition}
+            ORDER BY entered_at {direction}, id {direction}
+            LIMIT %(limit)s
+        ) AS entries ON TRUE
+        ORDER BY entries.entered_at DESC, entries.id DESC
+    """
+
+
+# Column slices of a `day_snapshot` row: `DailyTotal`, `Remaining`,
+# `NutritionEntry`
+DAY_SNAPSHOT_COLUMNS = (slice(0, 6), slice(6, 10), slice(10, 18))
+
+
+def daily_totals_page(
+    comparison: str, direction: str, has_cursor: bool
+) -> str:
+    """
+    One page of daily sums from the `daily_totals` rollup, keyset paginated
+    on date, plus the number of days with entries. Both are read from the
+    rollup's (user_id, date) primary key. After `day_count`, each row is a
+    `DailyTotal` (see `macro_mojo.rows`).
+    """
+    page_condition = (
+        f'AND "date" {comparison} %(cursor_date)s' if has_cursor else ""
+    )
+    return f"""
+        SELECT day_count,
+               days.date, days.calories, days.protein,
+               days.fat, days.carbs, days.entry_count
+        FROM (
+            SELECT COUNT(*) AS day_count
+            FROM daily_totals
+            WHERE user_id = %(user_id)s
+        ) AS history
+        LEFT JOIN LATERAL (
+            SELECT "date", calories, protein, fat, carbs, entry_count
+            FROM daily_totals
+            WHERE user_id = %(user_id)s {page_condition}
+            ORDER BY "date" {direction}
+            LIMIT %(limit)s
+        ) AS days ON TRUE
+        ORDER BY days.date DESC
+    """
+
+
+# Keyset page variants, by suffix: (comparison, direction, has_cursor). The
+# first page has no cursor, `_before` pages towards older rows and `_after`
+# towards newer ones; see `keyset_page` in `db_persistence`.
+KEYSET_PAGES = {
+    "": ("", "DESC", False),
+    "_before": ("<", "DESC", True),
+    "_after": (">", "ASC", True),
+}
+
+
+def page_query_name(name: str, before: Any, after: Any) -> str:
+    """Registry name of the keyset page variant of `name`."""
+    if before is not None:
+        return name + "_before"
+    if after is not None:
+        return name + "_after"
+    return name
+
+
+# Every statement sent with parameters, by name. `DatabasePersistence`
+# prepares them by these names on pooled connections (see
+# `macro_mojo.prepared`), and `python -m macro_mojo.query_plans --dump`
+# explains each of them. The export reads are run through named cursors,
+# which can't use prepared statements, and are listed for auditing. The
+# batch INSERT and COPY templates above have no fixed parameters and are not
+# listed.
+REGISTRY: Dict[str, str] = {
+    "find_login": FIND_LOGIN,
+    "find_user_id": FIND_USER_ID,
+    "update_password_hash": UPDATE_PASSWORD_HASH,
+    "daily_total_nutrition": DAILY_TOTAL_NUTRITION,
+    "daily_nutrition": DAILY_NUTRITION,
+    "user_targets": USER_TARGETS,
+    "update_user_targets": UPDATE_USER_TARGETS,
+    "user_all_nutrition": USER_ALL_NUTRITION,
+    "export_nutrition_entries": EXPORT_NUTRITION_ENTRIES,
+    "export_daily_totals": EXPORT_DAILY_TOTALS,
+    "add_nutrition_entry": ADD_NUTRITION_ENTRY,
+    "find_nutrition_entry": FIND_NUTRITION_ENTRY,
+    "update_nutrition_entry": UPDATE_NUTRITION_ENTRY,
+    "delete_nutrition_entry": DELETE_NUTRITION_ENTRY,
+    "load_chat_history": LOAD_CHAT_HISTORY,
+    "save_chat_history": SAVE_CHAT_HISTORY,
+    "delete_chat_history": DELETE_CHAT_HISTORY,
+}
+REGISTRY.update(
+    {
+        "day_snapshot" + suffix: day_snapshot(*page)
+        for suffix, page in KEYSET_PAGES.items()
+    }
+)
+REGISTRY.update(
+    {
+        "daily_totals_page" + suffix: daily_totals_page(*page)
+        for suffix, page in KEYSET_PAGES.items()
+    }
+)
@@ -0,0 +1,279 @@
+"""
+EXPLAIN-based check that the hot queries in `DatabasePersistence` use the
+indexes created by the migrations.
+
+The queries are captured by running the persistence methods against a
+recording connection, then explained on the real database with sequential
+scans disabled. This checks that an index is usable for each query, not
+which plan the planner prefers for a small development database. `nutrition`
+is partitioned by month, so the index scans name each partition's own index;
+they are mapped back to the index on `nutrition`. Queries on `nutrition` must
+also be pruned to a single partition.
+
+    python -m macro_mojo.query_plans [--user-id 1] [--date 2025-07-28]
+
+With `--dump`, print the generic plan of every query in `queries.REGISTRY`
+instead: the plan a prepared statement uses once PostgreSQL stops planning
+it for each set of parameters. This needs PostgreSQL 16 or later.
+
+    python -m macro_mojo.query_plans --dump
+"""
+
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+import argparse
+import os
+import psycopg2
+from psycopg2 import extensions
+import re
+import sys
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+from macro_mojo import queries
+from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.prepared import PreparedStatement
+
+NUTRITION_USER_DATE_INDEX = "nutrition_user_id_date_entered_at_idx"
+NUTRITION_PRIMARY_KEY = "nutrition_pkey"
+DAILY_TOTALS_PRIMARY_KEY = "daily_totals_pkey"
+
+INDEX_SCAN_NODES = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+NUTRITION_PARTITION_PATTERN = re.compile(r"^nutrition_(\d{4}_\d{2}|default)$")
+
+# Index of every partition, by the partitioned index it belongs to
+PARTITION_INDEXES_QUERY = """
+    SELECT child.relname, parent.relname
+    FROM pg_inherits
+    INNER JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+    INNER JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+    WHERE child.relkind = 'i'
+"""
+
+
+class HotQuery(NamedTuple):
+    label: str
+    run: Callable[[DatabasePersistence, int, str], Any]
+    # The plan must use one of these
+    indexes: Tuple[str, ...]
+
+
+HOT_QUERIES = [
+    HotQuery(
+        "day view, first page",
+        lambda storage, user_id, date: storage.get_day_snapshot(user_id, date),
+        (NUTRITION_USER_DATE_INDEX,),
+    ),
+    HotQuery(
+        "day view, next page",
+        lambda storage, user_id, date: storage.get_day_snapshot(
+            user_id, date, before=1
+        ),
+        (NUTRITION_USER_DATE_INDEX,),
+    ),
+    HotQuery(
+        "dashboard, first page",
+        lambda storage, user_id, date: storage.get_daily_totals_page(user_id),
+        (DAILY_TOTALS_PRIMARY_KEY,),
+    ),
+    HotQuery(
+        "dashboard, next page",
+        lambda storage, user_id, date: storage.get_daily_totals_page(
+            user_id, before=date
+        ),
+        (DAILY_TOTALS_PRIMARY_KEY,),
+    ),
+    HotQuery(
+        "entry lookup",
+        lambda storage, user_id, date: storage.find_nutrition_entry(
+            user_id, 1, date
+        ),
+        # The query has the id and the user's day, so either index finds the
+        # entry; which one the planner picks depends on the statistics
+        (NUTRITION_PRIMARY_KEY, NUTRITION_USER_DATE_INDEX),
+    ),
+]
+
+
+class _RecordingCursor:
+    def __init__(self, recorded: List[Tuple[str, Any]]) -> None:
+        self._recorded = recorded
+        self.rowcount = -1
+
+    def execute(self, query: str, parameters: Any = None) -> None:
+        self._recorded.append((query, parameters))
+
+    def fetchone(self) -> None:
+        return None
+
+    def fetchall(self) -> List[Any]:
+        return []
+
+    def __enter__(self) -> "_RecordingCursor":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        pass
+
+
+class _RecordingConnection:
+    def __init__(self, recorded: List[Tuple[str, Any]]) -> None:
+        self._recorded = recorded
+
+    def cursor(self, *args: Any, **kwargs: Any) -> _RecordingCursor:
+        return _RecordingCursor(self._recorded)
+
+
+class _RecordingPersistence(DatabasePersistence):
+    def __init__(self) -> None:
+        super().__init__()
+        self.recorded: List[Tuple[str, Any]] = []
+
+    @contextmanager
+    def _database_connect(self) -> Iterator[Any]:
+        yield _RecordingConnection(self.recorded)
+
+
+def capture_queries(
+    hot_query: HotQuery, user_id: int, date: str
+) -> List[Tuple[str, Any]]:
+    """Return the (query, parameters) pairs a persistence call executes."""
+    storage = _RecordingPersistence()
+    hot_query.run(storage, user_id, date)
+    return storage.recorded
+
+
+def index_scans(plan: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Walk an `EXPLAIN (FORMAT JSON)` plan and return (relation, index) pairs
+    for every index scan. Bitmap index scans name only the index, so their
+    relation comes from the enclosing bitmap heap scan.
+    """
+    scans = []
+
+    def walk(node: Dict[str, Any], relation: str) -> None:
+        relation = node.get("Relation Name", relation)
+        if node["Node Type"] in INDEX_SCAN_NODES:
+            scans.append((relation, node["Index Name"]))
+        for child in node.get("Plans", []):
+            walk(child, relation)
+
+    walk(plan, "")
+    return scans
+
+
+def partitions_scanned(plan: Dict[str, Any]) -> List[str]:
+    """Names of the `nutrition` partitions a plan reads, in plan order."""
+    partitions = []
+
+    def walk(node: Dict[str, Any]) -> None:
+        relation = node.get("Relation Name", "")
+        if NUTRITION_PARTITION_PATTERN.match(relation):
+            partitions.append(relation)
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan)
+    return partitions
+
+
+def partition_index_parents(
+    connection: extensions.connection,
+) -> Dict[str, str]:
+    """Map the index of each partition to the index it was created from."""
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITION_INDEXES_QUERY)
+        return dict(cursor.fetchall())
+
+
+def explain(
+    connection: extensions.connection, query: str, parameters: Any
+) -> Dict[str, Any]:
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + query, parameters)
+        return cursor.fetchone()[0][0]["Plan"]
+
+
+def check_hot_queries(
+    connection: extensions.connection, user_id: int, date: str
+) -> List[str]:
+    """
+    Return a description of every hot query that misses its index or reads
+    more than one `nutrition` partition.
+    """
+    problems = []
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        parents = partition_index_parents(connection)
+        for hot_query in HOT_QUERIES:
+            for query, parameters in capture_queries(hot_query, user_id, date):
+                plan = explain(connection, query, parameters)
+                indexes = [
+                    parents.get(index, index) for _, index in index_scans(plan)
+                ]
+                if not set(hot_query.indexes) & set(indexes):
+                    expected = " or ".join(hot_query.indexes)
+                    problems.append(
+                        f"{hot_query.label}: expected {expected}, "
+                        f"plan uses {indexes or 'no index'}"
+                    )
+                partitions = partitions_scanned(plan)
+                if len(set(partitions)) > 1:
+                    problems.append(
+                        f"{hot_query.label}: expected one partition, "
+                        f"plan reads {sorted(set(partitions))}"
+                    )
+    return problems
+
+
+def dump_plans(
+    connection: extensions.connection,
+) -> Iterator[Tuple[str, List[str]]]:
+    """Yield (name, plan lines) for every registry query."""
+    with connection:
+        with connection.cursor() as cursor:
+            for name, query in queries.REGISTRY.items():
+                statement = PreparedStatement(name, query)
+                cursor.execute("EXPLAIN (GENERIC_PLAN) " + statement.body)
+                yield name, [row[0] for row in cursor.fetchall()]
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Check that hot queries use their indexes"
+    )
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--date", default="2025-07-28")
+    parser.add_argument(
+        "--dump",
+        action="store_true",
+        help="print the plan of every registry query and exit",
+    )
+    args = parser.parse_args()
+
+    connection = psycopg2.connect(os.getenv("DATABASE_URL"))
+    if args.dump:
+        try:
+            for name, plan in dump_plans(connection):
+                print(f"-- {name}")
+                print("\n".join(plan), end="\n\n")
+        finally:
+            connection.close()
+        return
+
+    try:
+        problems = check_hot_queries(connection, args.user_id, args.date)
+    finally:
+        connection.close()
+
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print(f"All {len(HOT_QUERIES)} hot queries use their indexes")
+
+
+if __name__ == "__main__":
+    main()
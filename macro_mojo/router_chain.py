@@ -0,0 +1,88 @@
+"""
+The router of the AI assistant's `MultiPromptChain`: routes with
+`intent_router.classify` and asks the LLM router only when that isn't
+confident. Imported when the agent is built, as it needs langchain.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.chains.router.base import RouterChain
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForChainRun,
+    CallbackManagerForChainRun,
+)
+
+from macro_mojo.instrumentation import timed
+from macro_mojo.intent_router import (
+    INTENT_ROUTER_THRESHOLD,
+    Intent,
+    classify,
+    router_stats,
+)
+
+
+class LocalRouterChain(RouterChain):
+    """Routes locally when confident, otherwise with `llm_router`."""
+
+    llm_router: RouterChain
+    threshold: float = INTENT_ROUTER_THRESHOLD
+
+    @property
+    def input_keys(self) -> List[str]:
+        return self.llm_router.input_keys
+
+    def _local_route(
+        self, inputs: Dict[str, Any]
+    ) -> Tuple[Intent, Optional[Dict[str, Any]]]:
+        intent = classify(inputs["input"])
+        if intent.confidence < self.threshold:
+            return intent, None
+        router_stats.record_local(intent.destination)
+        return intent, {
+            "destination": intent.destination,
+            "next_inputs": inputs,
+        }
+
+    def _record_fallback(
+        self, intent: Intent, inputs: Dict[str, Any], result: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        # `None` is the LLM router's "DEFAULT"
+        router_stats.record_fallback(
+            intent.destination, str(result["destination"])
+        )
+        # The LLM router only returns the (possibly revised) input; the
+        # other inputs, such as the chat history, go to the destination too
+        return {
+            "destination": result["destination"],
+            "next_inputs": {**inputs, **result["next_inputs"]},
+        }
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        intent, route = self._local_route(inputs)
+        if route is not None:
+            return route
+        callbacks = run_manager.get_child() if run_manager else None
+        with timed("ai_router"):
+            result = self.llm_router.invoke(
+                inputs, config={"callbacks": callbacks}
+            )
+        return self._record_fallback(intent, inputs, result)
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        intent, route = self._local_route(inputs)
+        if route is not None:
+            return route
+        callbacks = run_manager.get_child() if run_manager else None
+        with timed("ai_router"):
+            result = await self.llm_router.ainvoke(
+                inputs, config={"callbacks": callbacks}
+            )
+        return self._record_fallback(intent, inputs, result)
@@ -0,0 +1,62 @@
+"""
+Row types returned by `DatabasePersistence` and `AsyncDatabasePersistence`.
+
+Each is a `NamedTuple`, so a row is a plain tuple with named fields and no
+per-instance `__dict__`. Fields are in the column order of the queries in
+`macro_mojo.queries`, which lets a row be made from the cursor's tuple with
+`_make` instead of going through a dict. Values are as stored; formatting for
+display, such as the time an entry was added, is done in the templates.
+"""
+
+import datetime
+from typing import Any, Callable, NamedTuple, Optional, Sequence, Type, TypeVar
+
+R = TypeVar("R", bound=tuple)
+
+
+class NutritionEntry(NamedTuple):
+    id: int
+    date: datetime.date
+    entered_at: datetime.datetime
+    calories: int
+    protein: int
+    fat: int
+    carbs: int
+    meal: str
+
+
+# Sums of a day's entries. Fields are `None` (and `entry_count` 0) for a
+# day without entries.
+class DailyTotal(NamedTuple):
+    date: Optional[datetime.date]
+    calories: Optional[int]
+    protein: Optional[int]
+    fat: Optional[int]
+    carbs: Optional[int]
+    entry_count: int
+
+
+class Targets(NamedTuple):
+    calorie_target: int
+    protein_target: int
+    fat_target: int
+    carb_target: int
+
+
+# Targets minus a day's totals; negative once a target is exceeded
+class Remaining(NamedTuple):
+    calories: Optional[int]
+    protein: Optional[int]
+    fat: Optional[int]
+    carbs: Optional[int]
+
+
+NO_DAILY_TOTAL = DailyTotal(None, None, None, None, None, 0)
+NO_REMAINING = Remaining(None, None, None, None)
+
+
+def row_factory(
+    row_type: Type[R],
+) -> Callable[[Any], Callable[[Sequence[Any]], R]]:
+    """psycopg 3 `row_factory` building `row_type` rows directly."""
+    return lambda cursor: row_type._make  # type: ignore[attr-defined]
@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Any, Dict, List, Optional
 
 
 def error_for_nutrition_entry(
@@ -33,6 +33,9 @@ def error_for_meal_len(name: str) -> Optional[str]:
         return (
             "Meal or snack name must be less than 100 characters. Try again!"
         )
+    # PostgreSQL can't store NUL characters in text
+    if "\x00" in name:
+        return "Meal or snack name can't contain NUL characters. Try again!"
 
     return None
 
@@ -57,7 +60,68 @@ def error_for_targets(
     return None
 
 
+NUTRITION_ROW_FIELDS = ("date", "calories", "protein", "fat", "carbs")
+
+
+def error_for_nutrition_row(row: Any) -> Optional[str]:
+    """
+    Validate one entry of a batch, e.g. from a JSON request body. Nutrition
+    values may be integers or strings of digits; `meal` is optional.
+    """
+    if not isinstance(row, dict):
+        return "Entry must be an object."
+
+    missing = [field for field in NUTRITION_ROW_FIELDS if field not in row]
+    if missing:
+        return f"Entry is missing {', '.join(missing)}."
+
+    values = [row["calories"], row["protein"], row["fat"], row["carbs"]]
+    # `bool` is a subclass of `int`, and floats would be silently truncated
+    if any(
+        isinstance(value, bool) or not isinstance(value, (int, str))
+        for value in values
+    ):
+        return (
+            "Inputs for calories, protein, fats, and carbohydrates must be "
+            "integers."
+        )
+
+    meal = row.get("meal") or ""
+    if not isinstance(row["date"], str) or not isinstance(meal, str):
+        return "Date and meal must be strings."
+
+    for error in (
+        error_for_date_format(row["date"]),
+        error_for_nutrition_entry(*(str(value) for value in values)),
+        error_for_meal_len(meal),
+    ):
+        if error:
+            # Form errors are wrapped for templates; collapse the whitespace
+            return " ".join(error.split())
+
+    return None
+
+
+def errors_for_nutrition_rows(rows: List[Dict[str, Any]]) -> List[str]:
+    """Return one message per invalid entry, numbered from 1."""
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        error = error_for_nutrition_row(row)
+        if error:
+            errors.append(f"Entry {number}: {error}")
+    return errors
+
+
 # Check date format in URL
+# Largest value of a PostgreSQL `integer`, the type of entry ids
+MAX_ENTRY_ID = 2**31 - 1
+
+
+def is_entry_id_in_url_valid(entry_id: int) -> bool:
+    """Larger ids can't exist, and PostgreSQL rejects them as parameters."""
+    return 1 <= entry_id <= MAX_ENTRY_ID
+
+
 def is_date_in_url_valid(d: str) -> bool:
     try:
         """Confirm that the input string can be converted to a datetime
@@ -82,11 +146,5 @@ def error_for_date_format(date_str: str) -> Optional[str]:
         return "Date must be in 'MM/DD/YYYY' format. Try again!"
 
 
-def is_nutrition_id_valid(id: int, available_nutrition_id: List[int]) -> bool:
-    if id in available_nutrition_id:
-        return True
-    return False
-
-
 def get_todays_date() -> date:
     return date.today()
@@ -0,0 +1,281 @@
+"""
+View logic shared by `app.py` (Flask) and `asgi.py` (Quart): URL, form and
+page cursor validation, and the templates and context the routes render.
+
+Nothing here does I/O. Each app reads the request, calls its storage (sync
+or async) with the values these functions return, and renders the `Page`
+they build, so the two apps can't drift apart.
+"""
+
+from datetime import date as date_type
+import secrets
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+import markdown2
+
+from macro_mojo import instrumentation
+from macro_mojo.ai_agent import get_ai_welcome_message
+from macro_mojo.chat_history import Chat
+from macro_mojo.exporter import EXPORTS, FORMATS
+from macro_mojo.pagination import is_entry_id, page_cursor, paginate
+from macro_mojo.passwords import PasswordVerifier
+from macro_mojo.utils import (
+    error_for_date_format,
+    error_for_meal_len,
+    error_for_nutrition_entry,
+    error_for_targets,
+    errors_for_nutrition_rows,
+    get_todays_date,
+    is_date_in_url_valid,
+)
+
+# Form fields of a nutrition entry, in the order the storage takes them
+NUTRITION_FIELDS = ("calories", "protein", "fat", "carbs", "meal")
+# Target as stored and shown, and its form field, in the order the storage
+# takes them
+TARGET_FIELDS = {
+    "calorie_target": "calories",
+    "protein_target": "protein",
+    "fat_target": "fat",
+    "carb_target": "carbs",
+}
+# Values of FLASK_ENV that may run without SECRET_KEY
+DEVELOPMENT_ENVIRONMENTS = ("development", "testing")
+# Sent with Server-Sent Events; proxies such as nginx would otherwise buffer
+# the events
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class Page(NamedTuple):
+    """A template and the context to render it with."""
+
+    template: str
+    context: Dict[str, Any]
+
+
+class BatchRequest(NamedTuple):
+    rows: List[Any]
+    errors: List[str]
+    # 201 if the rows can be added, otherwise 400 or 413
+    status: int
+
+
+def render_markdown(text: str) -> str:
+    with instrumentation.timed("markdown"):
+        return markdown2.markdown(text, extras=["break-on-newline"])
+
+
+def secret_key(config: Mapping[str, Any], environment: Optional[str]) -> str:
+    """
+    The app's `SECRET_KEY`. In development and testing a random key is used
+    if it isn't set; sessions then only work with a single worker.
+    """
+    if config["SECRET_KEY"]:
+        return config["SECRET_KEY"]
+    if environment not in DEVELOPMENT_ENVIRONMENTS:
+        raise RuntimeError(
+            "SECRET_KEY must be set, to the same value for every worker. "
+            "Set FLASK_ENV=development to use a random key instead."
+        )
+    return secrets.token_hex(32)
+
+
+def password_verifier(config: Mapping[str, Any]) -> Optional[PasswordVerifier]:
+    """The app's password verifier, or `None` if `PASSWORD_WORKERS` is 0."""
+    if not config["PASSWORD_WORKERS"]:
+        return None
+    return PasswordVerifier(
+        workers=config["PASSWORD_WORKERS"],
+        max_pending=config["PASSWORD_MAX_PENDING"],
+        timeout=config["PASSWORD_TIMEOUT"],
+        rounds=config["BCRYPT_ROUNDS"],
+        slots_dir=config["PASSWORD_SLOTS_DIR"],
+        namespace=config["PASSWORD_SLOTS_NAMESPACE"],
+    )
+
+
+def bad_url(username: str) -> Page:
+    return Page("bad_url.html", {"username": username})
+
+
+def dashboard_cursor(
+    args: Mapping[str, str],
+) -> Optional[Tuple[int, Optional[str], Optional[str]]]:
+    """The page and the date cursors of the dashboard, or `None`."""
+    return page_cursor(args, is_date_in_url_valid) or None
+
+
+def dashboard_page(
+    username: str,
+    page: int,
+    user_targets: Any,
+    daily_totals_page: Dict[str, Any],
+) -> Page:
+    total_pages = paginate(daily_totals_page["day_count"], page)
+    if not total_pages or not daily_totals_page["days"]:
+        return bad_url(username)
+    return Page(
+        "dashboard.html",
+        {
+            "username": username,
+            "user_targets": user_targets,
+            "user_nutrition_on_page": daily_totals_page["days"],
+            "total_pages": total_pages,
+            "page": page,
+            "date": date_type.today(),
+        },
+    )
+
+
+def day_view_cursor(
+    args: Mapping[str, str],
+) -> Optional[Tuple[int, Optional[int], Optional[int]]]:
+    """The page and the entry id cursors of the day view, or `None`."""
+    requested_page = page_cursor(args, is_entry_id)
+    if not requested_page:
+        return None
+    page, before, after = requested_page
+    return (
+        page,
+        int(before) if before is not None else None,
+        int(after) if after is not None else None,
+    )
+
+
+def day_view_page(
+    username: str, date: str, page: int, day_snapshot: Dict[str, Any]
+) -> Page:
+    if not day_snapshot["entry_count"]:
+        return Page("empty_day.html", {"date": date, "username": username})
+
+    total_pages = paginate(day_snapshot["entry_count"], page)
+    if not total_pages or not day_snapshot["entries"]:
+        return bad_url(username)
+
+    return Page(
+        "day_view.html",
+        {
+            "username": username,
+            "daily_nutrition_entries_on_page": day_snapshot["entries"],
+            "total_pages": total_pages,
+            "page": page,
+            "date": date,
+            "daily_total": day_snapshot["daily_total"],
+            "nutrition_left": day_snapshot["nutrition_left"],
+        },
+    )
+
+
+def nutrition_form(form: Mapping[str, str]) -> Dict[str, str]:
+    return {field: form[field] for field in NUTRITION_FIELDS}
+
+
+def errors_for_nutrition_form(
+    nutrition: Mapping[str, str], entry_date: Optional[str] = None
+) -> List[str]:
+    """Errors to flash, checking `entry_date` too when it is given."""
+    errors = [
+        error_for_date_format(entry_date) if entry_date is not None else None,
+        error_for_nutrition_entry(
+            nutrition["calories"],
+            nutrition["protein"],
+            nutrition["fat"],
+            nutrition["carbs"],
+        ),
+        error_for_meal_len(nutrition["meal"]),
+    ]
+    return [error for error in errors if error]
+
+
+def new_entry_page(username: str, date: str) -> Page:
+    return Page(
+        "add_nutrition_entry.html",
+        {
+            "username": username,
+            "date": date,
+            "input_nutrition": {},
+            "today": get_todays_date(),
+        },
+    )
+
+
+# Re-displays the form with the values entered
+def invalid_new_entry_page(
+    username: str, entry_date: str, nutrition: Dict[str, str]
+) -> Page:
+    return Page(
+        "add_nutrition_entry.html",
+        {
+            "username": username,
+            "date": entry_date,
+            "input_nutrition": nutrition,
+        },
+    )
+
+
+def edit_entry_page(
+    username: str, date: str, nutrition_entry_id: int, nutrition_data: Any
+) -> Page:
+    return Page(
+        "edit_entry.html",
+        {
+            "username": username,
+            "date": date,
+            "nutrition_data": nutrition_data,
+            "nutrition_entry_id": nutrition_entry_id,
+        },
+    )
+
+
+def batch_request(body: Any, max_entries: int) -> BatchRequest:
+    """
+    Read a batch of entries from a JSON body: either a list of entries or
+    `{"entries": [...]}`, each with `date`, `calories`, `protein`, `fat`,
+    `carbs` and an optional `meal`. Nothing is added if any entry is
+    invalid.
+    """
+    rows = body.get("entries") if isinstance(body, dict) else body
+    if not isinstance(rows, list):
+        return BatchRequest(
+            [], ["Request body must be a JSON list of entries."], 400
+        )
+    if len(rows) > max_entries:
+        return BatchRequest(
+            [], [f"A batch can have at most {max_entries} entries."], 413
+        )
+    errors = errors_for_nutrition_rows(rows)
+    if errors:
+        return BatchRequest([], errors, 400)
+    return BatchRequest(rows, [], 201)
+
+
+def export_request(args: Mapping[str, str]) -> Optional[Tuple[str, str]]:
+    """The data and file format to export, or `None` if either is unknown."""
+    data = args.get("data", "entries")
+    file_format = args.get("format", "csv")
+    if data not in EXPORTS or file_format not in FORMATS:
+        return None
+    return data, file_format
+
+
+def targets_form(form: Mapping[str, str]) -> Dict[str, str]:
+    return {target: form[field] for target, field in TARGET_FIELDS.items()}
+
+
+def error_for_targets_form(targets: Mapping[str, str]) -> Optional[str]:
+    return error_for_targets(*(targets[target] for target in TARGET_FIELDS))
+
+
+def targets_page(username: str, user_targets: Any, edit: bool = False) -> Page:
+    return Page(
+        "edit_targets.html" if edit else "targets.html",
+        {"username": username, "user_targets": user_targets},
+    )
+
+
+def with_welcome(chat: Chat) -> Chat:
+    """A new chat starts with the assistant's welcome message."""
+    if chat.history:
+        return chat
+    welcome = {"sender": "ai_agent", "text": get_ai_welcome_message()}
+    return chat._replace(history=[welcome])
@@ -0,0 +1,53 @@
+"""
+Fixtures for tests that need PostgreSQL. Each test gets a new database on
+the server at `TEST_DATABASE_URL`, migrated from db/migrations and dropped
+afterwards. Without `TEST_DATABASE_URL` these tests are skipped.
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest
+"""
+
+import os
+import secrets
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+from macro_mojo import partitions
+from macro_mojo.migrations import apply_migrations, discover_migrations, seed
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+# Lets `app` and `asgi` be imported without SECRET_KEY
+os.environ.setdefault("FLASK_ENV", "testing")
+
+
+@pytest.fixture
+def database():
+    """An autocommit connection to a new, migrated database."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    name = f"macro_mojo_test_{secrets.token_hex(4)}"
+    admin = psycopg2.connect(TEST_DATABASE_URL)
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE {name}")
+    connection = psycopg2.connect(
+        extensions.make_dsn(TEST_DATABASE_URL, dbname=name)
+    )
+    try:
+        apply_migrations(connection, discover_migrations())
+        yield connection
+    finally:
+        connection.close()
+        with admin.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE {name}")
+        admin.close()
+
+
+@pytest.fixture
+def seeded_database(database):
+    """`database` with db/data.sql loaded, as `migrations --seed` does."""
+    seed(database)
+    partitions.create_partitions(database)
+    return database
@@ -1,5 +1,13 @@
 from dotenv import load_dotenv
+from langchain_core.language_models.fake_chat_models import (
+    FakeListChatModel,
+)
+import asyncio
+import subprocess
+import sys
 from macro_mojo import ai_agent
+from macro_mojo.ai_cache import ResponseCache
+from macro_mojo.chat_history import ChatMemory
 import pytest
 
 load_dotenv()
@@ -18,6 +26,32 @@ class FakeChain:
         return {"text": self.response_text}
 
 
+"""
+Each test starts with an empty response cache. The agent's LLM is replaced
+by a fake that counts words as tokens and summarizes as "Summary"
+"""
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch: pytest.MonkeyPatch, tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "ai_cache.sqlite3"))
+    monkeypatch.setattr("macro_mojo.ai_agent.response_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def summarizer(monkeypatch: pytest.MonkeyPatch):
+    summarizer = FakeListChatModel(
+        responses=["Summary"], custom_get_token_ids=str.split
+    )
+    monkeypatch.setattr(ai_agent.get_agent(), "llm", summarizer)
+    return summarizer
+
+
+def new_memory():
+    return ai_agent.load_memory(ChatMemory())
+
+
 """
 Create fresh FakeChain instance and patch a chain for each test
 """
@@ -26,7 +60,7 @@ Create fresh FakeChain instance and patch a chain for each test
 @pytest.fixture
 def fake_chain(monkeypatch: pytest.MonkeyPatch):
     fake_chain = FakeChain("Mocked reply")
-    monkeypatch.setattr("macro_mojo.ai_agent.chain", fake_chain)
+    monkeypatch.setattr(ai_agent.get_agent(), "chain", fake_chain)
     return fake_chain
 
 
@@ -40,20 +74,151 @@ Tests for function 'get_ai_response':
 def test_get_ai_response_uses_chain_gets_response(fake_chain):
     user_input = """I'm 30 years old female, 150 lbs, 170 cm height, want to
                     gain muscle while maintaining weight."""
-    result = ai_agent.get_ai_response(user_input)
+    memory = new_memory()
+    result = ai_agent.get_ai_response(user_input, memory)
     assert result == "Mocked reply"
     assert fake_chain.invoke_called == 1
-    assert fake_chain.last_invoke_kwargs == {"input": user_input}
+    assert fake_chain.last_invoke_kwargs == {
+        "input": user_input,
+        "chat_history": "",
+    }
+    assert memory.buffer == f"Human: {user_input}\nAI: Mocked reply"
 
 
 def test_get_ai_response_gets_another_response(monkeypatch):
     fake_chain = FakeChain(response_text="Please provide more details")
-    monkeypatch.setattr("macro_mojo.ai_agent.chain", fake_chain)
+    monkeypatch.setattr(ai_agent.get_agent(), "chain", fake_chain)
     user_input = "I am 45 and want to lose weight"
-    result = ai_agent.get_ai_response(user_input)
+    result = ai_agent.get_ai_response(user_input, new_memory())
     assert result == "Please provide more details"
 
 
+"""
+Tests for the response cache:
+1. The same question, written differently, is answered from the cache, and
+   the turn is still added to the conversation
+2. The same question later in a conversation goes to the chain again
+"""
+
+
+def test_get_ai_response_cached(fake_chain, empty_cache):
+    first = ai_agent.get_ai_response("Female, 30, 65 kg, 170cm", new_memory())
+    memory = new_memory()
+    second = ai_agent.get_ai_response("female 30 65kg 170 CM!", memory)
+
+    assert first == second == "Mocked reply"
+    assert fake_chain.invoke_called == 1
+    assert empty_cache.stats()["memory_hits"] == 1
+    assert "female 30 65kg 170 CM!" in memory.buffer
+
+
+def test_get_ai_response_depends_on_conversation(fake_chain):
+    ai_agent.get_ai_response("female 30 65kg 170cm", new_memory())
+    memory = new_memory()
+    memory.save_context({"input": "hi"}, {"text": "hello"})
+    ai_agent.get_ai_response("female 30 65kg 170cm", memory)
+
+    assert fake_chain.invoke_called == 2
+
+
+"""
+Tests for the memory of a chat:
+1. Chats don't see each other's messages
+2. Messages over the token budget are rolled into the summary, which the
+   chain is given
+3. The memory survives 'dump_memory' and 'load_memory'
+"""
+
+
+def test_memory_per_chat(fake_chain):
+    cat_memory = new_memory()
+    dog_memory = new_memory()
+
+    ai_agent.get_ai_response("I am a cat", cat_memory)
+    ai_agent.get_ai_response("I am a dog", dog_memory)
+
+    assert "cat" not in dog_memory.buffer
+    assert "dog" not in cat_memory.buffer
+
+
+def test_memory_bounded(monkeypatch: pytest.MonkeyPatch, fake_chain):
+    monkeypatch.setattr("macro_mojo.ai_agent.AI_MEMORY_TOKENS", 12)
+    memory = new_memory()
+
+    for n in range(10):
+        ai_agent.get_ai_response(f"female 30 65kg 170cm {n}", memory)
+
+    chat_memory = ai_agent.dump_memory(memory)
+    assert chat_memory.summary == "Summary"
+    assert 0 < len(chat_memory.messages) < 4
+    assert chat_memory.messages[-1] == ("ai", "Mocked reply")
+    assert fake_chain.last_invoke_kwargs["chat_history"].startswith(
+        "System: Summary\n"
+    )
+
+
+def test_memory_round_trip(fake_chain):
+    memory = new_memory()
+    ai_agent.get_ai_response("female 30 65kg 170cm", memory)
+    memory.moving_summary_buffer = "Summary"
+
+    chat_memory = ai_agent.dump_memory(memory)
+
+    assert chat_memory == ChatMemory(
+        "Summary",
+        (("human", "female 30 65kg 170cm"), ("ai", "Mocked reply")),
+    )
+    assert ai_agent.load_memory(chat_memory).buffer == memory.buffer
+
+
+"""
+Tests for 'stream_ai_response' and 'astream_ai_response':
+1. The answer is streamed from the routed chain's LLM and recorded in the
+   memory and the cache
+2. A cached answer is sent in one piece
+"""
+
+
+@pytest.fixture
+def fake_llm(monkeypatch: pytest.MonkeyPatch):
+    fake_llm = FakeListChatModel(responses=["Eat **2000** kcal"])
+    nutrition_chain = ai_agent.get_agent().chain.destination_chains[
+        "nutrition"
+    ]
+    monkeypatch.setattr(nutrition_chain, "llm", fake_llm)
+    return fake_llm
+
+
+def test_stream_ai_response(fake_llm, empty_cache):
+    memory = new_memory()
+    tokens = list(ai_agent.stream_ai_response("female 30 65kg 170cm", memory))
+
+    assert len(tokens) > 1
+    assert "".join(tokens) == "Eat **2000** kcal"
+    assert "AI: Eat **2000** kcal" in memory.buffer
+
+    cached = list(
+        ai_agent.stream_ai_response("Female, 30, 65 kg, 170 cm", new_memory())
+    )
+    assert cached == ["Eat **2000** kcal"]
+    assert empty_cache.stats()["memory_hits"] == 1
+
+
+def test_astream_ai_response(fake_llm):
+    memory = new_memory()
+
+    async def collect():
+        return [
+            token
+            async for token in ai_agent.astream_ai_response(
+                "female 30 65kg 170cm", memory
+            )
+        ]
+
+    assert "".join(asyncio.run(collect())) == "Eat **2000** kcal"
+    assert "AI: Eat **2000** kcal" in memory.buffer
+
+
 """
 Test welcome message
 """
@@ -64,3 +229,29 @@ def test_get_ai_welcome_message():
     assert "Hello" in message
     assert "Weight" in message
     assert "Activity level" in message
+
+
+"""
+Tests for building the agent lazily:
+1. Importing the module doesn't import langchain
+2. 'get_agent' builds the agent once
+"""
+
+
+def test_import_does_not_load_langchain():
+    code = (
+        "import sys, macro_mojo.ai_agent; "
+        "print(any(name.split('.')[0].startswith('langchain') "
+        "for name in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_get_agent_builds_once():
+    assert ai_agent.get_agent() is ai_agent.get_agent()
@@ -0,0 +1,80 @@
+from macro_mojo.ai_cache import ResponseCache, cache_key, normalize_input
+from unittest.mock import patch
+import pytest
+import time
+
+"""
+Tests for `normalize_input` and `cache_key`: case, punctuation and spacing
+don't change the key, the conversation and the namespace do.
+"""
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Female, 30, 65 kg, 170cm", "female 30 65 kg 170 cm"),
+        ("  FEMALE 30   65kg 170 cm!! ", "female 30 65 kg 170 cm"),
+        ("I weigh 65.5kg", "i weigh 65.5 kg"),
+    ],
+)
+def test_normalize_input(text, expected):
+    assert normalize_input(text) == expected
+
+
+def test_cache_key():
+    key = cache_key("gpt-4", "Female, 30", "")
+
+    assert key == cache_key("gpt-4", "female 30", "")
+    assert key != cache_key("gpt-4", "female 30", "Human: hi\nAI: hello")
+    assert key != cache_key("gpt-4o", "female 30", "")
+
+
+"""
+Tests for `ResponseCache`:
+1. Responses are found in memory, then on disk by another process's cache,
+   and hits and misses are counted per tier
+2. Expired responses are misses in both tiers
+3. Without a path only the memory tier is used
+"""
+
+
+def test_response_cache_tiers(tmp_path):
+    path = str(tmp_path / "ai_cache.sqlite3")
+    cache = ResponseCache(maxsize=8, ttl=60, path=path)
+    cache.set("key", "Eat more protein")
+
+    assert cache.get("key") == "Eat more protein"
+    other_worker_cache = ResponseCache(maxsize=8, ttl=60, path=path)
+    assert other_worker_cache.get("key") == "Eat more protein"
+    assert other_worker_cache.get("missing") is None
+
+    assert cache.stats()["memory_hits"] == 1
+    stats = other_worker_cache.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_response_cache_expired(tmp_path):
+    path = str(tmp_path / "ai_cache.sqlite3")
+    cache = ResponseCache(maxsize=8, ttl=60, path=path)
+    cache.set("key", "Eat more protein")
+
+    # Past the TTL for both the memory tier's clock and the disk tier's
+    with (
+        patch("macro_mojo.ai_cache.time.time", return_value=time.time() + 61),
+        patch(
+            "macro_mojo.cache.time.monotonic",
+            return_value=time.monotonic() + 61,
+        ),
+    ):
+        assert cache.get("key") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_response_cache_memory_only():
+    cache = ResponseCache(maxsize=8, ttl=60, path="")
+    cache.set("key", "Eat more protein")
+
+    assert cache.path is None
+    assert cache.get("key") == "Eat more protein"
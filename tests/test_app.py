@@ -1,4 +1,9 @@
+from flask import render_template
+from app import app
+from macro_mojo.rows import DailyTotal, NutritionEntry, Remaining
+import datetime
 import pytest
+import re
 
 
 # def test_index_ok(client):
@@ -9,3 +14,35 @@ import pytest
 # def test_login_page_ok(client):
 #     response = client.get("/login/")
 #     return response.status_code == 200
+
+
+"""
+Test the page links of 'day_view.html': each carries the id of the entry it
+pages from as its cursor
+"""
+
+
+def test_day_view_page_links_have_cursors():
+    date = datetime.date(2025, 6, 24)
+    entered_at = datetime.datetime(2025, 6, 24, 8)
+    entries = [
+        NutritionEntry(
+            entry_id, date, entered_at, 100, 10, 5, 12, "x"
+        )
+        for entry_id in (41, 40)
+    ]
+
+    with app.test_request_context("/"):
+        html = render_template(
+            "day_view.html",
+            username="cat",
+            daily_nutrition_entries_on_page=entries,
+            total_pages=3,
+            page=2,
+            date="2025-06-24",
+            daily_total=DailyTotal(date, 200, 20, 10, 24, 2),
+            nutrition_left=Remaining(1800, 100, 50, 226),
+        )
+
+    links = re.findall(r'href="/cat/2025-06-24\?([^"]*)"', html)
+    assert sorted(links) == ["page=1&amp;after=41", "page=3&amp;before=40"]
@@ -0,0 +1,254 @@
+from unittest.mock import patch
+from macro_mojo.async_db_persistence import AsyncDatabasePersistence
+from macro_mojo.chat_history import (
+    CHAT_HISTORY_TTL,
+    Chat,
+    ChatMemory,
+    encode_history,
+    encode_memory,
+)
+from macro_mojo.db_persistence import (
+    EXPORT_ITERSIZE,
+    _targets_cache,
+    _user_id_cache,
+)
+from macro_mojo.rows import DailyTotal, Targets
+from contextlib import asynccontextmanager
+from datetime import date
+import asyncio
+import bcrypt
+import pytest
+
+""" Async versions of the fakes in `test_db_persistence.py` """
+
+
+class FakeAsyncCursor:
+    def __init__(self, fetchone_result=None, fetchall_result=None):
+        self.executed = []
+        self.copied = []
+        self.fetchone_result = fetchone_result
+        self.fetchall_result = fetchall_result or []
+        self.rowcount = -1
+        self.make_row = tuple
+
+    async def execute(self, query, parameters=None, prepare=None):
+        self.executed.append((query, parameters))
+
+    async def executemany(self, query, parameters):
+        self.executed.append((query, list(parameters)))
+
+    async def fetchone(self):
+        if self.fetchone_result is None:
+            return None
+        return self.make_row(self.fetchone_result)
+
+    async def fetchall(self):
+        return list(map(self.make_row, self.fetchall_result))
+
+    def __aiter__(self):
+        return self._rows()
+
+    async def _rows(self):
+        for row in self.fetchall_result:
+            yield self.make_row(row)
+
+    def copy(self, query):
+        self.executed.append((query, None))
+        return FakeCopy(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeCopy:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def write_row(self, row):
+        self._cursor.copied.append(row)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._cursor.rowcount = len(self._cursor.copied)
+
+
+class FakeAsyncConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.cursor_name = None
+
+    def cursor(self, name=None, row_factory=None):
+        self.cursor_name = name
+        if row_factory is not None:
+            self._cursor.make_row = row_factory(self._cursor)
+        return self._cursor
+
+    async def execute(self, query, parameters=None, prepare=None):
+        await self._cursor.execute(query, parameters)
+
+
+@pytest.fixture
+def adp():
+    _user_id_cache.clear()
+    _targets_cache.clear()
+    return AsyncDatabasePersistence(dsn="fake_db")
+
+
+def patch_connect(adp, connection):
+    @asynccontextmanager
+    async def fake_connect():
+        yield connection
+
+    return patch.object(adp, "_database_connect", fake_connect)
+
+
+"""
+Tests for `find_login` and `find_user_id`:
+1. Correct and incorrect passwords
+2. User ids are shared with the sync backend's cache
+"""
+
+
+@pytest.mark.parametrize(
+    "password, expected", [("hungry", 3), ("not_hungry", None)]
+)
+def test_find_login(adp, password, expected):
+    hashed_pwd = bcrypt.hashpw(
+        "hungry".encode("utf-8"), bcrypt.gensalt()
+    ).decode("utf-8")
+    cursor = FakeAsyncCursor(fetchone_result=(3, hashed_pwd))
+    with patch_connect(adp, FakeAsyncConnection(cursor)):
+        assert asyncio.run(adp.find_login("cat", password)) == expected
+
+    query, parameters = cursor.executed[0]
+    assert "FROM users" in query
+    assert parameters == ("cat",)
+
+
+def test_find_user_id_cached(adp):
+    cursor = FakeAsyncCursor(fetchone_result=(7,))
+    with patch_connect(adp, FakeAsyncConnection(cursor)):
+        assert asyncio.run(adp.find_user_id("cat")) == 7
+        assert asyncio.run(adp.find_user_id("cat")) == 7
+
+    assert len(cursor.executed) == 1
+    assert _user_id_cache.get("cat") == 7
+
+
+"""
+Tests for the reads: results are shaped the same way as in
+`DatabasePersistence`, with row types built by the cursor's row factory
+"""
+
+
+def test_get_user_targets(adp):
+    cursor = FakeAsyncCursor(fetchone_result=(2000, 100, 60, 260))
+    with patch_connect(adp, FakeAsyncConnection(cursor)):
+        targets = asyncio.run(adp.get_user_targets(6))
+
+    assert targets == Targets(2000, 100, 60, 260)
+    assert targets.carb_target == 260
+
+
+def test_get_day_snapshot_no_entries(adp):
+    cursor = FakeAsyncCursor(fetchall_result=[])
+    with patch_connect(adp, FakeAsyncConnection(cursor)):
+        snapshot = asyncio.run(adp.get_day_snapshot(6, "2025-06-24"))
+
+    assert snapshot["entry_count"] == 0
+    assert snapshot["entries"] == []
+    _, parameters = cursor.executed[0]
+    assert parameters["user_id"] == 6
+    assert parameters["cursor_id"] is None
+
+
+def test_export_reads_use_named_cursor(adp):
+    rows = [
+        (date(2025, 6, 24), 500, 50, 20, 25, 1),
+        (date(2025, 6, 25), 200, 6, 3, 30, 1),
+    ]
+    cursor = FakeAsyncCursor(fetchall_result=rows)
+    connection = FakeAsyncConnection(cursor)
+
+    async def read_all():
+        return [row async for row in adp.iter_daily_totals(6)]
+
+    with patch_connect(adp, connection):
+        assert asyncio.run(read_all()) == [DailyTotal(*row) for row in rows]
+
+    assert connection.cursor_name
+    assert cursor.itersize == EXPORT_ITERSIZE
+    query, parameters = cursor.executed[0]
+    assert "FROM daily_totals" in query
+    assert parameters == (6,)
+
+
+"""
+Tests for the writes: inserts, COPY and updates reporting missing entries
+"""
+
+
+def test_add_nutrition_entries(adp):
+    cursor = FakeAsyncCursor()
+    rows = [
+        {
+            "date": "2025-06-24",
+            "calories": "500",
+            "protein": 50,
+            "fat": 20,
+            "carbs": 25,
+            "meal": "chicken bowl",
+        }
+    ]
+    with patch_connect(adp, FakeAsyncConnection(cursor)):
+        assert asyncio.run(adp.add_nutrition_entries(6, rows)) == 1
+
+    query, values = cursor.executed[0]
+    assert "INSERT INTO nutrition" in query
+    assert values == [(6, "chicken bowl", "2025-06-24", 500, 50, 20, 25)]
+
+
+def test_copy_nutrition_entries(adp):
+    cursor = FakeAsyncCursor()
+    rows = [("toast", "2025-06-24", 200, 6, 3, 30)]
+    with patch_connect(adp, FakeAsyncConnection(cursor)):
+        copied = asyncio.run(adp.copy_nutrition_entries(6, iter(rows)))
+
+    assert copied == 1
+    query, _ = cursor.executed[0]
+    assert "FROM STDIN" in query
+    assert cursor.copied == [(6, "toast", "2025-06-24", 200, 6, 3, 30)]
+
+
+@pytest.mark.parametrize(
+    "fetchone_result, expected", [((4,), True), (None, False)]
+)
+def test_delete_nutrition_entry(adp, fetchone_result, expected):
+    cursor = FakeAsyncCursor(fetchone_result=fetchone_result)
+    with patch_connect(adp, FakeAsyncConnection(cursor)):
+        deleted = asyncio.run(adp.delete_nutrition_entry(6, 4, "2025-06-24"))
+    assert deleted is expected
+
+    query, parameters = cursor.executed[0]
+    assert "DELETE FROM nutrition" in query
+    assert parameters == (4, 6, "2025-06-24")
+
+
+def test_get_chat_history(adp):
+    history = [{"sender": "ai_agent", "text": "Hello"}]
+    memory = ChatMemory("Summary", (("human", "hi"), ("ai", "hello")))
+    cursor = FakeAsyncCursor(
+        fetchone_result=(encode_history(history), encode_memory(memory))
+    )
+    with patch_connect(adp, FakeAsyncConnection(cursor)):
+        result = asyncio.run(adp.get_chat_history("chat-1", 6))
+
+    assert result == Chat(history, memory)
+    query, parameters = cursor.executed[0]
+    assert "FROM chat_history" in query
+    assert parameters == ("chat-1", 6, CHAT_HISTORY_TTL)
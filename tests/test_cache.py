@@ -0,0 +1,92 @@
+from macro_mojo.cache import LRUCache, SharedGenerations
+from unittest.mock import patch
+import pytest
+
+"""
+Tests for `LRUCache`:
+1. Stored values are returned and counted as hits; missing keys as misses
+2. The least recently used key is evicted once `maxsize` is exceeded
+3. `pop` removes a key
+"""
+
+
+def test_lru_cache_get_set():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Touch "a" so that "b" becomes the least recently used key
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_pop():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    assert cache.pop("a") == 1
+    assert cache.get("a") is None
+
+
+def test_lru_cache_invalid_maxsize():
+    with pytest.raises(ValueError):
+        LRUCache(maxsize=0)
+
+
+"""
+Tests for expiry and invalidation:
+1. Values expire `ttl` seconds after they are set
+2. Invalidating a key through one `SharedGenerations` drops it from a cache
+   using another one on the same file, as another worker process would
+3. A value loaded before an invalidation is never returned
+"""
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(maxsize=2, ttl=60)
+    with patch("macro_mojo.cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("macro_mojo.cache.time.monotonic", return_value=159.0):
+        assert cache.get("a") == 1
+    with patch("macro_mojo.cache.time.monotonic", return_value=160.0):
+        assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_lru_cache_invalidated_in_other_process(tmp_path):
+    path = str(tmp_path / "generations")
+    worker_cache = LRUCache(maxsize=2, generations=SharedGenerations(path))
+    other_worker_cache = LRUCache(
+        maxsize=2, generations=SharedGenerations(path)
+    )
+    worker_cache.set(6, "targets")
+    other_worker_cache.set(6, "targets")
+
+    other_worker_cache.invalidate(6)
+
+    assert worker_cache.get(6) is None
+    assert other_worker_cache.get(6) is None
+    assert worker_cache.stats()["invalidated"] == 1
+
+
+def test_lru_cache_set_with_stale_generation(tmp_path):
+    cache = LRUCache(
+        maxsize=2, generations=SharedGenerations(str(tmp_path / "gen"))
+    )
+    generation = cache.generation(6)
+    # Invalidated while the value was being loaded
+    cache.invalidate(6)
+    cache.set(6, "old targets", generation)
+
+    assert cache.get(6) is None
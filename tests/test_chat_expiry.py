@@ -0,0 +1,76 @@
+from macro_mojo.chat_expiry import (
+    EXPIRE_BATCH_SIZE,
+    expire_chat_history,
+)
+from macro_mojo.chat_history import CHAT_HISTORY_TTL
+import pytest
+
+""" Custom classes to simulate `cursor` and `connection` objects """
+
+
+class FakeCursor:
+    def __init__(self, rowcounts):
+        self.executed = []
+        self._rowcounts = list(rowcounts)
+        self.rowcount = -1
+
+    def execute(self, query, parameters=None):
+        self.executed.append((query, parameters))
+        self.rowcount = self._rowcounts.pop(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.transactions = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def __enter__(self):
+        self.transactions += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+"""
+Tests for `expire_chat_history`: expired chats are deleted a batch per
+transaction until a batch comes back short, and the total is returned.
+"""
+
+
+@pytest.mark.parametrize(
+    "rowcounts, batches, deleted",
+    [([0], 1, 0), ([2, 2, 1], 3, 5), ([2, 2, 0], 3, 4)],
+    ids=["nothing_expired", "last_batch_short", "last_batch_empty"],
+)
+def test_expire_chat_history(rowcounts, batches, deleted):
+    cursor = FakeCursor(rowcounts)
+    connection = FakeConnection(cursor)
+
+    assert expire_chat_history(connection, 60, batch_size=2) == deleted
+    assert connection.transactions == batches
+    query, parameters = cursor.executed[0]
+    assert "DELETE FROM chat_history" in query
+    assert "updated_at <" in query
+    assert parameters == {"ttl": 60, "batch_size": 2}
+
+
+def test_expire_chat_history_defaults():
+    cursor = FakeCursor([0])
+
+    expire_chat_history(FakeConnection(cursor))
+
+    _, parameters = cursor.executed[0]
+    assert parameters == {
+        "ttl": CHAT_HISTORY_TTL,
+        "batch_size": EXPIRE_BATCH_SIZE,
+    }
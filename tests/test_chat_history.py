@@ -0,0 +1,64 @@
+from macro_mojo.chat_history import (
+    ChatMemory,
+    decode_history,
+    decode_memory,
+    encode_history,
+    encode_memory,
+    sse_event,
+)
+import pytest
+
+"""
+Tests for `encode_history` and `decode_history`:
+1. History survives a round trip, compressed
+2. Only the latest `max_messages` messages are kept
+"""
+
+
+def test_history_round_trip():
+    history = [
+        {"sender": "ai_agent", "text": "Hello, I am here to help"},
+        {"sender": "cat", "text": "I weigh 4 kg " * 50},
+    ]
+
+    data = encode_history(history)
+
+    assert decode_history(data) == history
+    assert len(data) < len(str(history))
+
+
+@pytest.mark.parametrize(
+    "max_messages, expected_texts",
+    [(2, ["3", "4"]), (10, ["0", "1", "2", "3", "4"]), (0, [])],
+    ids=["capped", "under_cap", "no_history"],
+)
+def test_history_capped(max_messages, expected_texts):
+    history = [{"sender": "cat", "text": str(n)} for n in range(5)]
+
+    kept = decode_history(encode_history(history, max_messages))
+
+    assert [message["text"] for message in kept] == expected_texts
+
+
+"""
+Tests for `encode_memory` and `decode_memory`: the memory survives a round
+trip, and a chat without a stored memory starts with an empty one
+"""
+
+
+def test_memory_round_trip():
+    memory = ChatMemory("Summary", (("human", "hi"), ("ai", "hello")))
+
+    assert decode_memory(encode_memory(memory)) == memory
+    assert decode_memory(None) == ChatMemory()
+
+
+"""
+Test `sse_event`: newlines in the data stay inside one event
+"""
+
+
+def test_sse_event():
+    assert sse_event("token", "- **2000**\n- kcal") == (
+        'event: token\ndata: "- **2000**\\n- kcal"\n\n'
+    )
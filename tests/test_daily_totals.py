@@ -0,0 +1,148 @@
+from macro_mojo.daily_totals import rebuild, verify
+import pytest
+
+""" Custom classes to simulate `cursor` and `connection` objects """
+
+
+class FakeCursor:
+    def __init__(self, fetchall_result=None):
+        self.executed = []
+        self.fetchall_result = fetchall_result or []
+
+    def execute(self, query, parameters=None):
+        self.executed.append((query, parameters))
+
+    def fetchall(self):
+        return self.fetchall_result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.transactions = 0
+
+    def cursor(self, cursor_factory=None):
+        return self._cursor
+
+    def __enter__(self):
+        self.transactions += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+"""
+Tests for `verify`:
+1. Mismatched days are returned as dicts
+2. The user filter is passed as a parameter; `None` checks every user
+"""
+
+
+@pytest.mark.parametrize("user_id", [6, None], ids=["one_user", "all_users"])
+def test_verify(user_id):
+    mismatch = {
+        "user_id": 6,
+        "date": "2025-06-15",
+        "expected": "(2001,115,65,250,3)",
+        "stored": "(1500,100,50,200,2)",
+    }
+    cursor = FakeCursor(fetchall_result=[mismatch])
+
+    result = verify(FakeConnection(cursor), user_id)
+
+    assert result == [mismatch]
+    query, parameters = cursor.executed[0]
+    assert "FULL OUTER JOIN" in query
+    assert parameters == {"user_id": user_id}
+
+
+"""
+Test that `rebuild` locks out writers, then replaces the user's rollup rows
+with sums of their entries in a single transaction.
+"""
+
+
+def test_rebuild():
+    cursor = FakeCursor()
+    connection = FakeConnection(cursor)
+
+    rebuild(connection, 6)
+
+    assert connection.transactions == 1
+    queries = [query for query, _ in cursor.executed]
+    assert queries[0].startswith("LOCK TABLE nutrition")
+    assert "DELETE FROM daily_totals" in queries[1]
+    assert "INSERT INTO daily_totals" in queries[2]
+    assert all(
+        parameters == {"user_id": 6} for _, parameters in cursor.executed
+    )
+
+
+"""
+Test that the triggers on `nutrition` keep `daily_totals` equal to the sums
+of entries through an insert, an edit on the same day, a move to another day
+and a delete, against a real database (see `conftest.database`).
+"""
+
+TOTALS_QUERY = """
+    SELECT "date"::text, calories, protein, fat, carbs, entry_count
+    FROM daily_totals
+    WHERE user_id = 1
+    ORDER BY "date"
+"""
+
+
+def test_triggers_keep_totals(database):
+    with database.cursor() as cursor:
+        cursor.execute("""INSERT INTO targets DEFAULT VALUES;
+               INSERT INTO users (id, username, hashed_pwd, target_id)
+               VALUES (1, 'cat', 'hash', 1);""")
+
+        def totals():
+            cursor.execute(TOTALS_QUERY)
+            return cursor.fetchall()
+
+        cursor.execute("""INSERT INTO nutrition
+                   (user_id, "date", calories, protein, fat, carbs)
+               VALUES (1, '2025-06-24', 100, 10, 5, 20),
+                      (1, '2025-06-24', 200, 20, 10, 40)
+               RETURNING id""")
+        first_id, second_id = (row[0] for row in cursor.fetchall())
+        assert totals() == [("2025-06-24", 300, 30, 15, 60, 2)]
+
+        cursor.execute(
+            "UPDATE nutrition SET calories = 150 WHERE id = %s", (first_id,)
+        )
+        assert totals() == [("2025-06-24", 350, 30, 15, 60, 2)]
+
+        cursor.execute(
+            """UPDATE nutrition SET "date" = '2025-06-25'
+               WHERE id = %s""",
+            (second_id,),
+        )
+        assert totals() == [
+            ("2025-06-24", 150, 10, 5, 20, 1),
+            ("2025-06-25", 200, 20, 10, 40, 1),
+        ]
+
+        # Moving the day's only entry onto a day with entries
+        cursor.execute(
+            """UPDATE nutrition SET "date" = '2025-06-25'
+               WHERE id = %s""",
+            (first_id,),
+        )
+        assert totals() == [("2025-06-25", 350, 30, 15, 60, 2)]
+
+        cursor.execute("DELETE FROM nutrition WHERE id = %s", (second_id,))
+        assert totals() == [("2025-06-25", 150, 10, 5, 20, 1)]
+        cursor.execute("DELETE FROM nutrition WHERE id = %s", (first_id,))
+        assert totals() == []
+
+    assert verify(database) == []
@@ -1,7 +1,29 @@
 from unittest.mock import patch
-from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.db_persistence import (
+    BULK_INSERT_PAGE_SIZE,
+    EXPORT_ITERSIZE,
+    DatabasePersistence,
+    _CopySource,
+    _targets_cache,
+    _user_id_cache,
+    cache_stats,
+)
+from macro_mojo.chat_history import (
+    Chat,
+    ChatMemory,
+    decode_history,
+    decode_memory,
+    encode_history,
+    encode_memory,
+)
+from macro_mojo.passwords import PasswordCheck
+from macro_mojo.rows import DailyTotal, NutritionEntry, Remaining, Targets
 from contextlib import contextmanager
+from datetime import date, datetime
 import bcrypt
+import csv
+import io
+import psycopg2
 import pytest
 
 """ Custom class to simulate `cursor` objects and their behavior """
@@ -12,6 +34,7 @@ class FakeCursor:
         self.executed = []
         self.fetchone_result = fetchone_result
         self.fetchall_result = fetchall_result or []
+        self.rowcount = -1
 
     def execute(self, query, parameters=None):
         self.executed.append((query, parameters))
@@ -52,6 +75,8 @@ Scoped to functions (default scope)
 
 @pytest.fixture
 def dp():
+    _user_id_cache.clear()
+    _targets_cache.clear()
     return DatabasePersistence(dsn="fake_db")
 
 
@@ -82,15 +107,15 @@ def test_find_login_ok(dp):
     hashed_pwd = bcrypt.hashpw(
         "hungry".encode("utf-8"), bcrypt.gensalt()
     ).decode("utf-8")
-    # Instantiate a fake cursor object, pass dict with key-value pair for
-    # hashed password
-    cursor = FakeCursor(fetchone_result={"hashed_pwd": hashed_pwd})
+    # Instantiate a fake cursor object, pass the row of id and hashed
+    # password
+    cursor = FakeCursor(fetchone_result=(3, hashed_pwd))
     with patch_connect(dp, cursor):
-        # Call `find_login` using fake cursor. Returns `True` when username
+        # Call `find_login` using fake cursor. Returns user id when username
         # and password are correct
-        login_ok = dp.find_login("cat", "hungry")
-    # Check that `find_login` returns `True`
-    assert login_ok is True
+        login_user_id = dp.find_login("cat", "hungry")
+    # Check that `find_login` returns the user id
+    assert login_user_id == 3
     # Check that only one SQL was executed
     assert len(cursor.executed) == 1
 
@@ -105,21 +130,55 @@ def test_find_login_wrong_password(dp):
     hashed_pwd = bcrypt.hashpw(
         "hungry".encode("utf-8"), bcrypt.gensalt()
     ).decode("utf-8")
-    cursor = FakeCursor(fetchone_result={"hashed_pwd": hashed_pwd})
+    cursor = FakeCursor(fetchone_result=(3, hashed_pwd))
     with patch_connect(dp, cursor):
-        # Call `find_login` using fake cursor. Returns `False` when password
+        # Call `find_login` using fake cursor. Returns `None` when password
         # is not correct
         find_login_result = dp.find_login("cat", "not_hungry")
-    assert find_login_result is False
+    assert find_login_result is None
 
 
 def test_find_login_wrong_username(dp):
     cursor = FakeCursor(fetchone_result=None)
     with patch_connect(dp, cursor):
-        # Call `find_login` using fake cursor. Returns `False` if username
+        # Call `find_login` using fake cursor. Returns `None` if username
         # not found
         find_login_result = dp.find_login("snake", "hungry")
-    assert find_login_result is False
+    assert find_login_result is None
+
+
+"""
+Test that a matching password whose hash is below the current cost factor is
+rehashed, and the new hash stored only if the old one is still in place.
+"""
+
+
+class FakeVerifier:
+    def __init__(self, check):
+        self.check = check
+        self.verified = []
+
+    def verify(self, password, hashed_pwd):
+        self.verified.append((password, hashed_pwd))
+        return self.check
+
+
+def test_find_login_rehashes_weak_hash():
+    verifier = FakeVerifier(PasswordCheck(True, "$2b$12$new"))
+    dp = DatabasePersistence(dsn="fake_db", verifier=verifier)
+    cursor = FakeCursor(fetchone_result=(3, "$2b$04$old"))
+
+    with patch_connect(dp, cursor):
+        login_user_id = dp.find_login("cat", "hungry")
+
+    assert login_user_id == 3
+    assert verifier.verified == [("hungry", "$2b$04$old")]
+    assert len(cursor.executed) == 2
+    query, parameters = cursor.executed[1]
+    assert "UPDATE users SET hashed_pwd" in query
+    assert "AND hashed_pwd = %s" in query
+    assert parameters == ("$2b$12$new", 3, "$2b$04$old")
+    assert dp.wrote
 
 
 """
@@ -137,110 +196,107 @@ def test_find_user_id_by_username_not_found(dp):
 
 
 def test_find_user_id_by_username_ok(dp):
-    cursor = FakeCursor(fetchone_result={"id": 27})
+    cursor = FakeCursor(fetchone_result=(27,))
     with patch_connect(dp, cursor):
         id_ok = dp._find_user_id_by_username("hamster")
     assert id_ok == 27
 
 
 """
-Tests for method `daily_total_nutrition`.
-1. Check that the method returns correct `daily_total` when provided username
-   and date
-2. Returns `None` if rows with the specified date not found
+Tests for method `find_user_id`:
+1. Id resolved by username is cached, so the second call runs no query
+2. Usernames that are not found are not cached
 """
 
 
-def test_daily_total_nutrition_ok(dp, monkeypatch):
-    expected_daily_total = {
-        "calories": 1000,
-        "protein": 34,
-        "fat": 11,
-        "carbs": 191,
-    }
-    cursor = FakeCursor(fetchone_result=expected_daily_total)
+def test_find_user_id_cached(dp):
+    cursor = FakeCursor(fetchone_result=(31,))
+    with patch_connect(dp, cursor):
+        first = dp.find_user_id("parrot")
+        second = dp.find_user_id("parrot")
+    assert first == second == 31
+    assert len(cursor.executed) == 1
 
-    # Replace helper method `_find_user_id_by_username` with a spy that takes
-    # username as argument and returns `id` value
-    captured_username = {}
 
-    def fake_id_lookup(username):
-        captured_username["value"] = username
-        return 6
+def test_find_user_id_not_found_not_cached(dp):
+    cursor = FakeCursor(fetchone_result=None)
+    with patch_connect(dp, cursor):
+        assert dp.find_user_id("ghost") is None
+        assert dp.find_user_id("ghost") is None
+    assert len(cursor.executed) == 2
 
-    monkeypatch.setattr(dp, "_find_user_id_by_username", fake_id_lookup)
+
+"""
+Tests for method `daily_total_nutrition`.
+1. Check that the method returns correct `daily_total` when provided user id
+   and date
+2. Returns `None` if rows with the specified date not found
+"""
+
+
+def test_daily_total_nutrition_ok(dp):
+    row = (date(2025, 9, 14), 1000, 34, 11, 191, 3)
+    cursor = FakeCursor(fetchone_result=row)
 
     with patch_connect(dp, cursor):
-        test_result = dp.daily_total_nutrition("Mike", "2025-09-14")
-    assert test_result == expected_daily_total
-    assert captured_username["value"] == "Mike"
+        test_result = dp.daily_total_nutrition(6, "2025-09-14")
+    assert test_result == DailyTotal(date(2025, 9, 14), 1000, 34, 11, 191, 3)
+    assert test_result.calories == 1000
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
-    assert "SELECT SUM(calories)" in query
+    assert "SUM(calories) AS calories" in query
     assert parameters == (6, "2025-09-14")
 
 
-def test_daily_total_nutrition_no_rows(dp, monkeypatch):
+def test_daily_total_nutrition_no_rows(dp):
     cursor = FakeCursor(fetchone_result=None)
-    monkeypatch.setattr(dp, "_find_user_id_by_username", lambda username: 5)
 
     with patch_connect(dp, cursor):
-        test_result = dp.daily_total_nutrition("Mike", "2025-03-14")
+        test_result = dp.daily_total_nutrition(5, "2025-03-14")
     assert test_result is None
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
-    assert "SELECT SUM(calories)" in query
+    assert "SUM(calories) AS calories" in query
     assert parameters == (5, "2025-03-14")
 
 
 """
-Tests for method `get_nutrition_left.
+Tests for method `get_nutrition_left`. Targets come from the cache, so only
+the day's totals are queried.
 1. Check that the method returns correct `nutrition_left` when provided 
-   username and date
+   user id and date
 2. Returns `None` if rows with the specified date not found
 """
 
 
-def test_get_nutrition_left_ok(dp, monkeypatch):
-    expected_nutrition_left = {
-        "Calories left": 500,
-        "Protein left": 30,
-        "Fat left": 11,
-        "Carbs left": 10,
-    }
-    cursor = FakeCursor(fetchone_result=expected_nutrition_left)
-
-    captured_username = {}
-
-    def fake_id_lookup(username):
-        captured_username["value"] = username
-        return 6
-
-    monkeypatch.setattr(dp, "_find_user_id_by_username", fake_id_lookup)
+def test_get_nutrition_left_ok(dp):
+    _targets_cache.set(6, Targets(2000, 100, 60, 260))
+    cursor = FakeCursor(
+        fetchone_result=(date(2025, 9, 14), 1500, 70, 49, 250, 3)
+    )
 
     with patch_connect(dp, cursor):
-        test_result = dp.get_nutrition_left("Mike", "2025-09-14")
+        test_result = dp.get_nutrition_left(6, "2025-09-14")
 
-    assert test_result == expected_nutrition_left
-    assert captured_username["value"] == "Mike"
+    assert test_result == Remaining(500, 30, 11, 10)
+    assert test_result.carbs == 10
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
-    assert "SELECT (calorie_target - SUM(calories))" in query
-    assert "LEFT OUTER JOIN targets ON target_id" in query
-    assert "LEFT OUTER JOIN nutrition ON nutrition" in query
+    assert "SUM(calories) AS calories" in query
+    assert "targets" not in query
     assert parameters == (6, "2025-09-14")
 
 
-def test_get_nutrition_left_no_rows(dp, monkeypatch):
+def test_get_nutrition_left_no_rows(dp):
+    _targets_cache.set(6, Targets(2000, 100, 60, 260))
     cursor = FakeCursor(fetchone_result=None)
-    monkeypatch.setattr(dp, "_find_user_id_by_username", lambda username: 6)
 
     with patch_connect(dp, cursor):
-        test_result = dp.get_nutrition_left("Mike", "2025-03-14")
+        test_result = dp.get_nutrition_left(6, "2025-03-14")
     assert test_result is None
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
-    assert "SELECT (calorie_target - SUM(calories))" in query
+    assert "SUM(calories) AS calories" in query
     assert parameters == (6, "2025-03-14")
 
 
@@ -251,72 +307,180 @@ Note: Switched to pytest parametrization to avoid code repetition.
 """
 
 
+APPLE = (
+    42,
+    date(2025, 9, 14),
+    datetime(2025, 9, 14, 10, 1),
+    50,
+    1,
+    1,
+    12,
+    "apple",
+)
+SMOOTHIE = (
+    43,
+    date(2025, 9, 14),
+    datetime(2025, 9, 14, 10, 3),
+    450,
+    30,
+    10,
+    60,
+    "smoothie",
+)
+
+
 @pytest.mark.parametrize(
-    "username, date, user_id, fetchall_rows, expected",
+    "day, user_id, fetchall_rows, expected",
     [
         (
-            "Mike",
             "2025-09-14",
             6,
-            [
-                {
-                    "nutrition_entry_id": 42,
-                    "Added at": "10:01 AM",
-                    "Calories": 50,
-                    "Protein": 1,
-                    "Fat": 1,
-                    "Carbohydrates": 12,
-                    "Meals or snacks": "apple",
-                },
-                {
-                    "nutrition_entry_id": 43,
-                    "Added at": "10:03 AM",
-                    "Calories": 450,
-                    "Protein": 30,
-                    "Fat": 10,
-                    "Carbohydrates": 60,
-                    "Meals or snacks": "smoothie",
-                },
-            ],
-            [
-                {
-                    "nutrition_entry_id": 42,
-                    "Added at": "10:01 AM",
-                    "Calories": 50,
-                    "Protein": 1,
-                    "Fat": 1,
-                    "Carbohydrates": 12,
-                    "Meals or snacks": "apple",
-                },
-                {
-                    "nutrition_entry_id": 43,
-                    "Added at": "10:03 AM",
-                    "Calories": 450,
-                    "Protein": 30,
-                    "Fat": 10,
-                    "Carbohydrates": 60,
-                    "Meals or snacks": "smoothie",
-                },
-            ],
+            [SMOOTHIE, APPLE],
+            [NutritionEntry(*SMOOTHIE), NutritionEntry(*APPLE)],
         ),
-        ("Mike", "2025-09-14", 6, [], []),
+        ("2025-09-14", 6, [], []),
     ],
     ids=["daily_nutrition_with_rows", "daily_nutrition_no_rows"],
 )
-def test_get_daily_nutrition_param(
-    dp, monkeypatch, username, date, user_id, fetchall_rows, expected
-):
+def test_get_daily_nutrition_param(dp, day, user_id, fetchall_rows, expected):
     cursor = FakeCursor(fetchall_result=fetchall_rows)
-    monkeypatch.setattr(dp, "_find_user_id_by_username", lambda u: user_id)
 
     with patch_connect(dp, cursor):
-        result = dp.get_daily_nutrition(username, date)
+        result = dp.get_daily_nutrition(user_id, day)
 
     assert result == expected
+    assert all(isinstance(entry, NutritionEntry) for entry in result)
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
     assert "FROM nutrition" in query
-    assert parameters == (user_id, date)
+    # Times are formatted by the template
+    assert "TO_CHAR" not in query
+    assert parameters == (user_id, day)
+
+
+"""
+Tests for method `get_day_snapshot`:
+1. Totals, nutrition left and entries come from one query on one connection,
+   with totals read from the `daily_totals` rollup
+2. A day without entries has an empty `entries` list and a count of 0
+3. An `after` cursor reads newer entries in ascending order
+"""
+
+
+def test_get_day_snapshot_with_entries(dp):
+    day_totals = (date(2025, 9, 14), 500, 31, 11, 72, 7)
+    nutrition_left = (1500, 69, 49, 193)
+    rows = [
+        day_totals + nutrition_left + SMOOTHIE,
+        day_totals + nutrition_left + APPLE,
+    ]
+    cursor = FakeCursor(fetchall_result=rows)
+
+    with patch_connect(dp, cursor):
+        snapshot = dp.get_day_snapshot(6, "2025-09-14", before=44, per_page=5)
+
+    assert snapshot["entry_count"] == 7
+    assert snapshot["daily_total"] == DailyTotal(*day_totals)
+    assert snapshot["nutrition_left"] == Remaining(1500, 69, 49, 193)
+    assert snapshot["entries"] == [
+        NutritionEntry(*SMOOTHIE),
+        NutritionEntry(*APPLE),
+    ]
+    assert snapshot["entries"][1].meal == "apple"
+    assert len(cursor.executed) == 1
+    query, parameters = cursor.executed[0]
+    assert "LEFT JOIN daily_totals AS day_total" in query
+    assert "(entered_at, id) < (" in query
+    assert "ORDER BY entered_at DESC, id DESC" in query
+    assert parameters == {
+        "user_id": 6,
+        "date": "2025-09-14",
+        "cursor_id": 44,
+        "limit": 5,
+    }
+
+
+def test_get_day_snapshot_no_entries(dp):
+    row = (None, None, None, None, None, 0) + (None,) * 4 + (None,) * 8
+    cursor = FakeCursor(fetchall_result=[row])
+
+    with patch_connect(dp, cursor):
+        snapshot = dp.get_day_snapshot(6, "2025-03-14")
+
+    assert snapshot["entry_count"] == 0
+    assert snapshot["entries"] == []
+    assert len(cursor.executed) == 1
+
+
+def test_get_day_snapshot_after_cursor(dp):
+    cursor = FakeCursor(fetchall_result=[])
+
+    with patch_connect(dp, cursor):
+        dp.get_day_snapshot(6, "2025-09-14", after=40)
+
+    query, parameters = cursor.executed[0]
+    assert "(entered_at, id) > (" in query
+    assert "ORDER BY entered_at ASC, id ASC" in query
+    assert parameters["cursor_id"] == 40
+
+
+"""
+Tests for method `get_daily_totals_page`:
+1. First page has no cursor condition and returns days with the day count
+2. `before` and `after` cursors filter on date in the matching direction
+3. A page past the end of the history returns no days
+4. Days are read from the `daily_totals` rollup rather than aggregated
+"""
+
+
+def test_get_daily_totals_page_first_page(dp):
+    rows = [(12, date(2025, 6, 15), 2001, 115, 65, 250, 4)]
+    cursor = FakeCursor(fetchall_result=rows)
+
+    with patch_connect(dp, cursor):
+        result = dp.get_daily_totals_page(6)
+
+    assert result == {
+        "day_count": 12,
+        "days": [DailyTotal(date(2025, 6, 15), 2001, 115, 65, 250, 4)],
+    }
+    assert len(cursor.executed) == 1
+    query, parameters = cursor.executed[0]
+    assert "%(cursor_date)s" not in query
+    assert "LIMIT %(limit)s" in query
+    assert "FROM daily_totals" in query
+    assert "SUM(" not in query
+    assert parameters == {"user_id": 6, "cursor_date": None, "limit": 5}
+
+
+@pytest.mark.parametrize(
+    "cursor_kwargs, condition, order",
+    [
+        ({"before": "2025-06-15"}, '"date" < %(cursor_date)s', "DESC"),
+        ({"after": "2025-06-15"}, '"date" > %(cursor_date)s', "ASC"),
+    ],
+    ids=["before_cursor", "after_cursor"],
+)
+def test_get_daily_totals_page_cursor(dp, cursor_kwargs, condition, order):
+    cursor = FakeCursor(fetchall_result=[])
+
+    with patch_connect(dp, cursor):
+        dp.get_daily_totals_page(6, **cursor_kwargs)
+
+    query, parameters = cursor.executed[0]
+    assert condition in query
+    assert f'ORDER BY "date" {order}' in query
+    assert parameters["cursor_date"] == "2025-06-15"
+
+
+def test_get_daily_totals_page_past_end(dp):
+    row = (3, None, None, None, None, None, None)
+    cursor = FakeCursor(fetchall_result=[row])
+
+    with patch_connect(dp, cursor):
+        result = dp.get_daily_totals_page(6, before="2020-01-01")
+
+    assert result == {"day_count": 3, "days": []}
 
 
 """
@@ -325,39 +489,29 @@ Tests for method `get_user_targets`: with and without existing targets.
 
 
 @pytest.mark.parametrize(
-    "username, user_id, fetchone_result, expected",
+    "user_id, fetchone_result, expected",
     [
         (
-            "Mike",
             6,
-            {
-                "calorie_target": 2000,
-                "protein_target": 100,
-                "fat_target": 60,
-                "carb_target": 260,
-            },
-            {
-                "calorie_target": 2000,
-                "protein_target": 100,
-                "fat_target": 60,
-                "carb_target": 260,
-            },
+            (2000, 100, 60, 260),
+            Targets(
+                calorie_target=2000,
+                protein_target=100,
+                fat_target=60,
+                carb_target=260,
+            ),
         ),
-        ("Jess", 7, None, None),
+        (7, None, None),
     ],
     ids=["user_targets_exist", "user_targets_dont_exist"],
 )
-def test_get_user_targets(
-    dp, monkeypatch, username, user_id, fetchone_result, expected
-):
-    # mock find_user_by_if using mmonekypatch and lambda
+def test_get_user_targets(dp, user_id, fetchone_result, expected):
     # use fake cursor and face connection to execute the query
     # assert
     cursor = FakeCursor(fetchone_result=fetchone_result)
-    monkeypatch.setattr(dp, "_find_user_id_by_username", lambda u: user_id)
 
     with patch_connect(dp, cursor):
-        result = dp.get_user_targets(username)
+        result = dp.get_user_targets(user_id)
 
     assert result == expected
     assert len(cursor.executed) == 1
@@ -372,25 +526,51 @@ Tests for the method `update_user_targets`
 """
 
 
-def test_update_user_targets_ok(dp, monkeypatch):
+def test_update_user_targets_ok(dp):
     cursor = FakeCursor()
 
-    captured_username = {}
+    with patch_connect(dp, cursor):
+        dp.update_user_targets(6, 1500, 100, 10, 300)
 
-    def fake_id_lookup(username):
-        captured_username["value"] = username
-        return 6
+    assert len(cursor.executed) == 1
+    query, parameters = cursor.executed[0]
+    assert "UPDATE targets" in query
+    assert parameters == (1500, 100, 10, 300, 6)
 
-    monkeypatch.setattr(dp, "_find_user_id_by_username", fake_id_lookup)
+
+"""
+Tests for the targets cache:
+1. Targets are read from the database once, then from the cache
+2. `update_user_targets` invalidates the cached targets, so the next read
+   goes to the database
+"""
+
+
+def test_get_user_targets_cached(dp):
+    cursor = FakeCursor(fetchone_result=(2000, 100, 60, 260))
 
     with patch_connect(dp, cursor):
-        dp.update_user_targets("Mike", 1500, 100, 10, 300)
+        first = dp.get_user_targets(6)
+        second = dp.get_user_targets(6)
 
-    assert captured_username["value"] == "Mike"
+    assert first == second == Targets(2000, 100, 60, 260)
     assert len(cursor.executed) == 1
-    query, parameters = cursor.executed[0]
-    assert "UPDATE targets " in query
-    assert parameters == (1500, 100, 10, 300, 6)
+    assert cache_stats()["targets"]["hits"] >= 1
+
+
+def test_update_user_targets_invalidates_cache(dp):
+    cursor = FakeCursor(fetchone_result=(2000, 100, 60, 260))
+
+    with patch_connect(dp, cursor):
+        dp.get_user_targets(6)
+        dp.update_user_targets(6, 1500, 100, 10, 300)
+        cursor.fetchone_result = (1500, 100, 10, 300)
+        result = dp.get_user_targets(6)
+
+    assert result == Targets(1500, 100, 10, 300)
+    queries = [query for query, _ in cursor.executed]
+    assert len(queries) == 3
+    assert "FROM targets" in queries[2]
 
 
 """ Tests for the method `get_user_all_nutrition`. Cases:
@@ -400,63 +580,35 @@ def test_update_user_targets_ok(dp, monkeypatch):
 
 
 @pytest.mark.parametrize(
-    "username, user_id, fetchall_result, expected",
+    "user_id, fetchall_result, expected",
     [
         (
-            "Mike",
             6,
             [
-                {
-                    "date": "2025-06-15",
-                    "calories": 2001,
-                    "protein": 115,
-                    "fat": 65,
-                    "carbs": 250,
-                },
-                {
-                    "date": "2025-02-17",
-                    "calories": 2000,
-                    "protein": 110,
-                    "fat": 60,
-                    "carbs": 252,
-                },
+                (date(2025, 6, 15), 2001, 115, 65, 250, 4),
+                (date(2025, 2, 17), 2000, 110, 60, 252, 5),
             ],
             [
-                {
-                    "date": "2025-06-15",
-                    "calories": 2001,
-                    "protein": 115,
-                    "fat": 65,
-                    "carbs": 250,
-                },
-                {
-                    "date": "2025-02-17",
-                    "calories": 2000,
-                    "protein": 110,
-                    "fat": 60,
-                    "carbs": 252,
-                },
+                DailyTotal(date(2025, 6, 15), 2001, 115, 65, 250, 4),
+                DailyTotal(date(2025, 2, 17), 2000, 110, 60, 252, 5),
             ],
         ),
-        ("Mike", 6, [], []),
+        (6, [], []),
     ],
     ids=["user_all_nutrition_with_rows", "user_all_nutrition_no_rows"],
 )
-def test_get_user_all_nutrition(
-    dp, monkeypatch, username, user_id, fetchall_result, expected
-):
+def test_get_user_all_nutrition(dp, user_id, fetchall_result, expected):
 
     cursor = FakeCursor(fetchall_result=fetchall_result)
-    monkeypatch.setattr(dp, "_find_user_id_by_username", lambda u: user_id)
 
     with patch_connect(dp, cursor):
-        result = dp.get_user_all_nutrition(username)
+        result = dp.get_user_all_nutrition(user_id)
 
     assert result == expected
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
     assert "SELECT date" in query
-    assert "SUM(calories)" in query
+    assert "FROM daily_totals" in query
     assert parameters == (6,)
 
 
@@ -465,23 +617,14 @@ Tests for the method `add_nutrition_entry`.
 """
 
 
-def test_add_nutrition_entry(dp, monkeypatch):
+def test_add_nutrition_entry(dp):
     cursor = FakeCursor()
 
-    captured_username = {}
-
-    def fake_id_lookup(username):
-        captured_username["value"] = username
-        return 6
-
-    monkeypatch.setattr(dp, "_find_user_id_by_username", fake_id_lookup)
-
     with patch_connect(dp, cursor):
         dp.add_nutrition_entry(
-            "2025-06-24", "Mike", 500, 50, 20, 25, "chicken bowl"
+            6, "2025-06-24", 500, 50, 20, 25, "chicken bowl"
         )
 
-    assert captured_username["value"] == "Mike"
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
     assert "INSERT INTO nutrition" in query
@@ -489,9 +632,181 @@ def test_add_nutrition_entry(dp, monkeypatch):
 
 
 """
-Tests for the `find_nutrition_entry_by_id`. Cases: 
-- nutrition_entry_id is found
-- nutrition_entry_id is not found
+Tests for the export reads, `iter_nutrition_entries` and `iter_daily_totals`:
+1. Rows come from a named (server-side) cursor with a fixed `itersize`
+2. Nothing is queried until the caller starts iterating
+"""
+
+
+class FakeNamedCursor(FakeCursor):
+    def __iter__(self):
+        return iter(self.fetchall_result)
+
+
+class FakeNamedConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.cursor_name = None
+
+    def cursor(self, name=None, cursor_factory=None):
+        self.cursor_name = name
+        return self._cursor
+
+
+@pytest.mark.parametrize(
+    "method, table, row_type, rows",
+    [
+        ("iter_nutrition_entries", "FROM nutrition", NutritionEntry, [APPLE]),
+        (
+            "iter_daily_totals",
+            "FROM daily_totals",
+            DailyTotal,
+            [
+                (date(2025, 6, 24), 500, 50, 20, 25, 1),
+                (date(2025, 6, 25), 200, 6, 3, 30, 1),
+            ],
+        ),
+    ],
+)
+def test_export_reads_use_named_cursor(dp, method, table, row_type, rows):
+    cursor = FakeNamedCursor(fetchall_result=rows)
+    connection = FakeNamedConnection(cursor)
+
+    @contextmanager
+    def fake_connect():
+        yield connection
+
+    with patch.object(dp, "_database_connect", fake_connect):
+        result = getattr(dp, method)(6)
+        assert cursor.executed == []
+        assert list(result) == [row_type._make(row) for row in rows]
+
+    assert connection.cursor_name
+    assert cursor.itersize == EXPORT_ITERSIZE
+    query, parameters = cursor.executed[0]
+    assert table in query
+    assert parameters == (6,)
+
+
+"""
+Tests for `add_nutrition_entries`:
+1. A batch is converted to typed rows and sent with one `execute_values` call
+   on one connection
+2. An empty batch doesn't connect to the database
+"""
+
+
+def test_add_nutrition_entries(dp):
+    cursor = FakeCursor()
+    calls = []
+
+    def fake_execute_values(cursor, query, values, page_size):
+        calls.append((cursor, query, values, page_size))
+
+    rows = [
+        {
+            "date": "2025-06-24",
+            "calories": "500",
+            "protein": 50,
+            "fat": 20,
+            "carbs": 25,
+            "meal": "chicken bowl",
+        },
+        {
+            "date": "2025-06-25",
+            "calories": 90,
+            "protein": 1,
+            "fat": 0,
+            "carbs": 23,
+        },
+    ]
+    with (
+        patch_connect(dp, cursor),
+        patch("macro_mojo.db_persistence.execute_values", fake_execute_values),
+    ):
+        added = dp.add_nutrition_entries(6, rows)
+
+    assert added == 2
+    assert len(calls) == 1
+    call_cursor, query, values, page_size = calls[0]
+    assert call_cursor is cursor
+    assert "INSERT INTO nutrition" in query
+    assert "VALUES %s" in query
+    assert values == [
+        (6, "chicken bowl", "2025-06-24", 500, 50, 20, 25),
+        (6, "", "2025-06-25", 90, 1, 0, 23),
+    ]
+    assert page_size == BULK_INSERT_PAGE_SIZE
+
+
+def test_add_nutrition_entries_empty(dp):
+    def fail_connect():
+        raise AssertionError("connected for an empty batch")
+
+    with patch.object(dp, "_database_connect", fail_connect):
+        assert dp.add_nutrition_entries(6, []) == 0
+
+
+"""
+Tests for `copy_nutrition_entries` and `_CopySource`:
+1. Rows are copied with the user id prepended, and the COPY row count is
+   returned
+2. The source is read in chunks no larger than requested, every field is
+   quoted, and rows are pulled from the iterator lazily
+"""
+
+
+class FakeCopyCursor(FakeCursor):
+    def copy_expert(self, query, file, size):
+        chunks = iter(lambda: file.read(size), "")
+        self.copied = "".join(chunks)
+        self.executed.append((query, None))
+        self.rowcount = len(self.copied.splitlines())
+
+
+def test_copy_nutrition_entries(dp):
+    cursor = FakeCopyCursor()
+    rows = [
+        ("toast", "2025-06-24", 200, 6, 3, 30),
+        ("", "2025-06-25", 5, 0, 0, 1),
+    ]
+
+    with patch_connect(dp, cursor):
+        copied = dp.copy_nutrition_entries(6, iter(rows))
+
+    assert copied == 2
+    query, _ = cursor.executed[0]
+    assert "FROM STDIN WITH (FORMAT csv)" in query
+    assert cursor.copied.splitlines() == [
+        '"6","toast","2025-06-24","200","6","3","30"',
+        '"6","","2025-06-25","5","0","0","1"',
+    ]
+
+
+def test_copy_source_reads_lazily():
+    pulled = []
+
+    def rows():
+        for number in range(1000):
+            pulled.append(number)
+            yield (number, 'meal, with "quotes"\nand a newline')
+
+    source = _CopySource(rows())
+    first = source.read(100)
+    assert len(first) == 100
+    assert len(pulled) < 10
+
+    rest = iter(lambda: source.read(100), "")
+    parsed = list(csv.reader(io.StringIO(first + "".join(rest))))
+    assert len(parsed) == 1000
+    assert parsed[999] == ["999", 'meal, with "quotes"\nand a newline']
+
+
+"""
+Tests for the `find_nutrition_entry`. Cases: 
+- nutrition_entry_id is found for the user
+- nutrition_entry_id is not found, belongs to another user or is on
+  another date
 """
 
 
@@ -500,28 +815,26 @@ Tests for the `find_nutrition_entry_by_id`. Cases:
     [
         (
             10,
-            {
-                "id": 10,
-                "user_id": 6,
-                "date": "2025-10-01",
-                "entered_at": "2025-10-01 10:12:15.789123",
-                "calories": 180,
-                "protein": 21,
-                "fat": 5,
-                "carbs": 3,
-                "meal": "protein bar",
-            },
-            {
-                "id": 10,
-                "user_id": 6,
-                "date": "2025-10-01",
-                "entered_at": "2025-10-01 10:12:15.789123",
-                "calories": 180,
-                "protein": 21,
-                "fat": 5,
-                "carbs": 3,
-                "meal": "protein bar",
-            },
+            (
+                10,
+                date(2025, 10, 1),
+                datetime(2025, 10, 1, 10, 12, 15, 789123),
+                180,
+                21,
+                5,
+                3,
+                "protein bar",
+            ),
+            NutritionEntry(
+                id=10,
+                date=date(2025, 10, 1),
+                entered_at=datetime(2025, 10, 1, 10, 12, 15, 789123),
+                calories=180,
+                protein=21,
+                fat=5,
+                carbs=3,
+                meal="protein bar",
+            ),
         ),
         (
             10412,
@@ -531,98 +844,285 @@ Tests for the `find_nutrition_entry_by_id`. Cases:
     ],
     ids=["nutrition_entry_id_exists", "nutrition_entry_doesnt_exist"],
 )
-def test_find_nutrition_entry_by_id(
+def test_find_nutrition_entry(
     dp, nutrition_entry_id, nutrition_entry_result, expected
 ):
     cursor = FakeCursor(fetchone_result=nutrition_entry_result)
 
     with patch_connect(dp, cursor):
-        result = dp.find_nutrition_entry_by_id(nutrition_entry_id)
+        result = dp.find_nutrition_entry(6, nutrition_entry_id, "2025-10-01")
 
     assert result == expected
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
-    assert "SELECT * FROM nutrition" in query
-    assert parameters == (nutrition_entry_id,)
+    assert "FROM nutrition" in query
+    assert 'WHERE id = %s AND user_id = %s AND "date" = %s' in query
+    assert parameters == (nutrition_entry_id, 6, "2025-10-01")
 
 
 """
-Tests for `update_nutrition_entry`
+Tests for `update_nutrition_entry`. Ownership is checked in the `UPDATE`
+itself: returns `True` if a row was updated, `False` otherwise.
 """
 
 
-def test_update_nutrition_entry(dp):
-    cursor = FakeCursor()
+@pytest.mark.parametrize(
+    "fetchone_result, expected",
+    [((104,), True), (None, False)],
+    ids=["entry_updated", "entry_not_owned"],
+)
+def test_update_nutrition_entry(dp, fetchone_result, expected):
+    cursor = FakeCursor(fetchone_result=fetchone_result)
 
     with patch_connect(dp, cursor):
-        dp.update_nutrition_entry(104, 1500, 40, 70, 177, "pasta")
+        result = dp.update_nutrition_entry(
+            6, 104, "2025-06-24", 1500, 40, 70, 177, "pasta"
+        )
 
+    assert result is expected
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
     assert "UPDATE nutrition" in query
-    assert parameters == (1500, 40, 70, 177, "pasta", 104)
+    assert 'WHERE id = %s AND user_id = %s AND "date" = %s' in query
+    assert "RETURNING id" in query
+    assert parameters == (1500, 40, 70, 177, "pasta", 104, 6, "2025-06-24")
 
 
 """
-Tests for `delete_nutrition_entry`
+Tests for `delete_nutrition_entry`. Ownership is checked in the `DELETE`
+itself: returns `True` if a row was deleted, `False` otherwise.
 """
 
 
-def test_delete_nutrition_entry(dp):
-    cursor = FakeCursor()
+@pytest.mark.parametrize(
+    "fetchone_result, expected",
+    [((104,), True), (None, False)],
+    ids=["entry_deleted", "entry_not_owned"],
+)
+def test_delete_nutrition_entry(dp, fetchone_result, expected):
+    cursor = FakeCursor(fetchone_result=fetchone_result)
     nutrition_entry_id = 104
 
     with patch_connect(dp, cursor):
-        dp.delete_nutrition_entry(nutrition_entry_id)
+        result = dp.delete_nutrition_entry(6, nutrition_entry_id, "2025-06-24")
 
+    assert result is expected
     assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
     assert "DELETE FROM nutrition" in query
-    assert parameters == (104,)
+    assert "RETURNING id" in query
+    assert parameters == (104, 6, "2025-06-24")
+
+
+"""
+Test that a persistence object created with a pool borrows a connection from
+the pool and returns it, and prepares registry queries once per connection.
+"""
+
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection_obj = connection
+        self.borrowed = 0
+        self.returned = 0
+
+    @contextmanager
+    def connection(self):
+        self.borrowed += 1
+        try:
+            yield self.connection_obj
+        finally:
+            self.returned += 1
+
+
+class FakeTransactionConnection(FakeConnection):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+def test_database_connect_uses_pool():
+    cursor = FakeCursor(fetchone_result=(27,))
+    connection = FakeTransactionConnection(cursor)
+    cursor.connection = connection
+    pool = FakePool(connection)
+    dp = DatabasePersistence(pool=pool)
+
+    user_id = dp._find_user_id_by_username("hamster")
+
+    assert user_id == 27
+    assert pool.borrowed == 1
+    assert pool.returned == 1
+
+
+def test_pooled_queries_prepared_once_per_connection():
+    cursor = FakeCursor(fetchone_result=(27,))
+    connection = FakeTransactionConnection(cursor)
+    cursor.connection = connection
+    dp = DatabasePersistence(pool=FakePool(connection))
+
+    dp._find_user_id_by_username("hamster")
+    dp._find_user_id_by_username("ferret")
+
+    assert [query for query, _ in cursor.executed] == [
+        "PREPARE find_user_id AS SELECT id FROM users WHERE username = $1",
+        "EXECUTE find_user_id (%s)",
+        "EXECUTE find_user_id (%s)",
+    ]
+    assert [parameters for _, parameters in cursor.executed] == [
+        None,
+        ("hamster",),
+        ("ferret",),
+    ]
 
 
 """
-Tests for `get_all_nutrition_entries_ids`. Cases:
-- some nutrition id's exist
-- nutrition ids don't exist
+Tests for read replicas:
+1. Reads go to a replica and writes to the primary; after a write, the same
+   object reads from the primary
+2. Reads go to the primary when they are pinned there or no replica is
+   usable
+3. A replica connection that fails mid-query marks the replica down
 """
 
 
+class FakeReplicas:
+    def __init__(self, connection):
+        self.connection_obj = connection
+        self.borrowed = 0
+        self.returned = 0
+        self.down = []
+
+    def getconn(self):
+        if self.connection_obj is None:
+            return None
+        self.borrowed += 1
+        return 0, self.connection_obj
+
+    def putconn(self, index, connection):
+        self.returned += 1
+
+    def mark_down(self, index):
+        self.down.append(index)
+
+
+def replicated_dp(replica_connection, read_from_primary=False):
+    primary_cursor = FakeCursor()
+    primary = FakeTransactionConnection(primary_cursor)
+    primary_cursor.connection = primary
+    pool = FakePool(primary)
+    replicas = FakeReplicas(replica_connection)
+    dp = DatabasePersistence(
+        pool=pool, replicas=replicas, read_from_primary=read_from_primary
+    )
+    return dp, pool, replicas
+
+
+def test_reads_use_replica_until_write():
+    cursor = FakeCursor(fetchone_result=(2000, 100, 60, 260))
+    replica = FakeTransactionConnection(cursor)
+    cursor.connection = replica
+    dp, pool, replicas = replicated_dp(replica)
+
+    dp.get_user_targets(27)
+    assert (replicas.borrowed, replicas.returned) == (1, 1)
+    assert pool.borrowed == 0
+
+    dp.update_user_targets(27, "2000", "150", "70", "200")
+    dp.get_user_targets(27)
+    assert dp.wrote
+    assert replicas.borrowed == 1
+    assert pool.borrowed == 2
+
+
 @pytest.mark.parametrize(
-    "username, user_id, fetchall_result, expected",
+    "replica_available, read_from_primary", [(True, True), (False, False)]
+)
+def test_reads_use_primary(replica_available, read_from_primary):
+    replica = FakeTransactionConnection(FakeCursor())
+    dp, pool, replicas = replicated_dp(
+        replica if replica_available else None, read_from_primary
+    )
+
+    dp.get_user_targets(27)
+
+    assert replicas.borrowed == 0
+    assert pool.borrowed == 1
+    assert not dp.wrote
+
+
+def test_failed_replica_marked_down():
+    class FailingCursor(FakeCursor):
+        def execute(self, query, parameters=None):
+            raise psycopg2.OperationalError("server closed the connection")
+
+    cursor = FailingCursor()
+    replica = FakeTransactionConnection(cursor)
+    cursor.connection = replica
+    dp, _, replicas = replicated_dp(replica)
+
+    with pytest.raises(psycopg2.OperationalError):
+        dp.get_user_targets(27)
+
+    assert replicas.down == [0]
+    assert replicas.returned == 1
+
+
+"""
+Tests for chat history:
+1. Stored history and memory are decompressed; a chat without them is empty,
+   as is the memory of a chat from before memory was stored. Chats past
+   their time to live aren't loaded.
+2. Saving compresses the latest messages and the memory, and upserts them
+   for the user
+"""
+
+MEMORY = ChatMemory("Summary", (("human", "hi"), ("ai", "hello")))
+
+
+@pytest.mark.parametrize(
+    "fetchone_result, expected",
     [
         (
-            "Mike",
-            6,
-            [{"id": 1}, {"id": 2}, {"id": 3}, {"id": 45}],
-            [1, 2, 3, 45],
+            (
+                encode_history([{"sender": "cat", "text": "hi"}]),
+                encode_memory(MEMORY),
+            ),
+            Chat([{"sender": "cat", "text": "hi"}], MEMORY),
         ),
-        ("Sophia", 11, [], []),
-    ],
-    ids=[
-        "all_nutrition_entries_ids_some_values",
-        "all_nutrition_entries_ids_dont_exist",
+        (
+            (encode_history([{"sender": "cat", "text": "hi"}]), None),
+            Chat([{"sender": "cat", "text": "hi"}], ChatMemory()),
+        ),
+        (None, Chat([], ChatMemory())),
     ],
+    ids=["history_exists", "no_memory", "no_history"],
 )
-def test_get_all_nutrition_entries_ids(
-    dp, monkeypatch, username, user_id, fetchall_result, expected
-):
-    cursor = FakeCursor(fetchall_result=fetchall_result)
+def test_get_chat_history(dp, fetchone_result, expected):
+    cursor = FakeCursor(fetchone_result=fetchone_result)
 
-    captured_username = {}
+    with patch_connect(dp, cursor):
+        result = dp.get_chat_history("chat-1", 6, ttl=60)
 
-    def fake_id_lookup(username):
-        captured_username["value"] = username
-        return user_id
+    assert result == expected
+    query, parameters = cursor.executed[0]
+    assert "FROM chat_history" in query
+    assert "updated_at >=" in query
+    assert parameters == ("chat-1", 6, 60)
 
-    monkeypatch.setattr(dp, "_find_user_id_by_username", fake_id_lookup)
+
+def test_save_chat_history(dp):
+    cursor = FakeCursor()
+    history = [{"sender": "cat", "text": str(n)} for n in range(5)]
 
     with patch_connect(dp, cursor):
-        result_id_list = dp.get_all_nutrition_entries_ids(username)
+        dp.save_chat_history("chat-1", 6, history, MEMORY, max_messages=2)
 
-    assert captured_username["value"] == username
-    assert result_id_list == expected
-    assert len(cursor.executed) == 1
     query, parameters = cursor.executed[0]
-    assert "SELECT id FROM nutrition" in query
-    assert parameters == (user_id,)
+    assert "ON CONFLICT (chat_id) DO UPDATE" in query
+    chat_id, user_id, data, memory_data = parameters
+    assert (chat_id, user_id) == ("chat-1", 6)
+    assert decode_history(data) == history[-2:]
+    assert decode_memory(memory_data) == MEMORY
@@ -0,0 +1,223 @@
+from psycopg2 import extensions
+from macro_mojo.db_pool import ConnectionPool, PoolTimeout, ReplicaPools
+import psycopg2
+import pytest
+
+""" Custom classes to simulate `connection` objects and their behavior """
+
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeLagCursor:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def execute(self, query, parameters=None):
+        self._connection.lag_checks += 1
+
+    def fetchone(self):
+        return (self._connection.lag,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, dsn=None):
+        self.dsn = dsn
+        self.closed = 0
+        self.info = FakeInfo()
+        self.rollback_called = 0
+        # Seconds behind the primary, as reported to `ReplicaPools`
+        self.lag = 0
+        self.lag_checks = 0
+
+    def cursor(self):
+        return FakeLagCursor(self)
+
+    def rollback(self):
+        self.rollback_called += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+"""
+Pytest fixture replaces `psycopg2.connect` with a factory of fake connections
+and records every connection opened.
+"""
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    connections = []
+
+    def fake_connect(*args, **kwargs):
+        connection = FakeConnection(*args)
+        connections.append(connection)
+        return connection
+
+    monkeypatch.setattr("macro_mojo.db_pool.psycopg2.connect", fake_connect)
+    return connections
+
+
+"""
+Tests for borrowing and returning connections:
+1. Connections are reused instead of reopened
+2. `min_size` connections are opened on first use
+3. Broken connections are discarded
+4. Connections left in a transaction are rolled back
+"""
+
+
+def test_connection_reused(opened):
+    pool = ConnectionPool(dsn="fake_db", min_size=0, max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(opened) == 1
+    assert pool.stats()["idle"] == 1
+    assert pool.stats()["in_use"] == 0
+
+
+def test_min_size_opened_on_first_use(opened):
+    pool = ConnectionPool(dsn="fake_db", min_size=3, max_size=5)
+    assert opened == []
+    with pool.connection():
+        assert len(opened) == 3
+        assert pool.stats()["in_use"] == 1
+    assert pool.stats()["size"] == 3
+
+
+def test_broken_connection_discarded(opened):
+    pool = ConnectionPool(dsn="fake_db", min_size=0, max_size=2)
+    with pool.connection() as connection:
+        connection.info.transaction_status = (
+            extensions.TRANSACTION_STATUS_UNKNOWN
+        )
+    assert connection.closed
+    assert pool.stats()["size"] == 0
+    with pool.connection() as new_connection:
+        pass
+    assert new_connection is not connection
+
+
+def test_connection_in_transaction_rolled_back(opened):
+    pool = ConnectionPool(dsn="fake_db", min_size=0, max_size=1)
+    with pool.connection() as connection:
+        connection.info.transaction_status = (
+            extensions.TRANSACTION_STATUS_INERROR
+        )
+    assert connection.rollback_called == 1
+    assert pool.stats()["idle"] == 1
+
+
+"""
+Tests for an exhausted pool: the caller waits and times out, and the wait is
+recorded in the pool stats.
+"""
+
+
+def test_exhausted_pool_times_out(opened):
+    pool = ConnectionPool(dsn="fake_db", min_size=0, max_size=1, timeout=0.01)
+    with pool.connection():
+        with pytest.raises(PoolTimeout):
+            pool.getconn()
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["wait_time_total"] > 0
+
+
+"""
+Test fork safety: a pool inherited from another process starts over and never
+hands out or closes the parent's connections.
+"""
+
+
+def test_pool_reset_after_fork(opened):
+    pool = ConnectionPool(dsn="fake_db", min_size=0, max_size=2)
+    with pool.connection() as parent_connection:
+        pass
+    # Simulate running in a forked child
+    pool._pid = -1
+    with pool.connection() as child_connection:
+        pass
+    assert child_connection is not parent_connection
+    assert not parent_connection.closed
+    assert pool.stats()["connections_opened"] == 1
+
+
+def test_invalid_pool_size():
+    with pytest.raises(ValueError):
+        ConnectionPool(dsn="fake_db", min_size=5, max_size=2)
+
+
+"""
+Tests for `ReplicaPools`:
+1. Replicas are used in turn
+2. A replica that can't be connected to is skipped until `retry_after`
+   has passed, and `None` is returned when no replica is usable
+3. A replica lagging more than `max_lag` is skipped; lag is checked at most
+   every `check_interval` seconds
+"""
+
+
+def test_replicas_round_robin(opened):
+    replicas = ReplicaPools(["replica_a", "replica_b"])
+    dsns = []
+    for _ in range(4):
+        index, connection = replicas.getconn()
+        dsns.append(connection.dsn)
+        replicas.putconn(index, connection)
+
+    assert sorted(dsns[:2]) == ["replica_a", "replica_b"]
+    assert dsns[2:] == dsns[:2]
+
+
+def test_unreachable_replica_skipped(monkeypatch):
+    def fake_connect(dsn):
+        if dsn == "replica_down":
+            raise psycopg2.OperationalError("connection refused")
+        return FakeConnection(dsn)
+
+    monkeypatch.setattr("macro_mojo.db_pool.psycopg2.connect", fake_connect)
+    replicas = ReplicaPools(["replica_down", "replica_up"], retry_after=60)
+
+    for _ in range(3):
+        index, connection = replicas.getconn()
+        assert connection.dsn == "replica_up"
+        replicas.putconn(index, connection)
+
+    replicas.mark_down(index)
+    assert replicas.getconn() is None
+    stats = replicas.stats()
+    assert stats["fallbacks"] == 1
+    assert [replica["down"] for replica in stats["replicas"]] == [True, True]
+
+
+def test_lagging_replica_skipped(opened):
+    replicas = ReplicaPools(["replica_a"], max_lag=5, check_interval=60)
+    index, connection = replicas.getconn()
+    replicas.putconn(index, connection)
+    # Not checked again within `check_interval`
+    connection.lag = 30
+    index, connection = replicas.getconn()
+    replicas.putconn(index, connection)
+    assert connection.lag_checks == 1
+
+    # Checked once the replica is back from being marked down
+    replicas.mark_down(index)
+    replicas._down_until[index] = 0.0
+    assert replicas.getconn() is None
+    assert connection.lag_checks == 2
+    assert connection.rollback_called == 2
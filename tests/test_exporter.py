@@ -0,0 +1,87 @@
+from macro_mojo import exporter
+from macro_mojo.exporter import export_chunks, export_filename
+from macro_mojo.rows import DailyTotal
+import datetime
+import json
+
+""" Custom class to simulate `DatabasePersistence` """
+
+
+class FakeStorage:
+    def __init__(self, rows):
+        self.rows = rows
+        self.read = 0
+
+    def _iter(self):
+        for row in self.rows:
+            self.read += 1
+            yield row
+
+    def iter_nutrition_entries(self, user_id):
+        return self._iter()
+
+    def iter_daily_totals(self, user_id):
+        return self._iter()
+
+
+TOTALS = [
+    DailyTotal(datetime.date(2025, 6, 24), 2001, 115, 65, 250, 4),
+    DailyTotal(datetime.date(2025, 6, 25), 90, 1, 0, 23, 1),
+]
+
+"""
+Tests for `export_chunks`:
+1. CSV starts with a header row, and an empty history is just the header
+2. JSON lines have one object per row with dates as ISO strings
+3. Rows are read lazily and grouped into chunks of about
+   `EXPORT_CHUNK_SIZE` characters
+"""
+
+
+def test_export_csv():
+    chunks = export_chunks(FakeStorage(TOTALS), 6, "totals", "csv")
+    assert "".join(chunks).splitlines() == [
+        "date,calories,protein,fat,carbs,entry_count",
+        "2025-06-24,2001,115,65,250,4",
+        "2025-06-25,90,1,0,23,1",
+    ]
+
+
+def test_export_csv_empty():
+    chunks = export_chunks(FakeStorage([]), 6, "entries", "csv")
+    assert "".join(chunks) == (
+        "id,date,entered_at,calories,protein,fat,carbs,meal\n"
+    )
+
+
+def test_export_ndjson():
+    chunks = export_chunks(FakeStorage(TOTALS), 6, "totals", "ndjson")
+    lines = "".join(chunks).splitlines()
+    assert [json.loads(line) for line in lines][1] == {
+        "date": "2025-06-25",
+        "calories": 90,
+        "protein": 1,
+        "fat": 0,
+        "carbs": 23,
+        "entry_count": 1,
+    }
+
+
+def test_export_chunks_lazy(monkeypatch):
+    monkeypatch.setattr(exporter, "EXPORT_CHUNK_SIZE", 100)
+    storage = FakeStorage(TOTALS * 50)
+
+    chunks = export_chunks(storage, 6, "totals", "ndjson")
+    assert storage.read == 0
+    first = next(chunks)
+    assert 100 <= len(first) < 200
+    assert storage.read < 5
+
+    rest = list(chunks)
+    assert storage.read == 100
+    assert len("".join([first] + rest).splitlines()) == 100
+
+
+def test_export_filename():
+    assert export_filename("sam", "totals", "ndjson") == "sam-totals.jsonl"
+    assert export_filename("sam", "entries", "csv") == "sam-entries.csv"
@@ -0,0 +1,197 @@
+from macro_mojo import importer
+from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.importer import (
+    ImportReport,
+    detect_format,
+    import_file,
+    read_csv,
+    read_ndjson,
+    valid_rows,
+)
+import io
+import pytest
+
+""" Custom class to simulate `DatabasePersistence` """
+
+
+class FakeStorage:
+    def __init__(self):
+        self.copied = []
+
+    def copy_nutrition_entries(self, user_id, rows):
+        self.copied.extend((user_id, *row) for row in rows)
+        return len(self.copied)
+
+
+"""
+Tests for `detect_format`: file extensions map to a reader, case-insensitive
+"""
+
+
+@pytest.mark.parametrize(
+    "filename, expected",
+    [
+        ("history.csv", "csv"),
+        ("HISTORY.CSV", "csv"),
+        ("history.jsonl", "ndjson"),
+        ("history.json", "ndjson"),
+        ("history.txt", None),
+        ("history", None),
+    ],
+)
+def test_detect_format(filename, expected):
+    assert detect_format(filename) == expected
+
+
+"""
+Tests for the readers:
+1. CSV rows are numbered by file line, and short or long rows drop the
+   missing and extra cells
+2. JSON lines skip blank lines and report lines that aren't JSON
+"""
+
+
+def test_read_csv():
+    file = io.StringIO(
+        "date,calories,protein,fat,carbs,meal\n"
+        '2025-06-24,500,50,20,25,"rice,\nbeans"\n'
+        "2025-06-25,90,1,0\n"
+        "2025-06-26,90,1,0,23,apple,extra\n"
+    )
+
+    records = list(read_csv(file))
+
+    assert [line for line, _, _ in records] == [3, 4, 5]
+    assert records[0][1]["meal"] == "rice,\nbeans"
+    assert "carbs" not in records[1][1]
+    assert None not in records[2][1]
+
+
+def test_read_ndjson():
+    file = io.StringIO(
+        '{"date": "2025-06-24", "calories": 500}\n' "\n" "not json\n"
+    )
+
+    records = list(read_ndjson(file))
+
+    assert records[0] == (1, {"date": "2025-06-24", "calories": 500}, None)
+    assert records[1][0] == 3
+    assert records[1][2] == "Line is not valid JSON."
+
+
+"""
+Tests for `valid_rows` and `import_file`:
+1. Valid rows are converted for COPY and invalid rows are reported by line
+2. Only the first `MAX_REPORTED_ERRORS` errors are kept; the rest are counted
+"""
+
+
+def test_import_file_reports_invalid_rows():
+    file = io.BytesIO(
+        b"date,calories,protein,fat,carbs,meal\n"
+        b"2025-06-24,500,50,20,25,chicken bowl\n"
+        b"2025-06-25,abc,1,0,23,apple\n"
+        b"06/26/2025,90,1,0,23,\n"
+        b"2025-06-27,90,1,0,23,\n"
+    )
+    storage = FakeStorage()
+
+    report = import_file(storage, 6, file, "csv")
+
+    assert storage.copied == [
+        (6, "chicken bowl", "2025-06-24", 500, 50, 20, 25),
+        (6, "", "2025-06-27", 90, 1, 0, 23),
+    ]
+    assert report.rows_read == 4
+    assert report.rows_imported == 2
+    assert report.error_count == 2
+    assert [line for line, _ in report.errors] == [3, 4]
+    assert "non-negative integers" in report.errors[0][1]
+
+
+"""
+Tests for `import_file` decoding: a byte order mark is skipped, and a line
+that isn't UTF-8 or contains a NUL character fails only its own row, in CSV
+and JSON lines files alike
+"""
+
+
+@pytest.mark.parametrize(
+    "file_format, content",
+    [
+        (
+            "csv",
+            b"\xef\xbb\xbfdate,calories,protein,fat,carbs,meal\n"
+            b"2025-06-24,500,50,20,25,caf\xc3\xa9\n"
+            b"2025-06-25,90,1,0,23,caf\xe9\n"
+            b"2025-06-26,90,1,0,23,app\x00le\n"
+            b'2025-06-27,90,1,0,23,"\xff\n'
+            b'apple"\n'
+            b"2025-06-28,90,1,0,23,\n",
+        ),
+        (
+            "ndjson",
+            b'{"date": "2025-06-24", "calories": 500, "protein": 50, '
+            b'"fat": 20, "carbs": 25, "meal": "caf\xc3\xa9"}\n'
+            b'{"date": "2025-06-25", "meal": "caf\xe9"}\n'
+            b'{"date": "2025-06-26", "meal": "app\x00le"}\n'
+            b'{"date": "2025-06-27", "meal": "\xff"}\n'
+            b'{"date": "2025-06-28", "calories": 90, "protein": 1, '
+            b'"fat": 0, "carbs": 23}\n',
+        ),
+    ],
+    ids=["csv", "ndjson"],
+)
+def test_import_file_reports_undecodable_lines(file_format, content):
+    storage = FakeStorage()
+
+    report = import_file(storage, 6, io.BytesIO(content), file_format)
+
+    assert storage.copied == [
+        (6, "caf\u00e9", "2025-06-24", 500, 50, 20, 25),
+        (6, "", "2025-06-28", 90, 1, 0, 23),
+    ]
+    assert report.rows_read == 5
+    assert [error for _, error in report.errors] == [
+        "Line is not valid UTF-8.",
+        "Line contains a NUL character.",
+        "Line is not valid UTF-8.",
+    ]
+
+
+def test_valid_rows_caps_reported_errors(monkeypatch):
+    monkeypatch.setattr(importer, "MAX_REPORTED_ERRORS", 2)
+    records = iter([(line, None, "bad") for line in range(1, 6)])
+    report = ImportReport()
+
+    assert list(valid_rows(records, report)) == []
+    assert report.error_count == 5
+    assert report.errors == [(1, "bad"), (2, "bad")]
+
+
+"""
+Test that `import_file` copies the rows it accepts into a migrated database,
+with the undecodable lines left out.
+"""
+
+
+def test_import_file_database(database):
+    with database.cursor() as cursor:
+        cursor.execute("""INSERT INTO targets DEFAULT VALUES;
+               INSERT INTO users (id, username, hashed_pwd, target_id)
+               VALUES (1, 'cat', 'hash', 1);""")
+    storage = DatabasePersistence(dsn=database.dsn)
+    file = io.BytesIO(
+        b"date,calories,protein,fat,carbs,meal\n"
+        b"2025-06-24,500,50,20,25,caf\xc3\xa9\n"
+        b"2025-06-25,90,1,0,23,caf\xe9\n"
+        b"2025-06-26,90,1,0,23,app\x00le\n"
+    )
+
+    report = import_file(storage, 1, file, "csv")
+
+    assert report.rows_imported == 1
+    assert report.error_count == 2
+    with database.cursor() as cursor:
+        cursor.execute("SELECT meal FROM nutrition WHERE user_id = 1")
+        assert cursor.fetchall() == [("café",)]
@@ -0,0 +1,190 @@
+from contextlib import contextmanager
+from unittest.mock import patch
+from macro_mojo import instrumentation
+from macro_mojo.db_persistence import DatabasePersistence
+from macro_mojo.passwords import verify_password
+import bcrypt
+import json
+import logging
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    instrumentation.reset_query_stats()
+    instrumentation.configure(slow_query_ms=100.0, sample_rate=0.0)
+    token = instrumentation._request_totals.set(None)
+    yield
+    instrumentation._request_totals.reset(token)
+    instrumentation.reset_query_stats()
+    instrumentation.configure(
+        slow_query_ms=instrumentation.SLOW_QUERY_MS,
+        sample_rate=instrumentation.QUERY_LOG_SAMPLE_RATE,
+    )
+
+
+"""
+Tests for `record_query`:
+1. Durations land in the right histogram bucket, per query name
+2. Queries are added to the current request's totals
+3. Slow queries are logged as warnings, others only when sampled, and the
+   log has no parameters in it
+"""
+
+
+def test_histogram_per_query():
+    instrumentation.record_query("daily_nutrition", 0.003, 4, 0.001)
+    instrumentation.record_query("daily_nutrition", 0.020, 6)
+    instrumentation.record_query("user_targets", 7.0, -1)
+
+    stats = instrumentation.query_stats()
+
+    daily = stats["daily_nutrition"]
+    assert daily["count"] == 2
+    assert daily["rows"] == 10
+    assert daily["max_ms"] == pytest.approx(20.0)
+    assert daily["mean_ms"] == pytest.approx(11.5)
+    assert daily["connection_wait_ms"] == pytest.approx(1.0)
+    assert daily["buckets"]["5"] == 1
+    assert daily["buckets"]["25"] == 1
+    # Unknown row counts (-1) count as no rows; 7 s overflows the buckets
+    assert stats["user_targets"]["rows"] == 0
+    assert stats["user_targets"]["buckets"]["inf"] == 1
+
+
+def test_request_totals():
+    instrumentation.record_query("before_request", 0.001, 1)
+    totals = instrumentation.start_request()
+    instrumentation.record_query("find_user_id", 0.002, 1, 0.004)
+    instrumentation.record_query("user_targets", 0.003, 1)
+
+    assert instrumentation.request_totals() is totals
+    assert totals.queries == 2
+    assert totals.rows == 2
+    assert totals.duration_ms == pytest.approx(5.0)
+    assert totals.connection_wait_ms == pytest.approx(4.0)
+
+
+@pytest.mark.parametrize(
+    "duration, sample_rate, expected_level",
+    [
+        (0.5, 0.0, logging.WARNING),
+        (0.001, 1.0, logging.INFO),
+        (0.001, 0.0, None),
+    ],
+)
+def test_query_logging(caplog, duration, sample_rate, expected_level):
+    instrumentation.configure(sample_rate=sample_rate)
+    caplog.set_level(logging.INFO, logger=instrumentation.__name__)
+
+    instrumentation.record_query("find_nutrition_entry", duration, 1)
+
+    levels = [record.levelno for record in caplog.records]
+    assert levels == ([expected_level] if expected_level else [])
+    for record in caplog.records:
+        assert "find_nutrition_entry" in record.getMessage()
+
+
+"""
+Test that persistence methods are timed under their registry names,
+including the connection wait and row count.
+"""
+
+
+class CountingCursor:
+    def __init__(self):
+        self.rowcount = -1
+
+    def execute(self, query, parameters=None):
+        self.rowcount = 3
+
+    def fetchall(self):
+        return []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class CountingConnection:
+    def cursor(self, cursor_factory=None):
+        return CountingCursor()
+
+
+def test_persistence_queries_recorded():
+    dp = DatabasePersistence(dsn="fake_db")
+
+    @contextmanager
+    def fake_connect():
+        dp._connection_wait = 0.25
+        yield CountingConnection()
+
+    with patch.object(dp, "_database_connect", fake_connect):
+        dp.get_daily_nutrition(6, "2025-06-24")
+
+    stats = instrumentation.query_stats()["daily_nutrition"]
+    assert stats["count"] == 1
+    assert stats["rows"] == 3
+    assert stats["connection_wait_ms"] == pytest.approx(250.0)
+
+
+"""
+Tests for request phases and their output:
+1. `timed` adds to the current request's phase, and does nothing when no
+   request is being timed
+2. Phases can be started and ended from separate callbacks
+3. `server_timing` and `access_log_line` include queries and every phase
+"""
+
+
+def test_timed_phase():
+    with instrumentation.timed("ai"):
+        pass
+    assert instrumentation.request_totals() is None
+
+    totals = instrumentation.start_request()
+    with instrumentation.timed("ai"):
+        pass
+    with instrumentation.timed("ai"):
+        pass
+    instrumentation.start_phase("template")
+    instrumentation.end_phase("template")
+    # An end without a start is ignored
+    instrumentation.end_phase("markdown")
+
+    assert set(totals.phases) == {"ai", "template"}
+    assert totals.phases["ai"] >= 0
+
+
+def test_password_check_timed():
+    hashed_pwd = bcrypt.hashpw(b"hungry", bcrypt.gensalt(4)).decode("utf-8")
+    totals = instrumentation.start_request()
+
+    assert verify_password("hungry", hashed_pwd, rounds=4).matches
+    assert totals.phases["bcrypt"] > 0
+
+
+def test_server_timing_and_access_log():
+    totals = instrumentation.start_request()
+    instrumentation.record_query("user_targets", 0.0125, 1, 0.002)
+    totals.add_phase("template", 0.004)
+
+    header = instrumentation.server_timing(totals)
+    metrics = header.split(", ")
+    assert metrics[0] == 'db;dur=12.5;desc="1 queries"'
+    assert metrics[1] == "db-wait;dur=2.0"
+    assert metrics[2] == "template;dur=4.0"
+    assert metrics[3].startswith("total;dur=")
+
+    fields = json.loads(
+        instrumentation.access_log_line("GET", "/cat/", 200, totals)
+    )
+    assert fields["method"] == "GET"
+    assert fields["path"] == "/cat/"
+    assert fields["status"] == 200
+    assert fields["queries"] == 1
+    assert fields["db_ms"] == 12.5
+    assert fields["db_wait_ms"] == 2.0
+    assert fields["template_ms"] == 4.0
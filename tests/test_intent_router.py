@@ -0,0 +1,107 @@
+from macro_mojo.intent_router import (
+    INTENT_ROUTER_THRESHOLD,
+    NUTRITION,
+    OFF_TOPIC,
+    RouterStats,
+    classify,
+)
+import pytest
+
+"""
+Tests for `classify`:
+1. Messages about targets or with the user's details go to nutrition
+2. Messages about subjects the assistant doesn't cover are off topic
+3. Short replies and questions about food are left to the LLM router
+4. Follow-ups without keywords are left to the LLM router, guessing
+   nutrition
+5. Messages with both kinds of keywords are left to the LLM router
+"""
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Female, 30, 65 kg, 170cm, sedentary",
+        "How many calories should I eat to lose weight?",
+        "What are my macros?",
+        "I weigh 70kg",
+    ],
+)
+def test_classify_nutrition(text):
+    intent = classify(text)
+
+    assert intent.destination == NUTRITION
+    assert intent.confidence >= INTENT_ROUTER_THRESHOLD
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "What's the weather like today in Paris?",
+        "Can you help me write a Python script?",
+        "Recommend a good movie to watch tonight",
+    ],
+)
+def test_classify_off_topic(text):
+    intent = classify(text)
+
+    assert intent.destination == OFF_TOPIC
+    assert intent.confidence >= INTENT_ROUTER_THRESHOLD
+
+
+@pytest.mark.parametrize(
+    "text", ["hi", "30", "female", "What should I eat for breakfast?", ""]
+)
+def test_classify_unsure(text):
+    assert classify(text).confidence < INTENT_ROUTER_THRESHOLD
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "I walk my dog every morning",
+        "I sit at a desk all day",
+        "I run three times a week",
+        "I am vegetarian, does that change anything",
+    ],
+)
+def test_classify_follow_up(text):
+    intent = classify(text)
+
+    assert intent.destination == NUTRITION
+    assert intent.confidence < INTENT_ROUTER_THRESHOLD
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "I write software all day, sedentary",
+        "Tell me a joke about protein",
+        "I play the piano every evening",
+    ],
+)
+def test_classify_mixed_or_no_evidence(text):
+    assert classify(text).confidence < INTENT_ROUTER_THRESHOLD
+
+
+"""
+Tests for `RouterStats`
+"""
+
+
+def test_router_stats():
+    stats = RouterStats()
+    assert stats.stats()["local_rate"] == 0.0
+
+    stats.record_local(NUTRITION)
+    stats.record_local(NUTRITION)
+    stats.record_local(OFF_TOPIC)
+    stats.record_fallback(NUTRITION, NUTRITION)
+    stats.record_fallback(OFF_TOPIC, "None")
+
+    assert stats.stats() == {
+        "local": {NUTRITION: 2, OFF_TOPIC: 1},
+        "fallbacks": 2,
+        "local_rate": 0.6,
+        "fallback_agreement": 0.5,
+    }
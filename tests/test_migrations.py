@@ -0,0 +1,151 @@
+from macro_mojo.migrations import (
+    Migration,
+    MigrationError,
+    apply_migrations,
+    discover_migrations,
+    _split_statements,
+)
+import pytest
+
+""" Custom classes to simulate `cursor` and `connection` objects """
+
+
+class FakeCursor:
+    def __init__(self, applied=None):
+        self.executed = []
+        # Rows of `schema_migrations`: (version, checksum)
+        self.applied = applied or []
+
+    def execute(self, query, parameters=None):
+        self.executed.append((query, parameters))
+
+    def fetchall(self):
+        return self.applied
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.autocommit = False
+
+    def cursor(self):
+        return self._cursor
+
+
+def executed_sql(cursor):
+    return [query for query, _ in cursor.executed]
+
+
+"""
+Tests for `discover_migrations`:
+1. Files are ordered by version and other files are ignored
+2. Duplicate versions are rejected
+3. The migrations shipped in db/migrations are discovered
+"""
+
+
+def test_discover_migrations_ordered(tmp_path):
+    (tmp_path / "0002_second.sql").write_text("SELECT 2;")
+    (tmp_path / "0001_first.sql").write_text("SELECT 1;")
+    (tmp_path / "README.md").write_text("not a migration")
+
+    migrations = discover_migrations(str(tmp_path))
+
+    assert [str(migration) for migration in migrations] == [
+        "0001_first",
+        "0002_second",
+    ]
+    assert migrations[0].sql == "SELECT 1;"
+
+
+def test_discover_migrations_duplicate_versions(tmp_path):
+    (tmp_path / "0001_first.sql").write_text("SELECT 1;")
+    (tmp_path / "1_other.sql").write_text("SELECT 1;")
+
+    with pytest.raises(MigrationError):
+        discover_migrations(str(tmp_path))
+
+
+def test_discover_repo_migrations():
+    migrations = discover_migrations()
+    assert migrations[0].version == 1
+    assert "CREATE TABLE IF NOT EXISTS nutrition" in migrations[0].sql
+
+
+"""
+Tests for `apply_migrations`:
+1. New migrations run in their own transaction and are recorded
+2. Applied migrations are skipped
+3. A migration changed after it was applied is an error
+4. No-transaction migrations run statement by statement outside `BEGIN`
+"""
+
+
+def test_apply_migrations_new():
+    migration = Migration(1, "first", "CREATE TABLE a ();")
+    cursor = FakeCursor()
+
+    applied = apply_migrations(FakeConnection(cursor), [migration])
+
+    assert applied == [migration]
+    sql = executed_sql(cursor)
+    begin = sql.index("BEGIN")
+    assert sql[begin + 1] == "CREATE TABLE a ();"
+    assert "INSERT INTO schema_migrations" in sql[begin + 2]
+    assert sql[begin + 3] == "COMMIT"
+    assert "pg_advisory_unlock" in sql[-1]
+
+
+def test_apply_migrations_skips_applied():
+    first = Migration(1, "first", "CREATE TABLE a ();")
+    second = Migration(2, "second", "CREATE TABLE b ();")
+    cursor = FakeCursor(applied=[(1, first.checksum)])
+
+    applied = apply_migrations(FakeConnection(cursor), [first, second])
+
+    assert applied == [second]
+    assert "CREATE TABLE a ();" not in executed_sql(cursor)
+
+
+def test_apply_migrations_changed_after_applied():
+    migration = Migration(1, "first", "CREATE TABLE a ();")
+    cursor = FakeCursor(applied=[(1, "old checksum")])
+
+    with pytest.raises(MigrationError):
+        apply_migrations(FakeConnection(cursor), [migration])
+    # The advisory lock is released even on error
+    assert "pg_advisory_unlock" in executed_sql(cursor)[-1]
+
+
+def test_apply_migrations_no_transaction():
+    migration = Migration(
+        2,
+        "index",
+        "-- migrate: no-transaction\n"
+        "CREATE INDEX CONCURRENTLY a_idx ON a (x);\n"
+        "CREATE INDEX CONCURRENTLY b_idx ON b (x);\n",
+    )
+    cursor = FakeCursor()
+
+    apply_migrations(FakeConnection(cursor), [migration])
+
+    sql = executed_sql(cursor)
+    assert "BEGIN" not in sql
+    assert sum("CREATE INDEX CONCURRENTLY" in query for query in sql) == 2
+
+
+def test_split_statements_skips_comments():
+    sql = "-- comment\nSELECT 1;\n\n-- only a comment;\nSELECT 2;\n"
+    statements = _split_statements(sql)
+    assert [
+        statement.strip().splitlines()[-1] for statement in statements
+    ] == [
+        "SELECT 1",
+        "SELECT 2",
+    ]
@@ -0,0 +1,41 @@
+from macro_mojo.pagination import is_entry_id, page_cursor
+import pytest
+
+"""
+Tests for `page_cursor` with `is_entry_id`: only ASCII digits are accepted as
+an entry id cursor, so the cursor can always be passed to `int`, and only
+ids that fit in a PostgreSQL `integer`
+"""
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        ({}, (1, None, None)),
+        ({"page": "2", "before": "40"}, (2, "40", None)),
+        ({"page": "2", "after": "41"}, (2, None, "41")),
+        ({"page": "2", "before": "²"}, False),
+        ({"page": "2", "before": "٣"}, False),
+        ({"page": "2", "before": ""}, False),
+        ({"page": "2", "before": "-1"}, False),
+        ({"page": "2", "before": "0"}, False),
+        ({"page": "2", "before": "2147483647"}, (2, "2147483647", None)),
+        ({"page": "2", "before": "99999999999"}, False),
+        ({"page": "2"}, False),
+    ],
+    ids=[
+        "first_page",
+        "before",
+        "after",
+        "superscript_digit",
+        "arabic_indic_digit",
+        "empty",
+        "negative",
+        "zero",
+        "largest",
+        "too_large",
+        "no_cursor",
+    ],
+)
+def test_page_cursor_entry_id(args, expected):
+    assert page_cursor(args, is_entry_id) == expected
@@ -0,0 +1,169 @@
+from macro_mojo.partitions import (
+    ADVISORY_LOCK_KEY,
+    PARTITION_MONTHS_AHEAD,
+    create_partitions,
+    drop_empty_partitions,
+    list_partitions,
+)
+import pytest
+
+""" Custom classes to simulate `cursor` and `connection` objects """
+
+
+class FakeCursor:
+    def __init__(self, fetchone_result=None, fetchall_result=None):
+        self.executed = []
+        self.fetchone_result = fetchone_result
+        self.fetchall_result = fetchall_result or []
+
+    def execute(self, query, parameters=None):
+        self.executed.append((query, parameters))
+
+    def fetchone(self):
+        return self.fetchone_result
+
+    def fetchall(self):
+        return self.fetchall_result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.transactions = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def __enter__(self):
+        self.transactions += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+"""
+Tests for `create_partitions`: the advisory lock and the partition function
+are sent as one statement in one transaction, with the months to create
+ahead passed as a parameter, and the number created is returned.
+"""
+
+
+@pytest.mark.parametrize(
+    "months_ahead, created",
+    [(None, 4), (12, 0)],
+    ids=["default_months", "nothing_to_create"],
+)
+def test_create_partitions(months_ahead, created):
+    cursor = FakeCursor(fetchone_result=(created,))
+    connection = FakeConnection(cursor)
+
+    if months_ahead is None:
+        result = create_partitions(connection)
+    else:
+        result = create_partitions(connection, months_ahead)
+
+    assert result == created
+    assert connection.transactions == 1
+    assert len(cursor.executed) == 1
+    query, parameters = cursor.executed[0]
+    assert "pg_advisory_xact_lock" in query
+    assert "nutrition_create_partitions" in query
+    assert parameters == {
+        "lock_key": ADVISORY_LOCK_KEY,
+        "months_ahead": months_ahead or PARTITION_MONTHS_AHEAD,
+    }
+
+
+"""
+Test that `drop_empty_partitions` lists the partitions of past months, then
+drops each one that is empty in its own transaction, under the advisory
+lock.
+"""
+
+
+def test_drop_empty_partitions():
+    past_partitions = [("nutrition_1925_04",), ("nutrition_1925_05",)]
+    cursor = FakeCursor(
+        fetchone_result=(True,), fetchall_result=past_partitions
+    )
+    connection = FakeConnection(cursor)
+
+    assert drop_empty_partitions(connection) == 2
+    assert connection.transactions == 3
+    assert [parameters for _, parameters in cursor.executed[1:]] == [
+        {"lock_key": ADVISORY_LOCK_KEY, "partition": "nutrition_1925_04"},
+        {"lock_key": ADVISORY_LOCK_KEY, "partition": "nutrition_1925_05"},
+    ]
+
+
+def test_list_partitions():
+    partitions = [
+        ("nutrition_2025_07", "FOR VALUES FROM ('2025-07-01') TO ..."),
+        ("nutrition_default", "DEFAULT"),
+    ]
+    cursor = FakeCursor(fetchall_result=partitions)
+
+    assert list_partitions(FakeConnection(cursor)) == partitions
+    query, _ = cursor.executed[0]
+    assert "pg_inherits" in query
+
+
+"""
+Test `create_partitions` on a migrated database: a partition is created for
+the month of every entry in the default partition and for the months ahead,
+but not for the empty months in between.
+"""
+
+
+def test_create_partitions_for_months_with_entries(database):
+    with database.cursor() as cursor:
+        cursor.execute("""INSERT INTO targets DEFAULT VALUES;
+               INSERT INTO users (id, username, hashed_pwd, target_id)
+               VALUES (1, 'cat', 'hash', 1);
+               INSERT INTO nutrition
+                   (user_id, "date", calories, protein, fat, carbs)
+               VALUES (1, '1925-03-14', 100, 10, 5, 20);""")
+
+    created = create_partitions(database)
+
+    names = [name for name, _ in list_partitions(database)]
+    assert created == 1
+    assert names[0] == "nutrition_1925_03"
+    assert len(names) == PARTITION_MONTHS_AHEAD + 3
+    with database.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM nutrition_default")
+        assert cursor.fetchone()[0] == 0
+
+
+"""
+Test `drop_empty_partitions` on a migrated database: the empty partitions of
+past months are dropped, and those with entries or for the months ahead are
+kept.
+"""
+
+
+def test_drop_empty_partitions_database(database):
+    with database.cursor() as cursor:
+        cursor.execute("""INSERT INTO targets DEFAULT VALUES;
+               INSERT INTO users (id, username, hashed_pwd, target_id)
+               VALUES (1, 'cat', 'hash', 1);
+               INSERT INTO nutrition
+                   (user_id, "date", calories, protein, fat, carbs)
+               VALUES (1, '1925-03-14', 100, 10, 5, 20);
+               SELECT nutrition_create_partitions('1925-03-01', '1925-12-01');
+               """)
+    names_before = [name for name, _ in list_partitions(database)]
+
+    dropped = drop_empty_partitions(database)
+
+    names = [name for name, _ in list_partitions(database)]
+    assert dropped == 9
+    assert names == ["nutrition_1925_03"] + names_before[10:]
+    assert len(names) == PARTITION_MONTHS_AHEAD + 3
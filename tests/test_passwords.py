@@ -0,0 +1,172 @@
+from macro_mojo.passwords import (
+    PasswordVerifier,
+    VerifierBusy,
+    check_password,
+    hash_cost,
+    hash_password,
+)
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import pytest
+
+"""
+Tests for `check_password`:
+1. A wrong password doesn't match and is never rehashed
+2. A matching hash at the current cost is kept
+3. A matching hash below the current cost is rehashed at that cost
+"""
+
+
+@pytest.mark.parametrize(
+    "password, hash_rounds, expected_matches, expected_new_cost",
+    [
+        ("not_hungry", 4, False, None),
+        ("hungry", 5, True, None),
+        ("hungry", 4, True, 5),
+    ],
+    ids=["wrong_password", "current_cost", "outdated_cost"],
+)
+def test_check_password(
+    password, hash_rounds, expected_matches, expected_new_cost
+):
+    hashed_pwd = hash_password("hungry", hash_rounds)
+
+    check = check_password(password, hashed_pwd, rounds=5)
+
+    assert check.matches is expected_matches
+    if expected_new_cost is None:
+        assert check.new_hash is None
+    else:
+        assert hash_cost(check.new_hash) == expected_new_cost
+        assert check_password("hungry", check.new_hash, rounds=5).matches
+
+
+"""
+Tests for `PasswordVerifier`:
+1. Checks run in the process pool, from threads and from coroutines
+2. Once every slot is taken, checks are rejected at once; a finished check
+   frees its slot
+3. A check that times out is turned away as busy, and holds its slot until
+   it finishes
+4. A broken pool is turned away as busy and replaced on the next check
+5. Verifiers in different namespaces don't share slots
+"""
+
+
+@pytest.fixture
+def verifier(tmp_path):
+    verifier = PasswordVerifier(
+        workers=1, max_pending=1, rounds=4, slots_dir=str(tmp_path)
+    )
+    yield verifier
+    verifier.shutdown()
+
+
+def test_verifier_checks_in_pool(verifier):
+    hashed_pwd = hash_password("hungry", 4)
+
+    assert verifier.verify("hungry", hashed_pwd).matches
+    assert not asyncio.run(
+        verifier.verify_async("not_hungry", hashed_pwd)
+    ).matches
+
+
+def test_verifier_rejects_when_busy(verifier):
+    hashed_pwd = hash_password("hungry", 4)
+    held = verifier._acquire_slot()
+
+    with pytest.raises(VerifierBusy):
+        verifier.verify("hungry", hashed_pwd)
+    assert verifier.rejected == 1
+
+    # Releasing the slot lets checks through again
+    held.release()
+    assert verifier.verify("hungry", hashed_pwd).matches
+
+
+class FakeExecutor:
+    """Returns `future` from every submit, or raises `error`."""
+
+    def __init__(self, future=None, error=None):
+        self.future = future
+        self.error = error
+        self.shut_down = False
+
+    def submit(self, *args):
+        if self.error is not None:
+            raise self.error
+        return self.future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.mark.parametrize("use_async", [False, True], ids=["sync", "async"])
+def test_verifier_timeout_is_busy(tmp_path, use_async):
+    verifier = PasswordVerifier(
+        max_pending=1, timeout=0.01, rounds=4, slots_dir=str(tmp_path)
+    )
+    future = Future()
+    verifier._executor = FakeExecutor(future)
+    hashed_pwd = hash_password("hungry", 4)
+
+    with pytest.raises(VerifierBusy):
+        if use_async:
+            asyncio.run(verifier.verify_async("hungry", hashed_pwd))
+        else:
+            verifier.verify("hungry", hashed_pwd)
+    assert verifier.failed == 1
+
+    if not future.cancelled():
+        # Still running: its slot stays taken until it finishes
+        with pytest.raises(VerifierBusy):
+            verifier._acquire_slot()
+        future.set_result(None)
+    verifier._acquire_slot().release()
+
+
+@pytest.mark.parametrize(
+    "use_async, on_submit",
+    [(False, False), (False, True), (True, False), (True, True)],
+    ids=["sync", "sync_on_submit", "async", "async_on_submit"],
+)
+def test_verifier_replaces_broken_pool(verifier, use_async, on_submit):
+    hashed_pwd = hash_password("hungry", 4)
+    future = Future()
+    future.set_exception(BrokenProcessPool("A process died"))
+    broken = (
+        FakeExecutor(error=BrokenProcessPool("A process died"))
+        if on_submit
+        else FakeExecutor(future)
+    )
+    verifier._executor = broken
+
+    with pytest.raises(VerifierBusy):
+        if use_async:
+            asyncio.run(verifier.verify_async("hungry", hashed_pwd))
+        else:
+            verifier.verify("hungry", hashed_pwd)
+    assert broken.shut_down
+    assert verifier.failed == 1
+
+    # The slot is free and the next check gets a new pool
+    assert verifier.verify("hungry", hashed_pwd).matches
+
+
+def test_verifier_namespaces_slots(tmp_path):
+    first = PasswordVerifier(
+        max_pending=1, slots_dir=str(tmp_path), namespace="first"
+    )
+    second = PasswordVerifier(
+        max_pending=1, slots_dir=str(tmp_path), namespace="second"
+    )
+    same = PasswordVerifier(
+        max_pending=1, slots_dir=str(tmp_path), namespace="first"
+    )
+
+    held = first._acquire_slot()
+    second._acquire_slot().release()
+    with pytest.raises(VerifierBusy):
+        same._acquire_slot()
+    held.release()
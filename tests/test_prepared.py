@@ -0,0 +1,87 @@
+from macro_mojo import queries
+from macro_mojo.db_persistence import keyset_page
+from macro_mojo.prepared import PreparedStatement
+import pytest
+
+"""
+Tests for `PreparedStatement`:
+1. Positional placeholders are numbered in order
+2. A named placeholder used several times is one parameter, and mappings
+   are ordered to match
+3. Escaped percent signs are unescaped, since PREPARE is sent without
+   parameters
+4. Names must be usable as SQL identifiers
+"""
+
+
+def test_positional_placeholders():
+    statement = PreparedStatement(
+        "entry", "SELECT * FROM nutrition WHERE id = %s AND user_id = %s"
+    )
+
+    assert statement.prepare_sql == (
+        "PREPARE entry AS "
+        "SELECT * FROM nutrition WHERE id = $1 AND user_id = $2"
+    )
+    assert statement.execute_sql == "EXECUTE entry (%s, %s)"
+    assert statement.arguments((4, 6)) == (4, 6)
+
+
+def test_named_placeholders():
+    statement = PreparedStatement(
+        "day",
+        "SELECT %(user_id)s, %(date)s "
+        "WHERE user_id = %(user_id)s LIMIT %(limit)s",
+    )
+
+    assert statement.body == "SELECT $1, $2 WHERE user_id = $1 LIMIT $3"
+    assert statement.execute_sql == "EXECUTE day (%s, %s, %s)"
+    assert statement.arguments(
+        {"limit": 5, "date": "2025-06-24", "user_id": 6, "unused": None}
+    ) == (6, "2025-06-24", 5)
+
+
+def test_escaped_percent_and_no_parameters():
+    statement = PreparedStatement("share", "SELECT 50 %% 7")
+
+    assert statement.body == "SELECT 50 % 7"
+    assert statement.execute_sql == "EXECUTE share"
+    assert statement.arguments(None) == ()
+
+
+@pytest.mark.parametrize("name", ["", "drop table", "1st", "a;b"])
+def test_invalid_name(name):
+    with pytest.raises(ValueError):
+        PreparedStatement(name, "SELECT 1")
+
+
+"""
+Tests for `queries.REGISTRY`:
+1. Every registry query can be prepared
+2. The keyset page variants match the queries built for `keyset_page`
+"""
+
+
+def test_registry_queries_prepare():
+    for name, query in queries.REGISTRY.items():
+        statement = PreparedStatement(name, query)
+        assert "%s" not in statement.body
+        assert "%(" not in statement.body
+
+
+@pytest.mark.parametrize(
+    "before, after", [(None, None), ("2025-06-24", None), (None, "2025-06-24")]
+)
+def test_registry_page_variants(before, after):
+    cursor, comparison, direction = keyset_page(before, after)
+    has_cursor = cursor is not None
+
+    day_name = queries.page_query_name("day_snapshot", before, after)
+    totals_name = queries.page_query_name("daily_totals_page", before, after)
+
+    assert queries.REGISTRY[day_name] == queries.day_snapshot(
+        comparison, direction, has_cursor
+    )
+    assert queries.REGISTRY[totals_name] == queries.daily_totals_page(
+        comparison, direction, has_cursor
+    )
@@ -0,0 +1,263 @@
+from macro_mojo.query_plans import (
+    DAILY_TOTALS_PRIMARY_KEY,
+    HOT_QUERIES,
+    NUTRITION_PRIMARY_KEY,
+    NUTRITION_USER_DATE_INDEX,
+    capture_queries,
+    check_hot_queries,
+    dump_plans,
+    index_scans,
+    partitions_scanned,
+)
+from macro_mojo import queries
+
+"""
+Tests for `index_scans`: index names are collected from nested plan nodes,
+including bitmap index scans under a bitmap heap scan.
+"""
+
+
+def test_index_scans_nested_plan():
+    plan = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {
+                "Node Type": "Index Only Scan",
+                "Relation Name": "users",
+                "Index Name": "users_pkey",
+            },
+            {
+                "Node Type": "Bitmap Heap Scan",
+                "Relation Name": "nutrition",
+                "Plans": [
+                    {
+                        "Node Type": "Bitmap Index Scan",
+                        "Index Name": NUTRITION_USER_DATE_INDEX,
+                    }
+                ],
+            },
+        ],
+    }
+
+    assert index_scans(plan) == [
+        ("users", "users_pkey"),
+        ("nutrition", NUTRITION_USER_DATE_INDEX),
+    ]
+
+
+def test_index_scans_seq_scan():
+    plan = {"Node Type": "Seq Scan", "Relation Name": "nutrition"}
+    assert index_scans(plan) == []
+
+
+"""
+Tests for `partitions_scanned`: only `nutrition` partitions are collected,
+including the default partition.
+"""
+
+
+def test_partitions_scanned():
+    plan = {
+        "Node Type": "Append",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "nutrition_2025_07"},
+            {"Node Type": "Seq Scan", "Relation Name": "nutrition_default"},
+            {"Node Type": "Seq Scan", "Relation Name": "daily_totals"},
+        ],
+    }
+
+    assert partitions_scanned(plan) == [
+        "nutrition_2025_07",
+        "nutrition_default",
+    ]
+
+
+"""
+Test that every hot query can be captured from its persistence method without
+a database.
+"""
+
+
+def test_capture_hot_queries():
+    for hot_query in HOT_QUERIES:
+        captured = capture_queries(hot_query, 1, "2025-07-28")
+        assert len(captured) == 1
+        query, _ = captured[0]
+        assert "FROM nutrition" in query or "FROM daily_totals" in query
+
+
+"""
+Test that `dump_plans` explains every registry query as a generic plan, with
+`$n` parameters and nothing for psycopg2 to interpolate.
+"""
+
+
+class FakeExplainCursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, query, parameters=None):
+        self.executed.append((query, parameters))
+
+    def fetchall(self):
+        return [("Index Scan using nutrition_pkey on nutrition",)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakeExplainConnection:
+    def __init__(self):
+        self.cursor_obj = FakeExplainCursor()
+
+    def cursor(self):
+        return self.cursor_obj
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+def test_dump_plans():
+    connection = FakeExplainConnection()
+
+    plans = dict(dump_plans(connection))
+
+    assert list(plans) == list(queries.REGISTRY)
+    assert plans["find_nutrition_entry"] == [
+        "Index Scan using nutrition_pkey on nutrition"
+    ]
+    for query, parameters in connection.cursor_obj.executed:
+        assert query.startswith("EXPLAIN (GENERIC_PLAN) ")
+        assert "%s" not in query
+        assert parameters is None
+
+
+"""
+Tests for `check_hot_queries` against canned plans:
+1. Index scans on a partition's index count as scans on the index of
+   `nutrition` it was created from
+2. A plan that reads more than one partition is reported
+"""
+
+
+class FakePlanCursor:
+    def __init__(self, plan, parents):
+        self.plan = plan
+        self.parents = parents
+        self.result = None
+
+    def execute(self, query, parameters=None):
+        if query.startswith("EXPLAIN"):
+            self.result = [[{"Plan": self.plan(query)}]]
+        elif "pg_inherits" in query:
+            self.result = list(self.parents.items())
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class FakePlanConnection:
+    def __init__(self, plan, parents):
+        self.cursor_obj = FakePlanCursor(plan, parents)
+
+    def cursor(self):
+        return self.cursor_obj
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+PARTITION_INDEXES = {
+    "nutrition_2025_07_pkey": NUTRITION_PRIMARY_KEY,
+    "nutrition_2025_07_user_id_date_entered_at_idx": (
+        NUTRITION_USER_DATE_INDEX
+    ),
+    "nutrition_2025_08_user_id_date_entered_at_idx": (
+        NUTRITION_USER_DATE_INDEX
+    ),
+}
+
+
+def partition_scan(partition, index):
+    return {
+        "Node Type": "Index Scan",
+        "Relation Name": partition,
+        "Index Name": index,
+    }
+
+
+def pruned_plan(query):
+    # Each hot query scans the July partition's copy of its index
+    if "FROM daily_totals" in query and "FROM nutrition" not in query:
+        return partition_scan("daily_totals", DAILY_TOTALS_PRIMARY_KEY)
+    if "WHERE id = %s" in query:
+        return partition_scan("nutrition_2025_07", "nutrition_2025_07_pkey")
+    return {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            partition_scan("daily_totals", DAILY_TOTALS_PRIMARY_KEY),
+            partition_scan(
+                "nutrition_2025_07",
+                "nutrition_2025_07_user_id_date_entered_at_idx",
+            ),
+        ],
+    }
+
+
+def unpruned_plan(query):
+    plan = pruned_plan(query)
+    if "nutrition_2025_07_user_id_date_entered_at_idx" in str(plan):
+        plan["Plans"].append(
+            partition_scan(
+                "nutrition_2025_08",
+                "nutrition_2025_08_user_id_date_entered_at_idx",
+            )
+        )
+    return plan
+
+
+def test_check_hot_queries_partition_indexes():
+    connection = FakePlanConnection(pruned_plan, PARTITION_INDEXES)
+
+    assert check_hot_queries(connection, 1, "2025-07-28") == []
+
+
+def test_check_hot_queries_unpruned():
+    connection = FakePlanConnection(unpruned_plan, PARTITION_INDEXES)
+
+    problems = check_hot_queries(connection, 1, "2025-07-28")
+
+    assert problems == [
+        "day view, first page: expected one partition, plan reads "
+        "['nutrition_2025_07', 'nutrition_2025_08']",
+        "day view, next page: expected one partition, plan reads "
+        "['nutrition_2025_07', 'nutrition_2025_08']",
+    ]
+
+
+"""
+Test `check_hot_queries` against the plans of a migrated and seeded database,
+as `python -m macro_mojo.query_plans` runs it.
+"""
+
+
+def test_check_hot_queries_seeded_database(seeded_database):
+    assert check_hot_queries(seeded_database, 1, "2025-07-28") == []
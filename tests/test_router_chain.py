@@ -0,0 +1,80 @@
+from typing import Any, Dict, List
+
+from langchain.chains.router.base import RouterChain
+from macro_mojo import intent_router
+from macro_mojo.intent_router import RouterStats
+from macro_mojo.router_chain import LocalRouterChain
+import asyncio
+import pytest
+
+
+class FakeLLMRouter(RouterChain):
+    destination: str = "nutrition"
+    calls: int = 0
+
+    @property
+    def input_keys(self) -> List[str]:
+        return ["input"]
+
+    def _call(self, inputs: Dict[str, Any], run_manager=None):
+        self.calls += 1
+        return {
+            "destination": self.destination,
+            "next_inputs": {"input": inputs["input"].upper()},
+        }
+
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch: pytest.MonkeyPatch):
+    stats = RouterStats()
+    monkeypatch.setattr("macro_mojo.router_chain.router_stats", stats)
+    return stats
+
+
+"""
+Tests for `LocalRouterChain`:
+1. Confident routes don't call the LLM router
+2. Other messages are routed by the LLM router, sync and async
+3. A threshold above 1 always asks the LLM router
+"""
+
+
+def test_routes_locally(stats):
+    llm_router = FakeLLMRouter()
+    router = LocalRouterChain(llm_router=llm_router)
+
+    route = router.route({"input": "Female, 30, 65 kg, 170cm"})
+
+    assert route.destination == intent_router.NUTRITION
+    assert route.next_inputs == {"input": "Female, 30, 65 kg, 170cm"}
+    assert llm_router.calls == 0
+    assert stats.stats()["local"] == {intent_router.NUTRITION: 1}
+
+
+def test_falls_back_to_llm_router(stats):
+    llm_router = FakeLLMRouter()
+    router = LocalRouterChain(llm_router=llm_router)
+
+    route = router.route({"input": "30", "chat_history": "AI: Your age?"})
+    async_route = asyncio.run(router.aroute({"input": "hi"}))
+
+    assert route.destination == "nutrition"
+    # The other inputs are kept
+    assert route.next_inputs == {
+        "input": "30",
+        "chat_history": "AI: Your age?",
+    }
+    assert async_route.next_inputs == {"input": "HI"}
+    assert llm_router.calls == 2
+    assert stats.stats()["fallbacks"] == 2
+    assert stats.stats()["fallback_agreement"] == 0.5
+
+
+def test_threshold_above_one_always_asks_llm_router():
+    llm_router = FakeLLMRouter(destination="off_topic")
+    router = LocalRouterChain(llm_router=llm_router, threshold=1.1)
+
+    route = router.route({"input": "How many calories should I eat?"})
+
+    assert route.destination == "off_topic"
+    assert llm_router.calls == 1
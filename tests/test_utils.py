@@ -62,11 +62,70 @@ def test_nutrition_and_targets_inputs_invalid(
     assert expected_output_substr in func(*args)
 
 
+"""
+Tests for batch entry validation, `error_for_nutrition_row` and
+`errors_for_nutrition_rows`:
+1. Valid rows: integer or digit-string values, with or without a meal
+2. Invalid rows: not an object, missing fields, wrong types, and values
+   rejected by the form validators
+3. Errors are numbered by their position in the batch
+"""
+
+VALID_ROW = {
+    "date": "2025-06-24",
+    "calories": 500,
+    "protein": "50",
+    "fat": 20,
+    "carbs": 25,
+    "meal": "chicken bowl",
+}
+
+
+@pytest.mark.parametrize(
+    "row",
+    [
+        VALID_ROW,
+        {key: value for key, value in VALID_ROW.items() if key != "meal"},
+        {**VALID_ROW, "meal": None},
+    ],
+    ids=["with_meal", "without_meal", "null_meal"],
+)
+def test_error_for_nutrition_row_ok(row):
+    assert utils.error_for_nutrition_row(row) is None
+
+
+@pytest.mark.parametrize(
+    "row, expected_output_substr",
+    [
+        ([500, 50, 20, 25], "must be an object"),
+        ({"date": "2025-06-24", "calories": 500}, "missing protein, fat"),
+        ({**VALID_ROW, "fat": 20.5}, "must be integers"),
+        ({**VALID_ROW, "fat": True}, "must be integers"),
+        ({**VALID_ROW, "date": 20250624}, "must be strings"),
+        ({**VALID_ROW, "date": "06/24/2025"}, "'MM/DD/YYYY' format"),
+        ({**VALID_ROW, "calories": 10001}, "between 0 and 10,000"),
+        ({**VALID_ROW, "meal": "a" * 101}, "less than 100 characters"),
+        ({**VALID_ROW, "meal": "app\x00le"}, "NUL characters"),
+    ],
+)
+def test_error_for_nutrition_row_invalid(row, expected_output_substr):
+    error = utils.error_for_nutrition_row(row)
+    assert expected_output_substr in error
+    assert "\n" not in error
+
+
+def test_errors_for_nutrition_rows_numbered():
+    rows = [VALID_ROW, {**VALID_ROW, "carbs": -1}, VALID_ROW, "entry"]
+    errors = utils.errors_for_nutrition_rows(rows)
+    assert [error.split(":")[0] for error in errors] == ["Entry 2", "Entry 4"]
+
+
 """
 Tests for `error_for_meal_len` function:
 1. Test that the function returns `None` when input is under 100 characters
 2. Test that the function returns error when input is greater that 100
    characters 
+3. Test that the function returns error when input contains a NUL character
 """
 
 
@@ -84,6 +143,10 @@ def test_error_for_meal_len_too_long():
     assert "must be less than 100 characters" in meal_len_error_message
 
 
+def test_error_for_meal_len_nul():
+    assert "NUL characters" in utils.error_for_meal_len("app\x00le")
+
+
 """
 Tests for `is_date_in_url_valid` function:
 1. Test that the function returns `True` when input string that represents date
@@ -108,6 +171,21 @@ def test_is_date_in_url_valid_invalid_delimiter():
     assert utils.is_date_in_url_valid(date_url) == False
 
 
+"""
+Test that `is_entry_id_in_url_valid` only accepts ids that fit in a
+PostgreSQL `integer`
+"""
+
+
+@pytest.mark.parametrize(
+    "entry_id, expected",
+    [(1, True), (2**31 - 1, True), (0, False), (2**31, False)],
+    ids=["smallest", "largest", "zero", "too_large"],
+)
+def test_is_entry_id_in_url_valid(entry_id, expected):
+    assert utils.is_entry_id_in_url_valid(entry_id) is expected
+
+
 """
 Tests for `error_for_date_format` function:
 1. Test that the function returns `None` when user date input can be converted 
@@ -128,30 +206,6 @@ def test_error_for_date_format_invalid():
     assert error_message in utils.error_for_date_format(date_input)
 
 
-"""
-Tests for `is_nutrition_id_valid` function:
-1. Test that the function returns `True` if nutrition id can be found in 
-   available_nutrition_id
-2. Test that the function returns `False` if nutrition id cannot be found in 
-   available_nutrition_id
-"""
-
-
-def test_is_nutrition_id_valid_ok():
-    available_nutrition_id = [1, 2, 4, 7]
-    assert utils.is_nutrition_id_valid(1, available_nutrition_id) is True
-
-
-def test_is_nutrition_id_valid_invalid_avail_id_empty():
-    available_nutrition_id = []
-    assert utils.is_nutrition_id_valid(1, available_nutrition_id) is False
-
-
-def test_is_nutrition_id_valid_invalid_not_in_avail_id():
-    available_nutrition_id = [1, 2, 3, 7, 90]
-    assert utils.is_nutrition_id_valid(8, available_nutrition_id) is False
-
-
 """
 Tests for `get_todays_date` function:
 1. Test that the function returns instance of class `datetime.date`
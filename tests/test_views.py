@@ -0,0 +1,213 @@
+from macro_mojo.views import (
+    Page,
+    batch_request,
+    day_view_cursor,
+    day_view_page,
+    errors_for_nutrition_form,
+    export_request,
+    nutrition_form,
+    secret_key,
+    targets_form,
+)
+import pytest
+
+"""
+Tests for `secret_key`: `SECRET_KEY` is used when set; otherwise development
+and testing get a random key and any other environment is an error
+"""
+
+
+@pytest.mark.parametrize("environment", [None, "production", "development"])
+def test_secret_key_set(environment):
+    assert secret_key({"SECRET_KEY": "shared"}, environment) == "shared"
+
+
+@pytest.mark.parametrize("environment", ["development", "testing"])
+def test_secret_key_development(environment):
+    key = secret_key({"SECRET_KEY": None}, environment)
+
+    assert len(key) == 64
+    assert key != secret_key({"SECRET_KEY": None}, environment)
+
+
+@pytest.mark.parametrize("environment", [None, "production"])
+def test_secret_key_missing(environment):
+    with pytest.raises(RuntimeError, match="SECRET_KEY must be set"):
+        secret_key({"SECRET_KEY": ""}, environment)
+
+
+"""
+Tests for `day_view_cursor`: entry id cursors are turned into integers, and
+anything `page_cursor` rejects, including ids too large for the database, is
+`None`
+"""
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        ({}, (1, None, None)),
+        ({"page": "2", "after": "41"}, (2, None, 41)),
+        ({"page": "2", "before": "40"}, (2, 40, None)),
+        ({"page": "2", "after": "²"}, None),
+        ({"page": "2", "before": "99999999999"}, None),
+        ({"page": "2", "before": "1", "after": "2"}, None),
+    ],
+    ids=[
+        "first_page",
+        "after",
+        "before",
+        "not_ascii",
+        "out_of_range",
+        "both_cursors",
+    ],
+)
+def test_day_view_cursor(args, expected):
+    assert day_view_cursor(args) == expected
+
+
+"""
+Tests for `day_view_page`:
+1. A day without entries renders `empty_day.html`
+2. A page past the last one, or without entries, is a bad URL
+3. Otherwise the day view gets the snapshot's entries and totals
+"""
+
+
+def snapshot(entry_count, entries):
+    return {
+        "entry_count": entry_count,
+        "entries": entries,
+        "daily_total": "total",
+        "nutrition_left": "left",
+    }
+
+
+def test_day_view_page_empty_day():
+    page = day_view_page("cat", "2025-06-24", 1, snapshot(0, []))
+
+    assert page == Page(
+        "empty_day.html", {"date": "2025-06-24", "username": "cat"}
+    )
+
+
+@pytest.mark.parametrize(
+    "page_number, entries",
+    [(3, ["entry"]), (1, [])],
+    ids=["past_last_page", "no_entries"],
+)
+def test_day_view_page_bad_url(page_number, entries):
+    page = day_view_page(
+        "cat", "2025-06-24", page_number, snapshot(5, entries)
+    )
+
+    assert page == Page("bad_url.html", {"username": "cat"})
+
+
+def test_day_view_page():
+    page = day_view_page("cat", "2025-06-24", 2, snapshot(7, ["entry"]))
+
+    assert page.template == "day_view.html"
+    assert page.context["daily_nutrition_entries_on_page"] == ["entry"]
+    assert page.context["total_pages"] == 2
+    assert page.context["daily_total"] == "total"
+    assert page.context["nutrition_left"] == "left"
+
+
+"""
+Tests for the form helpers:
+1. Nutrition fields are read in the order the storage takes them
+2. The entry date is only checked when given
+3. Targets are read under the names the templates use
+"""
+
+FORM = {
+    "entry_date": "2025-06-24",
+    "meal": "Lunch",
+    "carbs": "4",
+    "fat": "3",
+    "protein": "2",
+    "calories": "1",
+}
+
+
+def test_nutrition_form():
+    assert list(nutrition_form(FORM).values()) == ["1", "2", "3", "4", "Lunch"]
+
+
+@pytest.mark.parametrize(
+    "entry_date, expected_errors",
+    [(None, 0), ("2025-06-24", 0), ("24/06/2025", 1)],
+    ids=["no_date", "valid_date", "invalid_date"],
+)
+def test_errors_for_nutrition_form(entry_date, expected_errors):
+    errors = errors_for_nutrition_form(nutrition_form(FORM), entry_date)
+
+    assert len(errors) == expected_errors
+
+
+def test_errors_for_nutrition_form_all_invalid():
+    nutrition = {**nutrition_form(FORM), "calories": "-1", "meal": "x" * 101}
+
+    assert len(errors_for_nutrition_form(nutrition, "not a date")) == 3
+
+
+def test_targets_form():
+    assert targets_form(FORM) == {
+        "calorie_target": "1",
+        "protein_target": "2",
+        "fat_target": "3",
+        "carb_target": "4",
+    }
+
+
+"""
+Tests for `batch_request`: a list or `{"entries": [...]}` of valid entries
+can be added; anything else is rejected with its status
+"""
+
+ENTRY = {
+    "date": "2025-06-24",
+    "calories": 1,
+    "protein": 2,
+    "fat": 3,
+    "carbs": 4,
+}
+
+
+@pytest.mark.parametrize(
+    "body, expected_rows, expected_status",
+    [
+        ([ENTRY], [ENTRY], 201),
+        ({"entries": [ENTRY]}, [ENTRY], 201),
+        ({"entry": ENTRY}, [], 400),
+        ([ENTRY] * 3, [], 413),
+        ([{**ENTRY, "calories": "x"}], [], 400),
+    ],
+    ids=["list", "object", "not_a_list", "too_many", "invalid_entry"],
+)
+def test_batch_request(body, expected_rows, expected_status):
+    batch = batch_request(body, max_entries=2)
+
+    assert batch.rows == expected_rows
+    assert batch.status == expected_status
+    assert bool(batch.errors) is (expected_status != 201)
+
+
+"""
+Tests for `export_request`: defaults to entries as CSV, and unknown data or
+formats are `None`
+"""
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        ({}, ("entries", "csv")),
+        ({"data": "nope"}, None),
+        ({"format": "nope"}, None),
+    ],
+    ids=["defaults", "unknown_data", "unknown_format"],
+)
+def test_export_request(args, expected):
+    assert export_request(args) == expected